@@ -0,0 +1,4 @@
+"""
+    Performance benchmarks of eLibrarian application.
+    Every module is runnable as a script: ``python -m benchmarks.<module>``
+"""
@@ -0,0 +1,199 @@
+"""
+    Seeded synthetic catalogue generator.
+    Produces authors with multilingual details, literary works with
+multilingual details, author-work links, genres, series, users and their
+personal libraries. The same seed and sizes always produce the same
+catalogue, so benchmark results of different revisions are comparable.
+    Rows are inserted in batches with Core statements and explicit primary
+keys, so the target database must not contain catalogue rows yet. Session
+events (changes log, work cards) are not triggered, popularity counters are
+reconciled at the end.
+
+    Usage: python -m benchmarks.generator [--config NAME] [--authors N]
+                                          [--works-per-author N] [--seed N]
+"""
+import argparse
+import random
+from elibrarian_app import create_app, db
+from elibrarian_app.collation import sort_key
+from elibrarian_app.models import AuthRole, AuthUser, \
+    AuthUserPersonalLibrary, Author, AuthorDetail, Authors2LiteraryWorks, \
+    BookGenreSnap, BookSeries, BookSeriesDetail, BookSeriesSnap, Genre, \
+    GenreDetail, LiteraryWork, LiteraryWorkCounters, LiteraryWorkDetail
+
+LANGS = ('en', 'ru', 'uk', 'de')
+SYLLABLES = ('ka', 'lo', 'mi', 'ne', 'ro', 'sa', 'ti', 'vu', 'de', 'an',
+             'bel', 'cor', 'dan', 'el', 'fin', 'gor', 'hal', 'is')
+USERS_PASSWORD = 'bench'
+
+
+def _word(rng, min_syllables=2, max_syllables=4):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(
+        rng.randint(min_syllables, max_syllables))).capitalize()
+
+
+def _title(rng):
+    return ' '.join(_word(rng) for _ in range(rng.randint(1, 4)))
+
+
+def _langs(rng, langs):
+    """Random non-empty subset of languages, english is the most common"""
+    chosen = [lang for lang in langs[1:] if rng.random() < 0.3]
+    if not chosen or rng.random() < 0.8:
+        chosen.insert(0, langs[0])
+    return chosen
+
+
+class BatchInserter:
+    """
+        Collects rows per table and inserts them with executemany. When a
+    batch is full, all collected rows are inserted in tables dependency
+    order, so foreign keys are always satisfied.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.rows = {}
+        self.counts = {}
+
+    def add(self, model, **row):
+        table = model.__table__
+        rows = self.rows.setdefault(table, [])
+        rows.append(row)
+        self.counts[table.name] = self.counts.get(table.name, 0) + 1
+        if len(rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for table in db.metadata.sorted_tables:
+            if self.rows.get(table):
+                db.session.execute(table.insert(), self.rows[table])
+                self.rows[table] = []
+
+
+def generate(authors_count=1000, works_per_author=5, genres_count=50,
+             series_count=None, users_count=10, library_size=100,
+             langs=LANGS, seed=1, batch_size=1000):
+    """
+        Fills current application database with synthetic catalogue. Returns
+    dictionary of inserted rows counts by table name. Users are created with
+    emails user<N>@example.com and password USERS_PASSWORD, the first one is
+    administrator.
+    """
+    rng = random.Random(seed)
+    inserter = BatchInserter(batch_size)
+    if series_count is None:
+        series_count = max(1, authors_count // 5)
+
+    # Genres hierarchy: the first tenth are top level genres
+    top_genres = max(1, genres_count // 10)
+    for genre_id in range(1, genres_count + 1):
+        parent_id = None
+        if genre_id > top_genres:
+            parent_id = rng.randint(1, top_genres)
+        inserter.add(Genre, id=genre_id, code='genre{0}'.format(genre_id),
+                     parent_id=parent_id)
+        # Genre detail primary key is genre id only, one language per genre
+        inserter.add(GenreDetail, id=genre_id, lang=langs[0],
+                     title=_title(rng))
+
+    for series_id in range(1, series_count + 1):
+        lang = rng.choice(langs)
+        inserter.add(BookSeries, id=series_id, original_lang=lang)
+        # Series detail primary key is series id only, as for genres
+        inserter.add(BookSeriesDetail, id=series_id, lang=lang,
+                     title=_title(rng))
+    series_positions = {}
+
+    work_id = 0
+    for author_id in range(1, authors_count + 1):
+        inserter.add(Author, id=author_id, original_lang=rng.choice(langs))
+        last_name = _word(rng)
+        for lang in _langs(rng, langs):
+            first_name = _word(rng, 1, 3)
+            inserter.add(AuthorDetail, id=author_id, lang=lang,
+                         last_name=last_name, first_name=first_name,
+                         middle_name=None, nickname=None,
+                         wikipedia_hyperlink=None,
+                         sort_key=sort_key(lang, last_name, first_name, None))
+        for _ in range(rng.randint(1, 2 * works_per_author - 1)):
+            work_id += 1
+            inserter.add(LiteraryWork, id=work_id,
+                         original_lang=rng.choice(langs),
+                         creation_datestring=str(rng.randint(1600, 2015)))
+            for lang in _langs(rng, langs):
+                title = _title(rng)
+                inserter.add(LiteraryWorkDetail, literary_work_id=work_id,
+                             lang=lang, title=title,
+                             sort_key=sort_key(lang, title),
+                             annotation=' '.join(
+                                 _word(rng) for _ in range(rng.randint(0, 40)))
+                             or None)
+            inserter.add(Authors2LiteraryWorks, author_id=author_id,
+                         literary_work_id=work_id)
+            # Some works have a co-author
+            if author_id > 1 and rng.random() < 0.1:
+                inserter.add(Authors2LiteraryWorks,
+                             author_id=rng.randint(1, author_id - 1),
+                             literary_work_id=work_id)
+            for genre_id in rng.sample(range(1, genres_count + 1),
+                                       min(genres_count, rng.randint(1, 3))):
+                inserter.add(BookGenreSnap, literary_work_id=work_id,
+                             genre_id=genre_id)
+            if rng.random() < 0.2:
+                series_id = rng.randint(1, series_count)
+                position = series_positions.get(series_id, 0) + 1
+                series_positions[series_id] = position
+                inserter.add(BookSeriesSnap, literary_work_id=work_id,
+                             series_id=series_id, position=position)
+    inserter.flush()
+
+    # Users go through ORM to get password hashes and roles
+    admin_role = AuthRole.query.filter_by(name='administrator').first()
+    users = []
+    for idx in range(users_count):
+        user = AuthUser(email='user{0}@example.com'.format(idx),
+                        username='user{0}'.format(idx),
+                        password=USERS_PASSWORD, confirmed=True)
+        if idx == 0:
+            user.role = admin_role
+        db.session.add(user)
+        users.append(user)
+    db.session.flush()
+    for user in users:
+        for library_work_id in rng.sample(range(1, work_id + 1),
+                                          min(work_id, library_size)):
+            read = rng.random() < 0.5
+            inserter.add(AuthUserPersonalLibrary, user_id=user.id,
+                         literary_work_id=library_work_id,
+                         plan_to_read=not read, read_flag=read,
+                         read_progress=100 if read else None,
+                         rating=rng.randint(1, 5) if read else None)
+    inserter.flush()
+    db.session.commit()
+    for _ in LiteraryWorkCounters.reconcile():
+        pass
+    inserter.counts[AuthUser.__tablename__] = users_count
+    return inserter.counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='default')
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--works-per-author', type=int, default=5)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    app = create_app(args.config)
+    with app.app_context():
+        db.create_all()
+        AuthRole.insert_roles()
+        counts = generate(args.authors, args.works_per_author,
+                          users_count=args.users, seed=args.seed)
+    for table in sorted(counts):
+        print('{0:<35} {1:>10}'.format(table, counts[table]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+    Micro-benchmark of API JSON encoders on listing pages of different sizes.
+
+    Usage: python -m benchmarks.json_encoding [--repeat N] [--json]
+"""
+import argparse
+import json
+import timeit
+from elibrarian_app.api_1_0.encoding import ENCODERS
+
+PAGE_SIZES = (15, 100, 1000)
+
+
+def make_page(size):
+    """Builds listing envelope shaped like /api/v1/literary-works response"""
+    base = 'http://localhost/api/v1/'
+    items = [
+        {
+            'id': idx,
+            'url': base + 'literary-works/{0}'.format(idx),
+            'original_lang': 'en',
+            'title': u'Burning Daylight №{0}'.format(idx),
+            'lang': 'en',
+            'creation_datestring': '1910',
+            'authors': [
+                {
+                    'id': idx % 97,
+                    'name': 'Jack London',
+                    'url': base + 'authors/{0}'.format(idx % 97)
+                }
+            ]
+        }
+        for idx in range(size)
+    ]
+    return {
+        '_meta': {'page': 1, 'max_results': size, 'total': size * 10},
+        '_items': items,
+        '_links': {
+            'self': {'href': base + 'literary-works', 'title': 'Works'},
+            'parent': {'href': base, 'title': 'API root'},
+            'next': base + 'literary-works?page=2'
+        }
+    }
+
+
+def run(repeat):
+    """Returns list of results for every encoder and page size"""
+    results = []
+    for size in PAGE_SIZES:
+        page = make_page(size)
+        number = max(1, 10000 // size)
+        for name in sorted(ENCODERS):
+            encoder = ENCODERS[name]
+            for compact in (True, False):
+                timer = timeit.Timer(lambda: encoder(page, compact, None))
+                best = min(timer.repeat(repeat=repeat, number=number))
+                per_call = best / number
+                results.append({
+                    'encoder': name,
+                    'compact': compact,
+                    'items': size,
+                    'seconds_per_page': per_call,
+                    'pages_per_second': 1.0 / per_call if per_call else 0.0,
+                    'bytes': len(encoder(page, compact, None))
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{0:<8} {1:<8} {2:>6} {3:>14} {4:>10}'.format(
+        'encoder', 'compact', 'items', 'pages/s', 'bytes'))
+    for row in results:
+        print('{0:<8} {1:<8} {2:>6} {3:>14.1f} {4:>10}'.format(
+            row['encoder'], str(row['compact']), row['items'],
+            row['pages_per_second'], row['bytes']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+    End-to-end load benchmark of API endpoints on a synthetic catalogue.
+    Catalogue of given size is generated with fixed seed into a temporary
+SQLite database (or the database given with --database, which must be
+empty). Every scenario is driven at fixed concurrency through the Flask
+test client or through a local WSGI server (--server). Reported per
+scenario: p50/p95/p99 latency, requests per second, SQL queries per request
+and errors count.
+
+    Usage: python -m benchmarks.load [--authors N] [--works-per-author N]
+                                     [--concurrency N] [--requests N]
+                                     [--server] [--database URI]
+                                     [--output FILE] [--json]
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from werkzeug.serving import make_server
+from elibrarian_app import create_app, db
+from elibrarian_app.models import AuthRole
+from .generator import USERS_PASSWORD, generate
+
+ADMIN_EMAIL = 'user0@example.com'
+
+
+def basic_header(username, password):
+    credentials = '{0}:{1}'.format(username, password).encode('utf-8')
+    return 'Basic ' + b64encode(credentials).decode('ascii')
+
+
+def make_scenarios(authors_count, works_count, token):
+    """
+        Returns list of (name, request factory) pairs. Factory takes random
+    generator and returns (path, headers) of the next request.
+    """
+    token_auth = {'Authorization': basic_header(token, '')}
+    basic_auth = {'Authorization': basic_header(ADMIN_EMAIL, USERS_PASSWORD)}
+    last_page = max(1, authors_count // 15)
+    return [
+        ('authors_list', lambda rng: (
+            '/api/v1/authors?page={0}'.format(rng.randint(1, last_page)),
+            token_auth)),
+        ('authors_list_sparse', lambda rng: (
+            '/api/v1/authors?fields=id,full_name&page={0}'.format(
+                rng.randint(1, last_page)),
+            token_auth)),
+        ('author_detail', lambda rng: (
+            '/api/v1/authors/{0}'.format(rng.randint(1, authors_count)),
+            token_auth)),
+        ('literary_works_list', lambda rng: (
+            '/api/v1/literary-works?page={0}'.format(
+                rng.randint(1, max(1, works_count // 15))),
+            token_auth)),
+        ('literary_work_detail', lambda rng: (
+            '/api/v1/literary-works/{0}'.format(rng.randint(1, works_count)),
+            token_auth)),
+        ('basic_auth', lambda rng: ('/api/v1/', basic_auth)),
+        ('token_auth', lambda rng: ('/api/v1/', token_auth)),
+    ]
+
+
+class TestClientDriver:
+    """Sends requests through Flask test client, one client per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def get(self, path, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.get(path, headers=headers)
+        response.get_data()
+        return response.status_code, response.headers.get('X-Query-Count')
+
+    def close(self):
+        pass
+
+
+class ServerDriver:
+    """Sends HTTP requests to application served by local WSGI server"""
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base_url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get(self, path, headers):
+        try:
+            response = urlopen(Request(self.base_url + path, headers=headers))
+        except HTTPError as exc:
+            response = exc
+        response.read()
+        return response.getcode(), response.headers.get('X-Query-Count')
+
+    def close(self):
+        self.server.shutdown()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of sorted list"""
+    if not sorted_values:
+        return None
+    rank = int(math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def run_scenario(driver, factory, concurrency, requests, seed):
+    """Drive ``requests`` requests with ``concurrency`` threads"""
+    timings = []
+    queries = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            path, headers = factory(rng)
+            start = time.time()
+            status, query_count = driver.get(path, headers)
+            elapsed = time.time() - start
+            with lock:
+                timings.append(elapsed)
+                if status >= 400:
+                    errors[0] += 1
+                if query_count is not None:
+                    queries.append(int(query_count))
+
+    threads = [threading.Thread(target=worker, args=(number,))
+               for number in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.time() - start
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': errors[0],
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'requests_per_second': len(timings) / wall_time,
+        'queries_per_request':
+            sum(queries) / float(len(queries)) if queries else None
+    }
+
+
+def run(authors_count=1000, works_per_author=5, concurrency=4, requests=200,
+        server=False, database=None, seed=1, scenarios=None):
+    """Returns machine-readable benchmark report"""
+    temp_dir = None
+    if database is None:
+        temp_dir = tempfile.mkdtemp()
+        database = 'sqlite:///' + os.path.join(temp_dir, 'bench.sqlite')
+    app = create_app('testing_virtualenv')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+    report = {
+        'parameters': {
+            'authors': authors_count,
+            'works_per_author': works_per_author,
+            'concurrency': concurrency,
+            'requests': requests,
+            'driver': 'server' if server else 'test_client',
+            'seed': seed,
+            'python': platform.python_version()
+        },
+        'scenarios': {}
+    }
+    try:
+        with app.app_context():
+            db.create_all()
+            AuthRole.insert_roles()
+            counts = generate(authors_count, works_per_author, seed=seed)
+            report['catalogue'] = counts
+            works_count = counts['literary_works']
+            token = json.loads(app.test_client().get(
+                '/api/v1/token',
+                headers={'Authorization': basic_header(ADMIN_EMAIL,
+                                                       USERS_PASSWORD)}
+            ).get_data(as_text=True))['token']
+            db.session.remove()
+
+        driver = ServerDriver(app) if server else TestClientDriver(app)
+        try:
+            for name, factory in make_scenarios(authors_count, works_count,
+                                                token):
+                if scenarios and name not in scenarios:
+                    continue
+                report['scenarios'][name] = run_scenario(
+                    driver, factory, concurrency, requests, seed)
+        finally:
+            driver.close()
+    finally:
+        with app.app_context():
+            db.session.remove()
+            if temp_dir is not None:
+                db.drop_all()
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--authors', type=int, default=1000)
+    parser.add_argument('--works-per-author', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests per scenario')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--server', action='store_true',
+                        help='drive local WSGI server instead of test client')
+    parser.add_argument('--database', default=None,
+                        help='empty database URI, temporary SQLite by default')
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help='run only given scenarios')
+    parser.add_argument('--output', default=None,
+                        help='write JSON report to file')
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+    report = run(args.authors, args.works_per_author, args.concurrency,
+                 args.requests, args.server, args.database, args.seed,
+                 args.scenarios)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.json:
+        print(json.dumps(report, indent=2, sort_keys=True))
+        return
+    print('{0:<24} {1:>9} {2:>9} {3:>9} {4:>9} {5:>8} {6:>7}'.format(
+        'scenario', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries',
+        'errors'))
+    for name, row in sorted(report['scenarios'].items()):
+        print('{0:<24} {1:>9.2f} {2:>9.2f} {3:>9.2f} {4:>9.1f} {5:>8} '
+              '{6:>7}'.format(
+                  name, row['p50_ms'], row['p95_ms'], row['p99_ms'],
+                  row['requests_per_second'],
+                  '-' if row['queries_per_request'] is None else
+                  '{0:.1f}'.format(row['queries_per_request']),
+                  row['errors']))
+
+
+if __name__ == '__main__':
+    main()
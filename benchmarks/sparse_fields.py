@@ -0,0 +1,116 @@
+"""
+    Benchmark of sparse fieldsets and selectable embeddings on the listing
+endpoints: compares full representations with ``?fields=`` / ``?embed=``
+selections by latency and number of SQL queries per request.
+
+    Usage: python -m benchmarks.sparse_fields [--authors N] [--works N]
+                                              [--requests N] [--json]
+"""
+import argparse
+import json
+import time
+from base64 import b64encode
+from elibrarian_app import create_app, db
+from elibrarian_app.models import AuthRole, AuthUser, Author, AuthorDetail, \
+    Authors2LiteraryWorks, LiteraryWork, LiteraryWorkDetail
+
+CASES = (
+    ('/api/v1/authors', ''),
+    ('/api/v1/authors', '?fields=id,full_name'),
+    ('/api/v1/authors', '?embed=literary_works'),
+    ('/api/v1/literary-works', ''),
+    ('/api/v1/literary-works', '?fields=id,title'),
+    ('/api/v1/literary-works', '?fields=id,title&embed='),
+)
+
+
+def seed(authors_count, works_count):
+    """Fill the database with authors having several works each"""
+    admin_role = AuthRole.query.filter_by(name='administrator').first()
+    db.session.add(AuthUser(email='bench@example.com', username='bench',
+                            password='bench', confirmed=True,
+                            role=admin_role))
+    authors = []
+    for idx in range(authors_count):
+        author = Author('en')
+        author.details.append(AuthorDetail('en', 'Author {0}'.format(idx)))
+        db.session.add(author)
+        authors.append(author)
+    works = []
+    for idx in range(works_count):
+        work = LiteraryWork('en')
+        work.details.append(LiteraryWorkDetail('en', 'Work {0}'.format(idx)))
+        db.session.add(work)
+        works.append(work)
+    db.session.commit()
+    for idx, work in enumerate(works):
+        db.session.add(Authors2LiteraryWorks(
+            author_id=authors[idx % authors_count].id,
+            literary_work_id=work.id))
+    db.session.commit()
+
+
+def run(authors_count, works_count, requests):
+    """Returns list of results for every benchmark case"""
+    app = create_app('testing_virtualenv')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+    results = []
+    with app.app_context():
+        db.create_all()
+        AuthRole.insert_roles()
+        seed(authors_count, works_count)
+        client = app.test_client()
+        basic = b64encode(b'bench@example.com:bench').decode('ascii')
+        token = json.loads(client.get(
+            '/api/v1/token',
+            headers={'Authorization': 'Basic ' + basic}
+        ).get_data(as_text=True))['token']
+        headers = {'Authorization': 'Basic ' + b64encode(
+            (token + ':').encode('utf-8')).decode('ascii')}
+
+        for path, query in CASES:
+            timings = []
+            queries = 0
+            size = 0
+            for _ in range(requests):
+                start = time.time()
+                response = client.get(path + query, headers=headers)
+                timings.append(time.time() - start)
+                queries = int(response.headers['X-Query-Count'])
+                size = len(response.data)
+            timings.sort()
+            results.append({
+                'path': path + query,
+                'avg_seconds': sum(timings) / len(timings),
+                'median_seconds': timings[len(timings) // 2],
+                'queries': queries,
+                'bytes': size
+            })
+        db.session.remove()
+        db.drop_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--authors', type=int, default=100)
+    parser.add_argument('--works', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+    results = run(args.authors, args.works, args.requests)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{0:<50} {1:>10} {2:>8} {3:>8}'.format(
+        'request', 'avg ms', 'queries', 'bytes'))
+    for row in results:
+        print('{0:<50} {1:>10.2f} {2:>8} {3:>8}'.format(
+            row['path'], row['avg_seconds'] * 1000, row['queries'],
+            row['bytes']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+    Benchmark of token authentication: tokens carrying only user id (user
+and role are loaded from database on every request) against tokens with
+permission claims (only cached token version is checked). Measures token
+verification with permission check and the whole API request.
+
+    Usage: python -m benchmarks.token_auth [--repeat N] [--json]
+"""
+import argparse
+import json
+import time
+from base64 import b64encode
+from flask import current_app
+from flask.ext.sqlalchemy import get_debug_queries
+from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
+from elibrarian_app import create_app, db
+from elibrarian_app.models import AuthRole, AuthUser, Permission
+
+
+def measure(func, repeat):
+    """Returns (seconds per call, queries per call)"""
+    queries_before = len(get_debug_queries())
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    elapsed = time.time() - start
+    return elapsed / repeat, \
+        (len(get_debug_queries()) - queries_before) / float(repeat)
+
+
+def run(repeat):
+    """Returns list of results for id-only and claims tokens"""
+    app = create_app('testing_virtualenv')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+    results = []
+    with app.app_context():
+        db.create_all()
+        AuthRole.insert_roles()
+        user = AuthUser(email='bench@example.com', username='bench',
+                        password='bench', confirmed=True,
+                        role=AuthRole.query.filter_by(
+                            name='moderator').first())
+        db.session.add(user)
+        db.session.commit()
+        serializer = Serializer(current_app.config['SECRET_KEY'],
+                                expires_in=3600)
+        tokens = (
+            ('id_only', serializer.dumps({'id': user.id}).decode('ascii')),
+            ('claims', user.generate_auth_token(expiration=3600)),
+        )
+        client = app.test_client()
+        for name, token in tokens:
+            def verify():
+                db.session.remove()
+                AuthUser.verify_auth_token(token).can(
+                    Permission.VIEW_LIBRARY_ITEMS)
+
+            headers = {'Authorization': 'Basic ' + b64encode(
+                (token + ':').encode('utf-8')).decode('ascii')}
+            request_queries = []
+
+            def request():
+                response = client.get('/api/v1/', headers=headers)
+                request_queries.append(
+                    int(response.headers['X-Query-Count']))
+
+            verify_seconds, verify_queries = measure(verify, repeat)
+            request_seconds, _ = measure(request, repeat)
+            results.append({
+                'token': name,
+                'verify_us': verify_seconds * 1e6,
+                'verify_queries': verify_queries,
+                'request_us': request_seconds * 1e6,
+                'request_queries':
+                    sum(request_queries) / float(len(request_queries))
+            })
+        db.session.remove()
+        db.drop_all()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--json', action='store_true',
+                        help='print machine-readable results')
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('{0:<10} {1:>12} {2:>10} {3:>12} {4:>10}'.format(
+        'token', 'verify us', 'queries', 'request us', 'queries'))
+    for row in results:
+        print('{0:<10} {1:>12.1f} {2:>10.1f} {3:>12.1f} {4:>10.1f}'.format(
+            row['token'], row['verify_us'], row['verify_queries'],
+            row['request_us'], row['request_queries']))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,7 +12,147 @@ class Config:
 
     ELIBRARIAN_ADMIN = os.environ.get('ELIBRARIAN_ADMIN') or 'root@localhost'
     ELIBRARIAN_ITEMS_PER_PAGE = 15
+    ELIBRARIAN_MAX_BATCH_SIZE = 200
+    ELIBRARIAN_EMBEDDED_WORKS_LIMIT = 10
+    ELIBRARIAN_CHANGES_PAGE_SIZE = 1000
+    # Changes feed pages end before gaps of sequence numbers younger than
+    # this (seconds): changes of transactions committing out of order
+    ELIBRARIAN_CHANGES_GAP_TIMEOUT = 30
+
+    # Materialized literary work cards serving literary works listings.
+    # Run "manage.py rebuild_work_cards" after enabling or changing languages
+    ELIBRARIAN_WORK_CARDS = os.environ.get(
+        'ELIBRARIAN_WORK_CARDS', '').lower() in ('1', 'true', 'yes')
+    ELIBRARIAN_WORK_CARD_LANGS = ('en', 'ru', 'uk')
+    # In-memory catalogue snapshot serving listings and selected fields of
+    # details without database queries, refreshed from the changes log
+    ELIBRARIAN_SNAPSHOT = os.environ.get(
+        'ELIBRARIAN_SNAPSHOT', '').lower() in ('1', 'true', 'yes')
+    ELIBRARIAN_SNAPSHOT_REFRESH_INTERVAL = 5
+    # Background jobs ("manage.py worker"): retry delay doubles with every
+    # attempt, running jobs without heartbeat are considered abandoned
+    ELIBRARIAN_JOBS_RETRY_DELAY = 30
+    ELIBRARIAN_JOBS_STALE_TIMEOUT = 300
+    ELIBRARIAN_JOBS_POLL_INTERVAL = 1
+    # (job name, interval in seconds) of jobs queued periodically by workers
+    ELIBRARIAN_JOBS_PERIODIC = (
+        ('reconcile_work_counters', 6 * 3600),
+        ('rebuild_recommendations', 24 * 3600),
+        ('extract_book_files', 600),
+        ('index_book_contents', 600),
+    )
+    # "Readers also read" neighbours kept per literary work, readers two
+    # works need in common to be neighbours, works per block of similarity
+    # computation and recently read works suggestions are based on
+    ELIBRARIAN_RECOMMENDATIONS_NEIGHBOURS = 20
+    ELIBRARIAN_RECOMMENDATIONS_MIN_COMMON = 2
+    ELIBRARIAN_RECOMMENDATIONS_BLOCK_SIZE = 2048
+    ELIBRARIAN_RECOMMENDATIONS_SEEDS = 50
+    # Personal library bulk operations: entries per request (or CSV rows)
+    # and languages CSV titles are looked up in when a row has no "lang"
+    ELIBRARIAN_LIBRARY_BULK_MAX_ENTRIES = 5000
+    ELIBRARIAN_LIBRARY_IMPORT_LANGS = ('en', 'ru', 'uk')
+    # Covers and metadata extraction of stored books: parsing processes of
+    # "extract_book_files" job and thumbnails sizes (width, height) by name
+    ELIBRARIAN_EXTRACTION_PROCESSES = 2
+    ELIBRARIAN_COVER_SIZES = {
+        'small': (96, 144),
+        'medium': (200, 300),
+        'large': (400, 600)
+    }
+    # Full-text search in book contents: characters of indexed text chunks
+    # (search hits), PostgreSQL text search configurations of details
+    # languages ('simple' for others), marks of matched words in snippets and
+    # hits per page of results
+    ELIBRARIAN_SEARCH_CHUNK_SIZE = 2000
+    ELIBRARIAN_SEARCH_CONFIGS = {
+        'en': 'english',
+        'ru': 'russian'
+    }
+    ELIBRARIAN_SEARCH_HIGHLIGHT = ('<mark>', '</mark>')
+    ELIBRARIAN_SEARCH_PER_PAGE = 10
+    # Batched backfills of large tables in migrations: rows per transaction
+    # and pause in seconds between batches
+    ELIBRARIAN_MIGRATION_BATCH_SIZE = 1000
+    ELIBRARIAN_MIGRATION_BATCH_PAUSE = 0.05
+    # On-demand profiling of API requests: administrators send "X-Profile:
+    # cprofile" or "X-Profile: sample" header
+    ELIBRARIAN_PROFILING = True
+    ELIBRARIAN_PROFILES_DIR = os.path.join(basedir, 'tmp', 'profiles')
+    ELIBRARIAN_PROFILES_KEPT = 100
+    ELIBRARIAN_PROFILE_SAMPLE_INTERVAL = 0.001
+    # Cache of serialized author and literary work representations keyed by
+    # their ETag: 'simple' (process memory), 'filesystem' (shared by
+    # processes of the host) or 'null'. Concurrent misses of one key are
+    # coalesced into a single computation
+    ELIBRARIAN_REPRESENTATION_CACHE = os.environ.get(
+        'ELIBRARIAN_REPRESENTATION_CACHE') or 'simple'
+    ELIBRARIAN_REPRESENTATION_CACHE_DIR = os.path.join(basedir, 'tmp',
+                                                       'representations')
+    ELIBRARIAN_REPRESENTATION_CACHE_TIMEOUT = 300
+    ELIBRARIAN_REPRESENTATION_CACHE_THRESHOLD = 500
+    ELIBRARIAN_COALESCING_LOCK_STRIPES = 64
     ELIBRARIAN_TOKEN_EXPIRATION_TIME = 3600
+    # Seconds revoked tokens may still be accepted by other processes
+    ELIBRARIAN_TOKEN_VERSION_CACHE_TIMEOUT = 30
+    ELIBRARIAN_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+    # Negotiated compression of API responses. Encodings in preference
+    # order, brotli and zstd are used only if installed. Responses out of
+    # size bounds (when size is known) are sent as is
+    ELIBRARIAN_COMPRESSION = True
+    ELIBRARIAN_COMPRESSION_ENCODINGS = ('br', 'zstd', 'gzip')
+    ELIBRARIAN_COMPRESSION_LEVELS = {'gzip': 6, 'br': 4, 'zstd': 3}
+    ELIBRARIAN_COMPRESSION_MIN_SIZE = 1024
+    ELIBRARIAN_COMPRESSION_MAX_SIZE = 8 * 1024 * 1024
+    ELIBRARIAN_COMPRESSION_MIMETYPES = (
+        'application/json', 'application/xml', 'text/xml', 'text/plain',
+        'text/csv', 'text/html', 'application/x-fictionbook+xml')
+    # Levels of precompressed stored files ("manage.py precompress_files")
+    ELIBRARIAN_PRECOMPRESSION_LEVELS = {'gzip': 9, 'br': 11, 'zstd': 19}
+
+    # API rate limiting with token buckets. Limits are (required permissions,
+    # requests per second, burst size): the first one user's role satisfies
+    # applies, anonymous callers get the last one
+    ELIBRARIAN_RATE_LIMIT = os.environ.get(
+        'ELIBRARIAN_RATE_LIMIT', '').lower() in ('1', 'true', 'yes')
+    ELIBRARIAN_RATE_LIMITS = (
+        (0x80, 50.0, 200),  # administrators
+        (0x04, 10.0, 60),  # library users
+        (0x00, 2.0, 20),  # everybody else
+    )
+    # (checks per second, burst size) of basic authentication per client IP
+    ELIBRARIAN_RATE_LIMIT_PASSWORD_CHECKS = (2.0, 20)
+    # 'memory', 'redis', 'memcached' or 'simple' (local stand-in for shared)
+    ELIBRARIAN_RATE_LIMIT_BACKEND = os.environ.get(
+        'ELIBRARIAN_RATE_LIMIT_BACKEND') or 'memory'
+    ELIBRARIAN_RATE_LIMIT_REDIS_HOST = os.environ.get(
+        'ELIBRARIAN_RATE_LIMIT_REDIS_HOST') or 'localhost'
+    ELIBRARIAN_RATE_LIMIT_MEMCACHED_SERVERS = (os.environ.get(
+        'ELIBRARIAN_RATE_LIMIT_MEMCACHED_SERVERS') or '127.0.0.1:11211'
+    ).split(',')
+
+    # Per-request SQL statistics of API endpoints
+    ELIBRARIAN_QUERY_STATS_HEADERS = os.environ.get(
+        'ELIBRARIAN_QUERY_STATS_HEADERS', '').lower() in ('1', 'true', 'yes')
+    ELIBRARIAN_SLOW_QUERY_THRESHOLD = 0.5
+    ELIBRARIAN_QUERY_STATS_WINDOW = 1000
+    ELIBRARIAN_QUERY_STATS_TOP = 3
+    # Index advisor ("manage.py index_advisor"): statements of every
+    # application context are appended to this JSON lines file, full scans
+    # of tables with at least MIN_ROWS rows are reported
+    ELIBRARIAN_QUERY_LOG = os.environ.get('ELIBRARIAN_QUERY_LOG')
+    ELIBRARIAN_INDEX_ADVISOR_MIN_ROWS = 1000
+
+    # Catalogue resources may be stored by shared caches (responses vary by
+    # Authorization), but every reuse is revalidated with ETag
+    ELIBRARIAN_CACHE_CONTROL = 'public, no-cache'
+
+    # API JSON encoder: 'auto' picks the fastest installed one (orjson, ujson),
+    # 'stdlib' forces standard library encoder
+    ELIBRARIAN_JSON_ENCODER = os.environ.get(
+        'ELIBRARIAN_JSON_ENCODER') or 'auto'
+    ELIBRARIAN_JSON_COMPACT = True
 
     @staticmethod
     def init_app(app):
@@ -26,6 +166,7 @@ class ConfigDev(Config):
 
 class ConfigTestingVirtualenv(Config):
     TESTING = True
+    ELIBRARIAN_CHANGES_GAP_TIMEOUT = 0
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         'TEST_DATABASE_URL') or DB_TEST_SQLITE_URL
     WTF_CSRF_ENABLED = False
@@ -16,6 +16,12 @@ def create_app(config_name):
     db.init_app(app)
     login_manager.init_app(app)
 
+    from . import snapshot
+    snapshot.init_app(app)
+
+    from . import index_advisor
+    index_advisor.init_app(app)
+
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
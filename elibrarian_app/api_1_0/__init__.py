@@ -1,15 +1,40 @@
 """
     Root entry for api and helper functions
 """
-from flask import Blueprint, jsonify
+import time
+from flask import Blueprint, g, request
+from flask.ext.sqlalchemy import get_debug_queries
+from .encoding import json_response
+from ..models import keys_after
 
 api = Blueprint('api', __name__)
 
 
+@api.before_request
+def start_request_timer():
+    """
+        Remember when request processing started and how many queries were
+    recorded before it. Registered before any other hook, so the measured
+    time and queries include authentication.
+    """
+    g.request_start_time = time.time()
+    g.request_queries_before = len(get_debug_queries())
+
+
+def request_queries():
+    """
+        Queries recorded during the current request. Recorded queries belong
+    to application context, which may outlive a request (tests, scripts).
+    """
+    return get_debug_queries()[g.get('request_queries_before', 0):]
+
+
 def make_json_response(page, pages, per_page, href, href_parent,
-                       items, next_page, prev):
+                       items, next_page, prev, title="Authors",
+                       parent_title="API root"):
     """
-        Default response skeleton
+        Default response skeleton. Envelope is built in one pass and encoded
+    with configured API JSON encoder.
     :param page:
     :param pages:
     :param per_page:
@@ -18,34 +43,176 @@ def make_json_response(page, pages, per_page, href, href_parent,
     :param items:
     :param next_page:
     :param prev:
+    :param title: title of the listed collection
+    :param parent_title: title of the parent resource
     :return:
     """
     # TODO: Print in response current page and total pages in result set
-    json_response_body = {
+    links = {
+        "self": {
+            "href": href,
+            "title": title
+        },
+        "parent": {
+            "href": href_parent,
+            "title": parent_title
+        }
+    }
+    if prev:
+        links['prev'] = prev
+    if next_page:
+        links['next'] = next_page
+    return json_response({
         "_meta": {
             "page": page,
             "max_results": per_page,
             "total": pages
         },
         "_items": items,
+        "_links": links
+    })
+
+
+def parse_ids_argument(name='ids'):
+    """
+        Parses comma separated list of integer ids given in query argument.
+        Returns list of unique ids in requested order, or None if argument is
+    not given. Raises ValueError if list is malformed.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    ids = []
+    seen = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            obj_id = int(part)
+        except ValueError:
+            raise ValueError("'{0}' should be a comma separated list of "
+                             "integers".format(name))
+        if obj_id not in seen:
+            seen.add(obj_id)
+            ids.append(obj_id)
+    return ids
+
+
+def parse_list_argument(name, allowed):
+    """
+        Parses comma separated list of names (fields, embedded relations)
+    given in query argument. Returns set of names, or None if argument is not
+    given. Raises ValueError naming unknown values.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    names = set(part.strip() for part in value.split(',') if part.strip())
+    unknown = names.difference(allowed)
+    if unknown:
+        raise ValueError("Unknown '{0}' values: {1}. Allowed: {2}".format(
+            name, ', '.join(sorted(unknown)), ', '.join(allowed)))
+    return names
+
+
+def parse_representation_arguments(model):
+    """
+        Parses ``fields`` and ``embed`` query arguments selecting attributes
+    and embedded relations of ``model`` JSON representation. Returns keyword
+    arguments for model's ``to_json_bulk``. Raises ValueError if arguments are
+    malformed.
+    """
+    return {
+        'fields': parse_list_argument('fields', model.JSON_FIELDS),
+        'embed': parse_list_argument('embed', model.JSON_EMBEDS)
+    }
+
+
+def representation_link_arguments():
+    """
+        Query arguments selecting representation, which should be preserved in
+    pagination links.
+    """
+    return {
+        'fields': request.args.get('fields'),
+        'embed': request.args.get('embed')
+    }
+
+
+class KeysetPage:
+    """
+        Page of rows ordered by (sort key, id). The next page continues right
+    after the last row (``next_cursor``), so deep pages cost as much as the
+    first one. Rows are (listed object id, sort key, row id) tuples.
+    """
+
+    def __init__(self, items, total, has_prev, next_cursor):
+        self.items = items
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = next_cursor is not None
+        self.next_cursor = next_cursor
+
+
+def parse_cursor_argument(name='after'):
+    """
+        Parses keyset pagination cursor "<sort key>.<id>" given in query
+    argument. Returns (sort key, id) pair, or None if argument is not given.
+    Raises ValueError if cursor is malformed.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    key, _, row_id = value.rpartition('.')
+    if not row_id.isdigit():
+        raise ValueError("'{0}' is not a valid cursor".format(name))
+    return key, int(row_id)
+
+
+def keyset_paginate(query, key_column, id_column, after, page, per_page):
+    """
+        Returns KeysetPage of ``query`` rows ordered by ``key_column`` and
+    ``id_column``: rows following ``after`` cursor, or the ``page`` of rows
+    if no cursor is given.
+    """
+    total = query.count()
+    query = query.order_by(key_column, id_column)
+    if after is not None:
+        query = query.filter(keys_after([key_column, id_column], after))
+    else:
+        query = query.offset((page - 1) * per_page)
+    rows = query.limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = '{0}.{1}'.format(rows[-1][1], rows[-1][2])
+    return KeysetPage(rows, total, after is None and page > 1, next_cursor)
+
+
+def make_batch_response(href, href_parent, items, missing, title):
+    """
+        Response skeleton for batch lookups by ids list. Items are given in
+    requested order, ids which were not found are listed in "_missing".
+    """
+    return json_response({
+        "_meta": {
+            "requested": len(items) + len(missing),
+            "found": len(items)
+        },
+        "_items": items,
+        "_missing": missing,
         "_links": {
             "self": {
                 "href": href,
-                "title": "Authors"
+                "title": title
             },
             "parent": {
                 "href": href_parent,
                 "title": "API root"
             }
         }
-    }
-    if items:
-        json_response_body['_items'] = items
-    if prev:
-        json_response_body['_links']['prev'] = prev
-    if next_page:
-        json_response_body['_links']['next'] = next_page
-    return jsonify(json_response_body)
+    })
 
 
 @api.route('/', methods=['GET'])
@@ -58,4 +225,9 @@ def index():
     return "REST API is not done yet!"
 
 
-from . import authentication, authors, errors, literary_works
+# Rate limiting goes first: its hook rejects excessive password checks before
+# authentication hook runs
+from . import rate_limit
+from . import authentication, authors, changes, compression, errors, jobs, \
+    library, literary_works, metrics, profiling, query_stats, \
+    recommendations, search
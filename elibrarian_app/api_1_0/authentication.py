@@ -4,11 +4,13 @@
     - generating authorization token
     - checking permissions
 """
-from flask import current_app, g, jsonify
+from flask import current_app, g
 from flask_httpauth import HTTPBasicAuth
 from functools import wraps
 from . import api
+from .encoding import json_response
 from .errors import unauthorized, forbidden
+from .rate_limit import count_failed_password_check, limit_request
 from ..models import AnonymousUser, AuthUser
 
 auth = HTTPBasicAuth()
@@ -19,17 +21,21 @@ def verify_password(email_or_token, password):
     """Verifying password or token in request's authorization field"""
     if email_or_token == "":
         g.current_user = AnonymousUser()
+        g.auth_method = 'anonymous'
         return True
     if password == "":
         g.current_user = AuthUser.verify_auth_token(email_or_token)
         g.token_used = True
+        g.auth_method = 'token'
         return g.current_user is not None
+    g.auth_method = 'basic'
     user = AuthUser.query.filter_by(email=email_or_token).first()
-    if not user:
+    if not user or not user.verify_password(password):
+        count_failed_password_check()
         return False
     g.current_user = user
     g.token_used = False
-    return user.verify_password(password)
+    return True
 
 
 @auth.error_handler
@@ -45,9 +51,11 @@ def before_request():
         We check, that user is confirmed at every request to API endpoint.
         We pass here for anonymous user. It will be checked when checking
     permissions.
+        Then request is counted against rate limit of the user.
     """
     if not g.current_user.is_anonymous() and not g.current_user.confirmed:
         return forbidden('Unconfirmed account')
+    return limit_request()
 
 
 @api.route('/token')
@@ -58,7 +66,7 @@ def get_token():
     """
     if g.current_user.is_anonymous() or g.token_used:
         return unauthorized('Invalid credentials')
-    return jsonify({
+    return json_response({
         'token': g.current_user.generate_auth_token(
             expiration=current_app.config['ELIBRARIAN_TOKEN_EXPIRATION_TIME']),
         'expiration': current_app.config['ELIBRARIAN_TOKEN_EXPIRATION_TIME']
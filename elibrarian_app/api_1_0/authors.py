@@ -1,33 +1,81 @@
-from flask import current_app, g, jsonify, request, url_for
-from . import api, make_json_response
+from flask import abort, current_app, g, request, url_for
+from . import KeysetPage, api, keyset_paginate, make_batch_response, \
+    make_json_response, parse_cursor_argument, parse_ids_argument, \
+    parse_representation_arguments, representation_link_arguments
 from .authentication import permission_required
-from ..models import Author, Permission
+from .coalescing import cached_json_response
+from .conditional import add_cache_headers, make_etag, not_modified
+from .encoding import json_response
+from .errors import bad_request
+from ..models import Author, AuthorDetail, Authors2LiteraryWorks, \
+    LiteraryWork, Permission, load_by_ids
+from ..snapshot import get_snapshot
 
 
 @api.route('/authors', methods=['GET'])
 @permission_required(Permission.VIEW_LIBRARY_ITEMS)
 def get_authors():
-    """List of authors"""
+    """
+        List of authors. Sorted by id, or alphabetically by name in the
+    language (?sort=name, lists authors having a name in the language; next
+    pages are given by ?after cursor).
+    """
     page = request.args.get('page', 1, type=int)
     lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
+    sort = request.args.get('sort')
+    try:
+        ids = parse_ids_argument()
+        representation = parse_representation_arguments(Author)
+        after = parse_cursor_argument()
+    except ValueError as exc:
+        return bad_request(str(exc))
+    if ids is not None:
+        return get_authors_batch(ids, lang, representation)
+    if sort is not None and sort != 'name':
+        return bad_request("Unknown sort '{0}', use: name".format(sort))
     per_page = current_app.config['ELIBRARIAN_ITEMS_PER_PAGE']
-    pagination = Author.query.paginate(page, per_page=per_page, error_out=False)
-    authors_list = pagination.items
+    snapshot = get_snapshot()
+    if sort == 'name':
+        # Range of (lang, sort_key, id) index, then authors by ids
+        pagination = keyset_paginate(
+            AuthorDetail.query.with_entities(
+                AuthorDetail.id.label('author_id'), AuthorDetail.sort_key,
+                AuthorDetail.id
+            ).filter(AuthorDetail.lang == (lang or 'en'),
+                     AuthorDetail.sort_key.isnot(None)),
+            AuthorDetail.sort_key, AuthorDetail.id, after, page, per_page)
+        authors, _ = load_by_ids(Author, [row[0] for row in pagination.items])
+        items = Author.to_json_bulk(authors, lang=lang, **representation)
+    elif snapshot is not None and \
+            snapshot.can_serve('author', **representation):
+        pagination = snapshot.paginate('author', page, per_page)
+        items = snapshot.authors_json(pagination.items, lang=lang,
+                                      **representation)
+    else:
+        pagination = Author.query.paginate(page, per_page=per_page,
+                                           error_out=False)
+        items = Author.to_json_bulk(pagination.items, lang=lang,
+                                    **representation)
+    link_args = representation_link_arguments()
+    link_args['sort'] = sort
     prev_page = None
     if pagination.has_prev:
-        prev_page = url_for('api.get_authors', page=page - 1, _external=True)
+        prev_page = url_for('api.get_authors', page=page - 1, _external=True,
+                            **link_args)
     next_page = None
-    if pagination.has_next:
-        next_page = url_for('api.get_authors', page=page + 1, _external=True)
-    return make_json_response(page=page, pages=pagination.total,
+    if isinstance(pagination, KeysetPage) and pagination.has_next:
+        next_page = url_for('api.get_authors', after=pagination.next_cursor,
+                            _external=True, **link_args)
+    elif pagination.has_next:
+        next_page = url_for('api.get_authors', page=page + 1, _external=True,
+                            **link_args)
+    return make_json_response(page=None if after else page,
+                              pages=pagination.total,
                               per_page=per_page,
                               href=url_for('api.get_authors', _external=True),
+                              title="Authors",
                               href_parent=url_for('api.index', _external=True),
-                              items=[
-                                  author.to_json(lang=lang)
-                                  for author
-                                  in authors_list
-                              ],
+                              items=items,
                               next_page=next_page,
                               prev=prev_page)
 
@@ -37,5 +85,104 @@ def get_authors():
 def get_author(author_id):
     """Author details"""
     lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
-    author = Author.query.get_or_404(author_id)
-    return jsonify(author.to_json(lang=lang, verbose=True))
+    try:
+        representation = parse_representation_arguments(Author)
+    except ValueError as exc:
+        return bad_request(str(exc))
+    snapshot = get_snapshot()
+    if snapshot is not None and \
+            snapshot.can_serve('author', verbose=True, **representation):
+        return get_author_snapshot(snapshot, author_id, lang, representation)
+    version = Author.get_version(author_id)
+    if version is None:
+        abort(404)
+    last_modified, rows_count = version
+    etag = make_etag('author', author_id, last_modified, rows_count, lang,
+                     request.query_string)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return add_cache_headers(
+        cached_json_response(etag, lambda: Author.query.get_or_404(
+            author_id).to_json(lang=lang, verbose=True, **representation)),
+        etag, last_modified)
+
+
+@api.route('/authors/<int:author_id>/literary-works', methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_author_literary_works(author_id):
+    """Paginated list of literary works of the author"""
+    page = request.args.get('page', 1, type=int)
+    lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
+    try:
+        representation = parse_representation_arguments(LiteraryWork)
+    except ValueError as exc:
+        return bad_request(str(exc))
+    per_page = current_app.config['ELIBRARIAN_ITEMS_PER_PAGE']
+    Author.query.get_or_404(author_id)
+    pagination = LiteraryWork.query.join(
+        Authors2LiteraryWorks,
+        Authors2LiteraryWorks.literary_work_id == LiteraryWork.id
+    ).filter(
+        Authors2LiteraryWorks.author_id == author_id
+    ).order_by(LiteraryWork.id).paginate(page, per_page=per_page,
+                                         error_out=False)
+    link_args = representation_link_arguments()
+    prev_page = None
+    if pagination.has_prev:
+        prev_page = url_for('api.get_author_literary_works',
+                            author_id=author_id, page=page - 1,
+                            _external=True, **link_args)
+    next_page = None
+    if pagination.has_next:
+        next_page = url_for('api.get_author_literary_works',
+                            author_id=author_id, page=page + 1,
+                            _external=True, **link_args)
+    return make_json_response(page=page, pages=pagination.total,
+                              per_page=per_page,
+                              href=url_for('api.get_author_literary_works',
+                                           author_id=author_id,
+                                           _external=True),
+                              title="Literary works of the author",
+                              href_parent=url_for('api.get_author',
+                                                  author_id=author_id,
+                                                  _external=True),
+                              parent_title="Author",
+                              items=LiteraryWork.to_json_bulk(
+                                  pagination.items, lang=lang,
+                                  **representation),
+                              next_page=next_page,
+                              prev=prev_page)
+
+
+def get_author_snapshot(snapshot, author_id, lang, representation):
+    """Author representation served from catalogue snapshot"""
+    etag = make_etag('author', author_id, 'snapshot', snapshot.cursor, lang,
+                     request.query_string)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    items = snapshot.authors_json([author_id], lang=lang, verbose=True,
+                                  **representation)
+    if not items:
+        abort(404)
+    return add_cache_headers(json_response(items[0]), etag)
+
+
+def get_authors_batch(ids, lang, representation):
+    """
+        Verbose representations of authors requested by ids list, in
+    requested order. Not found ids are reported in "_missing".
+    """
+    max_size = current_app.config['ELIBRARIAN_MAX_BATCH_SIZE']
+    if len(ids) > max_size:
+        return bad_request(
+            "Too many ids requested, at most {0} allowed".format(max_size))
+    found, missing = load_by_ids(Author, ids)
+    return make_batch_response(
+        href=url_for('api.get_authors', _external=True),
+        href_parent=url_for('api.index', _external=True),
+        items=Author.to_json_bulk(found, lang=lang, verbose=True,
+                                  **representation),
+        missing=missing,
+        title="Authors")
@@ -0,0 +1,62 @@
+"""
+    Incremental catalogue changes feed for synchronization of mirrors and
+clients. Client keeps the cursor (sequence number of the last seen change)
+and fetches only changes made after it. Changed entities themselves can be
+fetched with batch lookups by ids.
+"""
+from flask import current_app, request, url_for
+from . import api
+from .authentication import permission_required
+from .encoding import json_response
+from .errors import bad_request
+from ..models import CatalogueChange, Permission
+
+
+@api.route('/changes', methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_changes():
+    """
+        Catalogue changes made after ``since`` cursor, in sequence order.
+        Repeated changes of the same entity within a page are collapsed into
+    the latest one. A page ends before a recent gap of sequence numbers, so
+    that transactions committed out of sequence order are not skipped by
+    clients (see CatalogueChange.read_since for the limits).
+    """
+    since = request.args.get('since', 0, type=int)
+    max_limit = current_app.config['ELIBRARIAN_CHANGES_PAGE_SIZE']
+    limit = request.args.get('limit', max_limit, type=int)
+    if since < 0 or limit < 1:
+        return bad_request("'since' should be non-negative and 'limit' "
+                           "positive")
+    limit = min(limit, max_limit)
+    changes = CatalogueChange.read_since(since, limit + 1)
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    cursor = changes[-1].seq if changes else since
+
+    latest = {}
+    for change in changes:
+        latest[(change.entity, change.entity_id)] = change
+    items = [change.to_json()
+             for change in sorted(latest.values(), key=lambda c: c.seq)]
+
+    links = {
+        "self": {
+            "href": url_for('api.get_changes', since=since, _external=True),
+            "title": "Catalogue changes"
+        },
+        "parent": {
+            "href": url_for('api.index', _external=True),
+            "title": "API root"
+        },
+        "next": url_for('api.get_changes', since=cursor, _external=True)
+    }
+    return json_response({
+        "_meta": {
+            "since": since,
+            "cursor": cursor,
+            "has_more": has_more
+        },
+        "_items": items,
+        "_links": links
+    })
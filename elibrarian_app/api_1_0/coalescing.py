@@ -0,0 +1,127 @@
+"""
+    Request coalescing ("single flight") for expensive representations.
+    Serialized representations are cached by key (ETag of the resource, so
+entries never go stale). When a key is missing, only one request computes
+it: concurrent requests of the same process wait on a per-key lock and
+requests of other processes wait on a file lock, then all of them read the
+computed value from the cache.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+from threading import Lock
+from flask import current_app, request
+from werkzeug.contrib.cache import FileSystemCache, NullCache, SimpleCache
+from .encoding import dumps
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+EXTENSION_NAME = 'representation_cache'
+
+
+class SingleFlight:
+    """
+        Per-key locks for threads of the process and, if ``lock_dir`` is
+    given, file locks for processes sharing the directory. Keys are mapped to
+    a fixed number of lock files, so unrelated keys may occasionally wait for
+    each other, but lock files don't pile up.
+    """
+
+    def __init__(self, lock_dir=None, stripes=64):
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self._locks = {}
+        self._guard = Lock()
+        if lock_dir is not None and not os.path.isdir(lock_dir):
+            os.makedirs(lock_dir)
+
+    @contextmanager
+    def lock(self, key):
+        """Hold exclusive lock of the key"""
+        with self._guard:
+            entry = self._locks.setdefault(key, [Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                with self._file_lock(key):
+                    yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    @contextmanager
+    def _file_lock(self, key):
+        if self.lock_dir is None or fcntl is None:
+            yield
+            return
+        stripe = int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16) % \
+            self.stripes
+        path = os.path.join(self.lock_dir, '{0}.lock'.format(stripe))
+        with open(path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def do(self, key, cache, build, timeout=None):
+        """
+            Returns cached value of the key. On cache miss the value is
+        computed by ``build`` once for all concurrent callers and cached.
+        """
+        value = cache.get(key)
+        if value is not None:
+            return value
+        with self.lock(key):
+            # Somebody could compute the value while we were waiting
+            value = cache.get(key)
+            if value is None:
+                value = build()
+                cache.set(key, value, timeout=timeout)
+        return value
+
+
+def _make_cache(config):
+    """Returns (cache, single flight) pair for application config"""
+    kind = config['ELIBRARIAN_REPRESENTATION_CACHE']
+    stripes = config['ELIBRARIAN_COALESCING_LOCK_STRIPES']
+    if kind == 'filesystem':
+        cache_dir = config['ELIBRARIAN_REPRESENTATION_CACHE_DIR']
+        cache = FileSystemCache(
+            cache_dir,
+            threshold=config['ELIBRARIAN_REPRESENTATION_CACHE_THRESHOLD'])
+        return cache, SingleFlight(os.path.join(cache_dir, 'locks'), stripes)
+    if kind == 'simple':
+        cache = SimpleCache(
+            threshold=config['ELIBRARIAN_REPRESENTATION_CACHE_THRESHOLD'])
+    else:
+        cache = NullCache()
+    return cache, SingleFlight(stripes=stripes)
+
+
+def get_representation_cache():
+    """Returns (cache, single flight) pair of current application"""
+    extensions = current_app.extensions
+    if EXTENSION_NAME not in extensions:
+        extensions[EXTENSION_NAME] = _make_cache(current_app.config)
+    return extensions[EXTENSION_NAME]
+
+
+def cached_json_response(key, build):
+    """
+        Returns JSON response with cached representation of the key. On
+    cache miss ``build`` returns representation object, it is called once
+    for all concurrent requests of the key.
+    """
+    cache, single_flight = get_representation_cache()
+    # Representations contain external URLs, so they depend on host too
+    key = 'representation:{0}:{1}'.format(request.host_url, key)
+    body = single_flight.do(
+        key, cache, lambda: dumps(build()),
+        timeout=current_app.config['ELIBRARIAN_REPRESENTATION_CACHE_TIMEOUT'])
+    return current_app.response_class(body, mimetype='application/json')
@@ -0,0 +1,136 @@
+"""
+    Negotiated compression of API responses.
+    Encoding is chosen from client's Accept-Encoding among installed ones:
+gzip always, brotli and zstd if their packages are installed. Buffered
+responses are compressed at once when their size is within configured
+bounds, streamed responses are compressed chunk by chunk, every chunk is
+flushed so the client receives data as it is produced. Compression levels
+are configurable to keep CPU cost bounded.
+"""
+import zlib
+from flask import current_app, request
+from . import api
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _gzip_compressor(level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(data, flush=False):
+        result = compressor.compress(data)
+        if flush:
+            result += compressor.flush(zlib.Z_SYNC_FLUSH)
+        return result
+
+    return compress, compressor.flush
+
+
+def _brotli_compressor(level):
+    compressor = brotli.Compressor(quality=level)
+
+    def compress(data, flush=False):
+        result = compressor.process(data)
+        if flush:
+            result += compressor.flush()
+        return result
+
+    return compress, compressor.finish
+
+
+def _zstd_compressor(level):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(data, flush=False):
+        result = compressor.compress(data)
+        if flush:
+            result += compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return result
+
+    return compress, compressor.flush
+
+
+# Compressor factories by content coding name. Factory takes compression
+# level and returns (compress(data, flush=False), finish()) functions pair
+COMPRESSORS = {'gzip': _gzip_compressor}
+if brotli is not None:
+    COMPRESSORS['br'] = _brotli_compressor
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd_compressor
+
+
+def compress(data, encoding, level):
+    """Compress ``data`` bytes at once with given encoding and level"""
+    compress_chunk, finish = COMPRESSORS[encoding](level)
+    return compress_chunk(data) + finish()
+
+
+def compress_stream(chunks, encoding, level):
+    """Generator compressing iterable of chunks, flushing every chunk"""
+    compress_chunk, finish = COMPRESSORS[encoding](level)
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        data = compress_chunk(chunk, flush=True)
+        if data:
+            yield data
+    yield finish()
+
+
+def negotiate_encoding(encodings=None):
+    """
+        Returns the first of preferred installed encodings client accepts,
+    or None. ``encodings`` limits the choice (e.g. to stored variants).
+    """
+    accepted = request.accept_encodings
+    if encodings is None:
+        encodings = COMPRESSORS
+    for encoding in current_app.config['ELIBRARIAN_COMPRESSION_ENCODINGS']:
+        if encoding in encodings and accepted[encoding] > 0:
+            return encoding
+    return None
+
+
+@api.after_request
+def compress_response(response):
+    """Compress response body with negotiated encoding"""
+    config = current_app.config
+    if not config['ELIBRARIAN_COMPRESSION'] or \
+            response.status_code < 200 or \
+            response.status_code in (204, 304) or \
+            'Content-Encoding' in response.headers or \
+            response.mimetype not in config['ELIBRARIAN_COMPRESSION_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    level = config['ELIBRARIAN_COMPRESSION_LEVELS'][encoding]
+    length = response.content_length
+    if length is not None and not \
+            config['ELIBRARIAN_COMPRESSION_MIN_SIZE'] <= length <= \
+            config['ELIBRARIAN_COMPRESSION_MAX_SIZE']:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding,
+                                            level)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['ELIBRARIAN_COMPRESSION_MIN_SIZE']:
+            return response
+        compressed = compress(data, encoding, level)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,54 @@
+"""
+    Helpers for HTTP conditional requests on API resources:
+    - building ETag validators from resources versions;
+    - answering 304 Not Modified before building the representation;
+    - setting validators and caching headers on full responses.
+"""
+import hashlib
+from flask import current_app, request
+
+
+def make_etag(*parts):
+    """
+        Builds ETag value from resource version and anything else the
+    representation depends on (language, query string, etc.)
+    """
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _set_validators(response, etag, last_modified):
+    """Set ETag, Last-Modified, Cache-Control and Vary headers"""
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = \
+        current_app.config['ELIBRARIAN_CACHE_CONTROL']
+    # Representation depends on credentials (permissions, preferred language)
+    response.vary.add('Authorization')
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """
+        Returns "304 Not Modified" response if request validators match given
+    ETag or modification time, otherwise returns None. If-None-Match takes
+    precedence over If-Modified-Since.
+    """
+    if request.if_none_match:
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified is not None:
+        # HTTP dates have one second resolution
+        matched = last_modified.replace(microsecond=0) <= \
+            request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    return _set_validators(current_app.response_class(status=304), etag,
+                           last_modified)
+
+
+def add_cache_headers(response, etag, last_modified=None):
+    """Decorate full response with validators and caching headers"""
+    return _set_validators(response, etag, last_modified)
@@ -0,0 +1,95 @@
+"""
+    Pluggable JSON encoding of API responses.
+    Fast encoders (orjson, ujson) are used when installed, standard library
+encoder is the fallback. Output is compact unless configured otherwise.
+"""
+import json
+from datetime import date, datetime
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _stdlib_dumps(obj, compact, default):
+    if compact:
+        return json.dumps(obj, default=default, ensure_ascii=False,
+                          separators=(',', ':'))
+    return json.dumps(obj, default=default, ensure_ascii=False, indent=2)
+
+
+def _orjson_dumps(obj, compact, default):
+    if not compact:
+        return _stdlib_dumps(obj, compact, default)
+    # orjson writes datetimes as ISO 8601 itself, passing them through keeps
+    # the format of the application JSON encoder used by other encoders
+    return orjson.dumps(obj, default=default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+def _ujson_dumps(obj, compact, default):
+    if not compact:
+        return _stdlib_dumps(obj, compact, default)
+    try:
+        return ujson.dumps(obj, ensure_ascii=False)
+    except (TypeError, OverflowError):
+        # ujson doesn't support custom types, let stdlib handle them
+        return _stdlib_dumps(obj, compact, default)
+
+
+ENCODERS = {'stdlib': _stdlib_dumps}
+if orjson is not None:
+    ENCODERS['orjson'] = _orjson_dumps
+if ujson is not None:
+    ENCODERS['ujson'] = _ujson_dumps
+
+# Preference order for 'auto' encoder choice
+AUTO_ORDER = ('orjson', 'ujson', 'stdlib')
+
+
+def _default(obj):
+    """
+        Application JSON encoder conversion of non-JSON types, which also
+    writes dates as "YYYY-MM-DD", the format they are accepted in
+    """
+    if isinstance(obj, date) and not isinstance(obj, datetime):
+        return obj.isoformat()
+    return current_app.json_encoder().default(obj)
+
+
+def get_encoder(name='auto'):
+    """
+        Returns encoder function by name. For 'auto' returns the fastest
+    installed encoder. Unknown or not installed encoders fall back to stdlib.
+    """
+    if name == 'auto':
+        for candidate in AUTO_ORDER:
+            if candidate in ENCODERS:
+                return ENCODERS[candidate]
+    return ENCODERS.get(name, _stdlib_dumps)
+
+
+def dumps(obj, encoder=None, compact=None):
+    """
+        Serialize ``obj`` to JSON with configured (or given) encoder.
+        Returns str or bytes depending on the encoder.
+    """
+    config = current_app.config
+    if encoder is None:
+        encoder = config['ELIBRARIAN_JSON_ENCODER']
+    if compact is None:
+        compact = config['ELIBRARIAN_JSON_COMPACT']
+    return get_encoder(encoder)(obj, compact, _default)
+
+
+def json_response(obj, status=200):
+    """Drop-in replacement for ``jsonify`` using configured encoder"""
+    return current_app.response_class(dumps(obj), status=status,
+                                      mimetype='application/json')
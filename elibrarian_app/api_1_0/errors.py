@@ -1,16 +1,16 @@
 from collections import defaultdict
-from flask import jsonify
+from .encoding import json_response
 
 error_types = defaultdict(lambda: "unknown error")
 error_types[400] = "bad request"
 error_types[401] = "unauthorized"
 error_types[403] = "forbidden"
+error_types[429] = "too many requests"
 
 
 def error(code, message):
-    response = jsonify({'error': error_types[code], 'message': message})
-    response.status_code = code
-    return response
+    return json_response({'error': error_types[code], 'message': message},
+                         status=code)
 
 
 def bad_request(message):
@@ -23,3 +23,7 @@ def unauthorized(message):
 
 def forbidden(message):
     return error(403, message)
+
+
+def too_many_requests(message):
+    return error(429, message)
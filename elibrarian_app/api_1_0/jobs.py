@@ -0,0 +1,73 @@
+"""
+    Administrative API of background jobs: enqueue and inspect jobs run by
+"manage.py worker".
+"""
+from flask import current_app, request, url_for
+from . import api, make_json_response
+from .authentication import permission_required
+from .encoding import json_response
+from .errors import bad_request
+from .. import jobs
+from ..models import BackgroundJob, Permission
+
+
+@api.route('/jobs', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_jobs():
+    """List of background jobs, the newest first. Filtered by ?status="""
+    page = request.args.get('page', 1, type=int)
+    status = request.args.get('status')
+    per_page = current_app.config['ELIBRARIAN_ITEMS_PER_PAGE']
+    query = BackgroundJob.query
+    if status is not None:
+        query = query.filter_by(status=status)
+    pagination = query.order_by(BackgroundJob.id.desc()).paginate(
+        page, per_page=per_page, error_out=False)
+    prev_page = None
+    if pagination.has_prev:
+        prev_page = url_for('api.get_jobs', page=page - 1, status=status,
+                            _external=True)
+    next_page = None
+    if pagination.has_next:
+        next_page = url_for('api.get_jobs', page=page + 1, status=status,
+                            _external=True)
+    return make_json_response(page=page, pages=pagination.total,
+                              per_page=per_page,
+                              href=url_for('api.get_jobs', _external=True),
+                              title="Background jobs",
+                              href_parent=url_for('api.index', _external=True),
+                              items=[job.to_json() for job in pagination.items],
+                              next_page=next_page,
+                              prev=prev_page)
+
+
+@api.route('/jobs', methods=['POST'])
+@permission_required(Permission.ADMINISTER)
+def create_job():
+    """
+        Enqueue job given as JSON: {"name": ..., "args": {...},
+    "idempotency_key": ...}. Responds with 201 for new job, or 200 with
+    existing job of the same idempotency key.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('name'):
+        return bad_request('Job name is required')
+    args = data.get('args') or {}
+    if not isinstance(args, dict):
+        return bad_request('Job arguments should be an object')
+    try:
+        job, created = jobs.enqueue(data['name'], args,
+                                    data.get('idempotency_key'))
+    except ValueError as exc:
+        return bad_request(str(exc))
+    response = json_response(job.to_json(), status=201 if created else 200)
+    response.headers['Location'] = url_for('api.get_job', job_id=job.id,
+                                           _external=True)
+    return response
+
+
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_job(job_id):
+    """Background job status, progress and result"""
+    return json_response(BackgroundJob.query.get_or_404(job_id).to_json())
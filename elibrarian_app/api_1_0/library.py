@@ -0,0 +1,96 @@
+"""
+    Bulk operations on personal library of the current user: upsert of shelf
+entries and import of reading history from CSV.
+"""
+from flask import current_app, g, request
+from sqlalchemy.exc import IntegrityError
+from . import api
+from .authentication import permission_required
+from .encoding import json_response
+from .errors import bad_request
+from .. import db
+from ..library_import import import_csv
+from ..models import AuthUserPersonalLibrary, Permission
+
+
+def write_in_transaction(write):
+    """
+        Runs ``write()`` and commits. Entries created concurrently by another
+    request of the user fail the insert, then it is run once again and finds
+    them existing.
+    """
+    try:
+        results = write()
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        results = write()
+        db.session.commit()
+    return results
+
+
+def make_report(results, position):
+    """Summary of bulk results and errors with their ``position`` key"""
+    report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    for key, result in results:
+        if result['status'] == 'error':
+            report['failed'] += 1
+            report['errors'].append({
+                position: key,
+                'literary_work_id': result['literary_work_id'],
+                'message': result['message']
+            })
+        else:
+            report[result['status']] += 1
+    return json_response(report)
+
+
+@api.route('/library/entries', methods=['POST'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS_METADATA)
+def upsert_library_entries():
+    """
+        Creates or updates entries of personal library given as JSON:
+    {"entries": [{"literary_work_id": ..., "read_flag": true, ...}, ...]}.
+    Entries are written in a single transaction, invalid ones are reported
+    by their index.
+    """
+    data = request.get_json(silent=True)
+    entries = data.get('entries') if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return bad_request('Entries list is required')
+    max_entries = current_app.config['ELIBRARIAN_LIBRARY_BULK_MAX_ENTRIES']
+    if len(entries) > max_entries:
+        return bad_request('At most {0} entries are allowed'.format(
+            max_entries))
+    results = write_in_transaction(
+        lambda: AuthUserPersonalLibrary.bulk_upsert(
+            db.session, g.current_user.id, entries))
+    return make_report(enumerate(results), 'index')
+
+
+@api.route('/library/import', methods=['POST'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS_METADATA)
+def import_library_csv():
+    """
+        Imports reading history from CSV given as request body or "file"
+    form field (see elibrarian_app.library_import for columns). Rows which
+    do not match a literary work are reported by their line numbers.
+    """
+    upload = request.files.get('file')
+    try:
+        if upload is not None:
+            text = upload.read().decode('utf-8')
+        else:
+            text = request.get_data(as_text=True)
+    except UnicodeDecodeError:
+        return bad_request('CSV should be UTF-8 encoded')
+    config = current_app.config
+    try:
+        results = write_in_transaction(lambda: import_csv(
+            db.session, g.current_user.id, text.lstrip('\ufeff'),
+            config['ELIBRARIAN_LIBRARY_IMPORT_LANGS'],
+            config['ELIBRARIAN_LIBRARY_BULK_MAX_ENTRIES']))
+    except ValueError as exc:
+        db.session.rollback()
+        return bad_request(str(exc))
+    return make_report(results, 'line')
@@ -1,38 +1,108 @@
-from flask import current_app, g, jsonify, request, url_for
-from . import api, make_json_response
+from flask import abort, current_app, g, request, stream_with_context, \
+    url_for
+from . import KeysetPage, api, keyset_paginate, make_batch_response, \
+    make_json_response, parse_cursor_argument, parse_ids_argument, \
+    parse_representation_arguments, representation_link_arguments
 from .authentication import permission_required
-from ..models import LiteraryWork, Permission
+from .coalescing import cached_json_response
+from .compression import negotiate_encoding
+from .conditional import add_cache_headers, make_etag, not_modified
+from .encoding import json_response
+from .errors import bad_request, error
+from ..models import BookCover, BookFileMetadata, LiteraryWork, \
+    LiteraryWorkCard, LiteraryWorkCounters, LiteraryWorkDetail, \
+    LiteraryWorkStorage, Permission, load_by_ids
+from ..snapshot import get_snapshot
+
+SORTS = ('title',) + LiteraryWorkCounters.SORTS
 
 
 @api.route('/literary-works', methods=['GET'])
 @permission_required(Permission.VIEW_LIBRARY_ITEMS)
 def get_literary_works():
-    """List of literary-works"""
+    """
+        List of literary-works. Sorted by id, by readers count
+    (?sort=popular), average rating (?sort=rating) or alphabetically by
+    title in the language (?sort=title, lists works having a title in the
+    language; next pages are given by ?after cursor).
+    """
     # TODO: Check pagination bounds
     page = request.args.get('page', 1, type=int)
     lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
+    sort = request.args.get('sort')
+    try:
+        ids = parse_ids_argument()
+        representation = parse_representation_arguments(LiteraryWork)
+        after = parse_cursor_argument()
+    except ValueError as exc:
+        return bad_request(str(exc))
+    if ids is not None:
+        return get_literary_works_batch(ids, lang, representation)
+    if sort is not None and sort not in SORTS:
+        return bad_request("Unknown sort '{0}', use one of: {1}".format(
+            sort, ', '.join(SORTS)))
     per_page = current_app.config['ELIBRARIAN_ITEMS_PER_PAGE']
-    pagination = LiteraryWork.query.paginate(page, per_page=per_page,
-                                             error_out=False)
-    works_list = pagination.items
+    card_lang = lang or "en"
+    snapshot = get_snapshot()
+    if sort == 'title':
+        # Range of (lang, sort_key, id) index, then works by ids
+        detail = LiteraryWorkDetail
+        pagination = keyset_paginate(
+            detail.query.with_entities(
+                detail.literary_work_id, detail.sort_key, detail.id
+            ).filter(detail.lang == card_lang, detail.sort_key.isnot(None)),
+            detail.sort_key, detail.id, after, page, per_page)
+        works, _ = load_by_ids(LiteraryWork, [
+            row[0] for row in pagination.items])
+        items = LiteraryWork.to_json_bulk(works, lang=lang, **representation)
+    elif sort is not None:
+        # Page of counters index, then works by ids
+        pagination = LiteraryWorkCounters.sorted_query(sort).paginate(
+            page, per_page=per_page, error_out=False)
+        works, _ = load_by_ids(LiteraryWork, [
+            counters.literary_work_id for counters in pagination.items])
+        items = LiteraryWork.to_json_bulk(works, lang=lang, **representation)
+    elif snapshot is not None and \
+            snapshot.can_serve('work', **representation):
+        pagination = snapshot.paginate('work', page, per_page)
+        items = snapshot.works_json(pagination.items, lang=lang,
+                                    **representation)
+    elif current_app.config['ELIBRARIAN_WORK_CARDS'] and \
+            card_lang in current_app.config['ELIBRARIAN_WORK_CARD_LANGS'] and \
+            representation == {'fields': None, 'embed': None}:
+        # Default representation is served from materialized cards
+        pagination = LiteraryWorkCard.query.filter_by(
+            lang=card_lang
+        ).order_by(LiteraryWorkCard.literary_work_id).paginate(
+            page, per_page=per_page, error_out=False)
+        items = [card.to_json() for card in pagination.items]
+    else:
+        pagination = LiteraryWork.query.paginate(page, per_page=per_page,
+                                                 error_out=False)
+        items = LiteraryWork.to_json_bulk(pagination.items, lang=lang,
+                                          **representation)
+    link_args = representation_link_arguments()
+    link_args['sort'] = sort
     prev_page = None
     if pagination.has_prev:
         prev_page = url_for('api.get_literary_works', page=page - 1,
-                            _external=True)
+                            _external=True, **link_args)
     next_page = None
-    if pagination.has_next:
+    if isinstance(pagination, KeysetPage) and pagination.has_next:
+        next_page = url_for('api.get_literary_works',
+                            after=pagination.next_cursor, _external=True,
+                            **link_args)
+    elif pagination.has_next:
         next_page = url_for('api.get_literary_works', page=page + 1,
-                            _external=True)
-    return make_json_response(page=page, pages=pagination.total,
+                            _external=True, **link_args)
+    return make_json_response(page=None if after else page,
+                              pages=pagination.total,
                               per_page=per_page,
                               href=url_for('api.get_literary_works',
                                            _external=True),
+                              title="Literary works",
                               href_parent=url_for('api.index', _external=True),
-                              items=[
-                                  work.to_json(lang=lang)
-                                  for work
-                                  in works_list
-                              ],
+                              items=items,
                               next_page=next_page,
                               prev=prev_page)
 
@@ -42,5 +112,145 @@ def get_literary_works():
 def get_literary_work(work_id):
     """Literary work"""
     lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
-    work = LiteraryWork.query.get_or_404(work_id)
-    return jsonify(work.to_json(lang=lang, verbose=True))
+    try:
+        representation = parse_representation_arguments(LiteraryWork)
+    except ValueError as exc:
+        return bad_request(str(exc))
+    snapshot = get_snapshot()
+    if snapshot is not None and \
+            snapshot.can_serve('work', verbose=True, **representation):
+        return get_literary_work_snapshot(snapshot, work_id, lang,
+                                          representation)
+    version = LiteraryWork.get_version(work_id)
+    if version is None:
+        abort(404)
+    last_modified, rows_count = version
+    etag = make_etag('literary-work', work_id, last_modified, rows_count,
+                     lang, request.query_string)
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
+    return add_cache_headers(
+        cached_json_response(etag, lambda: LiteraryWork.query.get_or_404(
+            work_id).to_json(lang=lang, verbose=True, **representation)),
+        etag, last_modified)
+
+
+@api.route('/literary-works/<int:work_id>/files/<int:file_id>',
+           methods=['GET'])
+@permission_required(Permission.DOWNLOAD_FROM_LIBRARY_STORAGE)
+def download_literary_work_file(work_id, file_id):
+    """
+        Stored file of the literary work. Precompressed variant of the file is
+    served if client accepts its encoding, otherwise the original file is
+    streamed (and compressed on the fly if its type is compressible).
+    """
+    original = LiteraryWorkStorage.get_original(work_id, file_id,
+                                                load_data=False)
+    if original is None:
+        abort(404)
+    variants = original.get_variants_encodings()
+    encoding = negotiate_encoding(variants) if variants else None
+    stored_id = variants[encoding] if encoding is not None else original.id
+    size, chunks = LiteraryWorkStorage.read_data(
+        stored_id, current_app.config['ELIBRARIAN_DOWNLOAD_CHUNK_SIZE'])
+    # Chunks are read from database while the response is sent
+    response = current_app.response_class(stream_with_context(chunks),
+                                          mimetype=original.mime_type)
+    response.headers['Content-Length'] = str(size)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if variants:
+        response.vary.add('Accept-Encoding')
+    if original.original_file_name:
+        response.headers.add('Content-Disposition', 'attachment',
+                             filename=original.original_file_name)
+    return response
+
+
+@api.route('/literary-works/<int:work_id>/files/<int:file_id>/metadata',
+           methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_literary_work_file_metadata(work_id, file_id):
+    """
+        Metadata extracted from stored file of the literary work: embedded
+    title, authors, language, estimated page count and cover sizes.
+    """
+    original = LiteraryWorkStorage.get_original(work_id, file_id,
+                                                load_data=False)
+    if original is None:
+        abort(404)
+    metadata = BookFileMetadata.query.get(original.checksum) \
+        if original.checksum else None
+    if metadata is None:
+        return error(404, 'Metadata is not extracted yet')
+    etag = make_etag('file-metadata', original.checksum, metadata.extracted)
+    response = not_modified(etag, metadata.extracted)
+    if response is not None:
+        return response
+    return add_cache_headers(json_response(metadata.to_json(work_id, file_id)),
+                             etag, metadata.extracted)
+
+
+@api.route('/literary-works/<int:work_id>/files/<int:file_id>/cover',
+           methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_literary_work_file_cover(work_id, file_id):
+    """
+        Cover image of stored file of the literary work in ?size (one of
+    ELIBRARIAN_COVER_SIZES or "original", "medium" by default). The original
+    image is served if thumbnails were not made.
+    """
+    size = request.args.get('size', 'medium')
+    if size != 'original' and \
+            size not in current_app.config['ELIBRARIAN_COVER_SIZES']:
+        return bad_request("Unknown cover size '{0}'".format(size))
+    original = LiteraryWorkStorage.get_original(work_id, file_id,
+                                                load_data=False)
+    if original is None or original.checksum is None:
+        abort(404)
+    cover = BookCover.query.get((original.checksum, size)) or \
+        BookCover.query.get((original.checksum, 'original'))
+    if cover is None:
+        abort(404)
+    # Covers of the same data never change
+    etag = make_etag('cover', cover.checksum, cover.size)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    return add_cache_headers(current_app.response_class(
+        cover.data, mimetype=cover.mime_type or 'application/octet-stream'),
+        etag)
+
+
+def get_literary_work_snapshot(snapshot, work_id, lang, representation):
+    """Literary work representation served from catalogue snapshot"""
+    etag = make_etag('literary-work', work_id, 'snapshot', snapshot.cursor,
+                     lang, request.query_string)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+    items = snapshot.works_json([work_id], lang=lang, verbose=True,
+                                **representation)
+    if not items:
+        abort(404)
+    return add_cache_headers(json_response(items[0]), etag)
+
+
+def get_literary_works_batch(ids, lang, representation):
+    """
+        Verbose representations of literary works requested by ids list, in
+    requested order. Not found ids are reported in "_missing".
+    """
+    max_size = current_app.config['ELIBRARIAN_MAX_BATCH_SIZE']
+    if len(ids) > max_size:
+        return bad_request(
+            "Too many ids requested, at most {0} allowed".format(max_size))
+    found, missing = load_by_ids(LiteraryWork, ids)
+    return make_batch_response(
+        href=url_for('api.get_literary_works', _external=True),
+        href_parent=url_for('api.index', _external=True),
+        items=LiteraryWork.to_json_bulk(found, lang=lang, verbose=True,
+                                        **representation),
+        missing=missing,
+        title="Literary works")
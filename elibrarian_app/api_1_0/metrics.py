@@ -0,0 +1,253 @@
+"""
+    API metrics exposed in Prometheus text format:
+    - per-route latency histograms;
+    - status codes counters;
+    - authentication methods counters (token, basic, anonymous);
+    - database connections pool gauges;
+    - catalogue snapshot memory gauge.
+"""
+import time
+import weakref
+from bisect import bisect_left
+from threading import Lock, local
+from flask import current_app, g, request
+from . import api, request_queries
+from .authentication import permission_required
+from .. import db
+from ..models import Permission
+from ..snapshot import EXTENSION_NAME as SNAPSHOT_EXTENSION
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class _SlotOwner:
+    """Thread local marker, collected when its thread ends"""
+
+
+class Counter:
+    """
+        Monotonic counter which doesn't take locks on increment: every thread
+    writes only its own slot and readers sum all slots. Slot of an ended
+    thread is folded into the common total, so slots don't pile up with
+    thread churn.
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._folded = 0
+        self._local = local()
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        """Increment counter of the calling thread"""
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            owner = self._local.owner = _SlotOwner()
+            slot = self._local.slot = [0]
+            with self._lock:
+                self._slots[id(owner)] = slot
+            weakref.finalize(owner, self._fold, id(owner))
+        slot[0] += amount
+
+    def _fold(self, key):
+        with self._lock:
+            self._folded += self._slots.pop(key)[0]
+
+    @property
+    def value(self):
+        """Current counter value summed over all threads"""
+        with self._lock:
+            return self._folded + sum(slot[0] for slot in
+                                      self._slots.values())
+
+
+class Histogram:
+    """Histogram with fixed buckets built on top of lock-free counters"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._counts = [Counter() for _ in range(len(self.buckets) + 1)]
+        self._sum = Counter()
+
+    def observe(self, value):
+        """Put ``value`` into the first bucket which upper bound fits it"""
+        self._counts[bisect_left(self.buckets, value)].inc()
+        self._sum.inc(value)
+
+    def snapshot(self):
+        """
+            Returns list of (upper bound, cumulative count) pairs, total count
+        and sum of observed values.
+        """
+        cumulative = []
+        total = 0
+        for bound, counter in zip(self.buckets + ('+Inf',), self._counts):
+            total += counter.value
+            cumulative.append((bound, total))
+        return cumulative, total, self._sum.value
+
+
+class MetricsRegistry:
+    """Keeps metrics by name and labels and renders them for Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._help = {}
+        self._gauges = {}
+        self._lock = Lock()
+
+    def _get(self, kind, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = factory()
+                    self._help.setdefault(name, (kind, ''))
+        return metric
+
+    def describe(self, name, kind, description):
+        """Set the metric type and HELP text"""
+        self._help[name] = (kind, description)
+
+    def counter(self, name, **labels):
+        """Returns counter with given name and labels"""
+        return self._get('counter', name, labels, Counter)
+
+    def histogram(self, name, buckets, **labels):
+        """Returns histogram with given name, buckets and labels"""
+        return self._get('histogram', name, labels,
+                         lambda: Histogram(buckets))
+
+    def register_gauge(self, name, description, callback):
+        """
+            Register gauge computed at scrape time. ``callback`` returns list
+        of (labels dictionary, value) pairs.
+        """
+        self._gauges[name] = (description, callback)
+
+    def clear(self):
+        """Forget all collected values (gauges are kept)"""
+        with self._lock:
+            self._metrics.clear()
+
+    def render(self):
+        """Returns all metrics in Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), metric in list(self._metrics.items()):
+            by_name.setdefault(name, []).append((dict(labels), metric))
+
+        lines = []
+        for name in sorted(by_name):
+            kind, description = self._help.get(name, ('untyped', ''))
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for labels, metric in by_name[name]:
+                if isinstance(metric, Histogram):
+                    buckets, count, total = metric.snapshot()
+                    for bound, value in buckets:
+                        bucket_labels = dict(labels, le=str(bound))
+                        lines.append('{0}_bucket{1} {2}'.format(
+                            name, _format_labels(bucket_labels), value))
+                    lines.append('{0}_sum{1} {2}'.format(
+                        name, _format_labels(labels), total))
+                    lines.append('{0}_count{1} {2}'.format(
+                        name, _format_labels(labels), count))
+                else:
+                    lines.append('{0}{1} {2}'.format(
+                        name, _format_labels(labels), metric.value))
+
+        for name in sorted(self._gauges):
+            description, callback = self._gauges[name]
+            lines.append('# HELP {0} {1}'.format(name, description))
+            lines.append('# TYPE {0} gauge'.format(name))
+            for labels, value in callback():
+                lines.append('{0}{1} {2}'.format(
+                    name, _format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    """Format labels dictionary as Prometheus label set"""
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(
+            key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+    ) + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('elibrarian_api_request_duration_seconds', 'histogram',
+                  'API request latency by route')
+registry.describe('elibrarian_api_requests_total', 'counter',
+                  'API responses by route, method and status code')
+registry.describe('elibrarian_api_auth_total', 'counter',
+                  'API requests by authentication method')
+registry.describe('elibrarian_api_db_queries', 'histogram',
+                  'SQL queries issued per API request')
+
+
+def _pool_gauges():
+    """Database connection pool state, if the pool supports it"""
+    pool = db.engine.pool
+    result = []
+    for stat in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, stat, None)
+        if method is not None:
+            try:
+                result.append(({'state': stat}, method()))
+            except (AttributeError, TypeError):
+                pass
+    return result
+
+
+registry.register_gauge('elibrarian_db_pool_connections',
+                        'Database connections pool state', _pool_gauges)
+
+
+def _snapshot_gauges():
+    """Memory used by in-memory catalogue snapshot, if it is loaded"""
+    snapshot = current_app.extensions.get(SNAPSHOT_EXTENSION)
+    if snapshot is None or not snapshot.loaded:
+        return []
+    return [({}, snapshot.memory_footprint())]
+
+
+registry.register_gauge('elibrarian_catalogue_snapshot_bytes',
+                        'Approximate memory used by catalogue snapshot',
+                        _snapshot_gauges)
+
+
+@api.after_request
+def record_request_metrics(response):
+    """Record latency, status code and auth method of finished request"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    start = g.get('request_start_time')
+    if start is not None:
+        registry.histogram('elibrarian_api_request_duration_seconds',
+                           LATENCY_BUCKETS,
+                           route=route).observe(time.time() - start)
+    registry.counter('elibrarian_api_requests_total', route=route,
+                     method=request.method,
+                     status=response.status_code).inc()
+    registry.counter('elibrarian_api_auth_total',
+                     method=g.get('auth_method', 'none')).inc()
+    # Counted here rather than taken from query_stats hook, which would
+    # depend on the order after_request hooks are registered in
+    if current_app.config['SQLALCHEMY_RECORD_QUERIES']:
+        registry.histogram('elibrarian_api_db_queries', QUERY_COUNT_BUCKETS,
+                           route=route).observe(len(request_queries()))
+    return response
+
+
+@api.route('/metrics', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_metrics():
+    """All collected metrics in Prometheus text format"""
+    return current_app.response_class(
+        registry.render(), mimetype='text/plain; version=0.0.4')
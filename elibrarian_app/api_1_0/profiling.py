@@ -0,0 +1,254 @@
+"""
+    On-demand profiling of API requests for administrators.
+    Administrator sends ``X-Profile: cprofile`` (deterministic profiler) or
+``X-Profile: sample`` (sampling profiler) request header and the request is
+processed under the profiler. Profile is stored in profiles directory:
+pstats file for cProfile, collapsed stacks (flamegraph.pl / speedscope
+input) for sampling, and metadata with SQL statements recorded by
+SQLALCHEMY_RECORD_QUERIES. Profiles are available with admin endpoints,
+``X-Profile-Id`` response header names the profile.
+    Requests without the header pay only for a header lookup.
+"""
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from flask import abort, current_app, g, request, send_file, url_for
+from flask.ext.sqlalchemy import get_debug_queries
+from . import api
+from .authentication import permission_required
+from .encoding import json_response
+from ..models import Permission
+
+PROFILE_ID_RE = re.compile(r'^[0-9]{14}-[0-9a-f]{8}$')
+MODES = ('cprofile', 'sample')
+
+
+class StackSampler:
+    """
+        Samples call stack of a thread from a background thread and counts
+    identical stacks.
+    """
+
+    def __init__(self, thread_ident, interval):
+        self.thread_ident = thread_ident
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{0} ({1}:{2})'.format(
+                    code.co_name, os.path.basename(code.co_filename),
+                    code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Stacks in collapsed format: "frame;frame;frame count" lines"""
+        return ''.join('{0} {1}\n'.format(stack, count)
+                       for stack, count in sorted(self.stacks.items()))
+
+
+class ProfileStore:
+    """
+        Profiles kept in a directory, the oldest are removed when there are
+    more than ``keep`` of them. Every profile has metadata JSON file and
+    pstats or collapsed stacks file.
+    """
+    EXTENSIONS = {'pstats': '.pstats', 'collapsed': '.collapsed'}
+
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+
+    def path(self, profile_id, kind):
+        extension = self.EXTENSIONS.get(kind, '.json')
+        return os.path.join(self.directory, profile_id + extension)
+
+    def save(self, profile_id, meta, profiler=None, sampler=None):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if profiler is not None:
+            profiler.dump_stats(self.path(profile_id, 'pstats'))
+        if sampler is not None:
+            with open(self.path(profile_id, 'collapsed'), 'w') as output:
+                output.write(sampler.collapsed())
+        with open(self.path(profile_id, 'meta'), 'w') as output:
+            json.dump(meta, output)
+        self.prune()
+
+    def ids(self):
+        """Ids of stored profiles, the newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name[:-len('.json')]
+                       for name in os.listdir(self.directory)
+                       if name.endswith('.json')), reverse=True)
+
+    def load(self, profile_id):
+        """Profile metadata or None"""
+        if not PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            with open(self.path(profile_id, 'meta')) as meta_file:
+                return json.load(meta_file)
+        except (IOError, OSError):
+            return None
+
+    def prune(self):
+        for profile_id in self.ids()[self.keep:]:
+            for kind in ('meta', 'pstats', 'collapsed'):
+                try:
+                    os.remove(self.path(profile_id, kind))
+                except OSError:
+                    pass
+
+
+def get_store():
+    config = current_app.config
+    return ProfileStore(config['ELIBRARIAN_PROFILES_DIR'],
+                        config['ELIBRARIAN_PROFILES_KEPT'])
+
+
+@api.before_request
+def start_profiling():
+    """
+        Start profiler if administrator asked for it. Registered after
+    authentication hook, so current user is known.
+    """
+    mode = request.headers.get('X-Profile')
+    if mode is None or mode not in MODES or \
+            not current_app.config['ELIBRARIAN_PROFILING'] or \
+            not g.current_user.is_administrator():
+        return
+    g.profile_started = time.time()
+    g.profile_queries_before = len(get_debug_queries())
+    if mode == 'cprofile':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    else:
+        g.profiler = StackSampler(
+            threading.current_thread().ident,
+            current_app.config['ELIBRARIAN_PROFILE_SAMPLE_INTERVAL'])
+        g.profiler.start()
+
+
+def _stop_profiler():
+    profiler = g.get('profiler')
+    if profiler is None:
+        return None
+    g.profiler = None
+    if isinstance(profiler, StackSampler):
+        profiler.stop()
+    else:
+        profiler.disable()
+    return profiler
+
+
+@api.after_request
+def finish_profiling(response):
+    """Stop profiler and store the profile"""
+    profiler = _stop_profiler()
+    if profiler is None:
+        return response
+    profile_id = '{0:%Y%m%d%H%M%S}-{1}'.format(datetime.utcnow(),
+                                               uuid.uuid4().hex[:8])
+    queries = get_debug_queries()[g.profile_queries_before:]
+    meta = {
+        'id': profile_id,
+        'mode': 'sample' if isinstance(profiler, StackSampler) else
+                'cprofile',
+        'method': request.method,
+        'url': request.url,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'user_id': g.current_user.id,
+        'duration': time.time() - g.profile_started,
+        'queries': [{
+            'statement': query.statement,
+            'parameters': repr(query.parameters),
+            'duration': query.duration,
+            'context': query.context
+        } for query in queries]
+    }
+    if isinstance(profiler, StackSampler):
+        get_store().save(profile_id, meta, sampler=profiler)
+    else:
+        get_store().save(profile_id, meta, profiler=profiler)
+    response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@api.teardown_request
+def abandon_profiling(exc):
+    """Stop profiler of request which failed before after_request hooks"""
+    _stop_profiler()
+
+
+@api.route('/profiles', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_profiles():
+    """List of stored profiles, the newest first"""
+    store = get_store()
+    items = []
+    for profile_id in store.ids():
+        meta = store.load(profile_id)
+        if meta is None:
+            continue
+        meta['query_count'] = len(meta.pop('queries'))
+        meta['url_profile'] = url_for('api.get_profile',
+                                      profile_id=profile_id, _external=True)
+        items.append(meta)
+    return json_response({'_items': items})
+
+
+@api.route('/profiles/<profile_id>', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_profile(profile_id):
+    """Profile metadata with recorded SQL statements"""
+    meta = get_store().load(profile_id)
+    if meta is None:
+        abort(404)
+    kind = 'collapsed' if meta['mode'] == 'sample' else 'pstats'
+    meta['url_data'] = url_for('api.get_profile_data', profile_id=profile_id,
+                               _external=True)
+    meta['data_format'] = kind
+    return json_response(meta)
+
+
+@api.route('/profiles/<profile_id>/data', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_profile_data(profile_id):
+    """pstats file or collapsed stacks of the profile"""
+    store = get_store()
+    meta = store.load(profile_id)
+    if meta is None:
+        abort(404)
+    if meta['mode'] == 'sample':
+        return send_file(store.path(profile_id, 'collapsed'),
+                         mimetype='text/plain')
+    return send_file(store.path(profile_id, 'pstats'),
+                     mimetype='application/octet-stream',
+                     as_attachment=True,
+                     attachment_filename=profile_id + '.pstats')
@@ -0,0 +1,163 @@
+"""
+    Per-request SQL statistics for API endpoints:
+    - query count and total database time of every request;
+    - optional ``Server-Timing`` and ``X-Query-Count`` response headers;
+    - logging of slow statements together with the endpoint name;
+    - rolling per-endpoint histogram of query counts and database time.
+"""
+import threading
+from collections import deque
+from operator import attrgetter
+from flask import current_app, g, request
+from . import api, request_queries
+from .authentication import permission_required
+from .encoding import json_response
+from ..models import Permission
+
+# Upper bounds of histogram buckets, the last bucket is "+Inf"
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+
+def _bucketize(values, bounds):
+    """Count values falling into every bucket given by upper ``bounds``"""
+    counts = [0] * (len(bounds) + 1)
+    for value in values:
+        for idx, bound in enumerate(bounds):
+            if value <= bound:
+                counts[idx] += 1
+                break
+        else:
+            counts[-1] += 1
+    labels = [str(bound) for bound in bounds] + ['+Inf']
+    return dict(zip(labels, counts))
+
+
+class EndpointQueryStats:
+    """
+        Rolling window of query statistics collected for a single endpoint.
+        Samples are appended to the bounded deque, so the oldest requests
+    are forgotten automatically.
+    """
+
+    def __init__(self, window, top):
+        self.samples = deque(maxlen=window)
+        self.top = top
+        self.slowest = []
+        self._lock = threading.Lock()
+
+    def add(self, query_count, db_time, slowest):
+        """Record one request and remember the slowest statements seen"""
+        self.samples.append((query_count, db_time))
+        if not slowest:
+            return
+        with self._lock:
+            merged = self.slowest + [(q.duration, q.statement)
+                                     for q in slowest]
+            merged.sort(key=lambda item: item[0], reverse=True)
+            self.slowest = merged[:self.top]
+
+    def histogram(self):
+        """Returns summary of collected samples as a dictionary"""
+        samples = list(self.samples)
+        counts = [sample[0] for sample in samples]
+        times = [sample[1] for sample in samples]
+        requests = len(samples)
+        return {
+            'requests': requests,
+            'query_count': {
+                'avg': float(sum(counts)) / requests if requests else 0.0,
+                'max': max(counts) if counts else 0,
+                'buckets': _bucketize(counts, QUERY_COUNT_BUCKETS)
+            },
+            'db_time': {
+                'avg': sum(times) / requests if requests else 0.0,
+                'max': max(times) if times else 0.0,
+                'buckets': _bucketize(times, DB_TIME_BUCKETS)
+            },
+            'slowest': [
+                {'duration': duration, 'statement': statement}
+                for duration, statement in self.slowest
+            ]
+        }
+
+
+_endpoint_stats = {}
+_endpoint_stats_lock = threading.Lock()
+
+
+def get_endpoint_stats(endpoint):
+    """Returns (creating if needed) the statistics holder for ``endpoint``"""
+    stats = _endpoint_stats.get(endpoint)
+    if stats is None:
+        with _endpoint_stats_lock:
+            stats = _endpoint_stats.get(endpoint)
+            if stats is None:
+                stats = EndpointQueryStats(
+                    current_app.config['ELIBRARIAN_QUERY_STATS_WINDOW'],
+                    current_app.config['ELIBRARIAN_QUERY_STATS_TOP'])
+                _endpoint_stats[endpoint] = stats
+    return stats
+
+
+def query_stats_summary():
+    """Returns histograms for all endpoints seen so far"""
+    return dict((endpoint, stats.histogram())
+                for endpoint, stats in list(_endpoint_stats.items()))
+
+
+def reset_query_stats():
+    """Forget all collected statistics"""
+    with _endpoint_stats_lock:
+        _endpoint_stats.clear()
+
+
+@api.after_request
+def record_query_stats(response):
+    """
+        Collects recorded queries of the finished request, logs slow ones and
+    optionally reports statistics in response headers.
+    """
+    config = current_app.config
+    queries = request_queries()
+    query_count = len(queries)
+    db_time = sum(query.duration for query in queries)
+    endpoint = request.endpoint or 'unknown'
+
+    threshold = config['ELIBRARIAN_SLOW_QUERY_THRESHOLD']
+    for query in queries:
+        if query.duration >= threshold:
+            current_app.logger.warning(
+                "Slow query ({0:.3f}s) at endpoint '{1}': {2}\n"
+                "Parameters: {3}\nContext: {4}".format(
+                    query.duration, endpoint, query.statement,
+                    query.parameters, query.context))
+
+    slowest = sorted(queries, key=attrgetter('duration'),
+                     reverse=True)[:config['ELIBRARIAN_QUERY_STATS_TOP']]
+    get_endpoint_stats(endpoint).add(query_count, db_time, slowest)
+    g.query_count = query_count
+    g.db_time = db_time
+
+    if config['ELIBRARIAN_QUERY_STATS_HEADERS']:
+        response.headers['X-Query-Count'] = str(query_count)
+        response.headers.add(
+            'Server-Timing',
+            'db;dur={0:.3f};desc="{1} queries"'.format(db_time * 1000,
+                                                      query_count))
+    return response
+
+
+@api.route('/query-stats', methods=['GET'])
+@permission_required(Permission.ADMINISTER)
+def get_query_stats():
+    """Query statistics of every endpoint seen by this process"""
+    return json_response(query_stats_summary())
+
+
+@api.route('/query-stats', methods=['DELETE'])
+@permission_required(Permission.ADMINISTER)
+def delete_query_stats():
+    """Start collecting query statistics anew"""
+    reset_query_stats()
+    return '', 204
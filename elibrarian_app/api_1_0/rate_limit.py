@@ -0,0 +1,197 @@
+"""
+    Token bucket rate limiting of API requests.
+    Requests are counted per authenticated user (basic authentication), per
+token (token authentication) or per client IP address (anonymous callers).
+Bucket size and refill rate depend on user's permissions. Failed password
+checks are counted per client IP, because every one of them costs a PBKDF2
+computation; while their bucket is empty, passwords are not checked at all.
+    Buckets are kept in process memory or in a shared werkzeug cache backend
+(Redis, memcached). Shared buckets are updated without atomic operations, so
+concurrent requests may occasionally get a few more tokens than configured.
+"""
+import hashlib
+import math
+import threading
+import time
+from flask import current_app, g, request
+from werkzeug.contrib.cache import MemcachedCache, RedisCache, SimpleCache
+from . import api
+from .errors import too_many_requests
+
+EXTENSION_NAME = 'rate_limit_backend'
+
+
+def take_token(state, rate, burst, now, cost=1):
+    """
+        Token bucket step. ``state`` is (tokens, update time) pair or None for
+    a new (full) bucket. Zero ``cost`` only checks that a token is available.
+    Returns (new state, allowed, tokens left, seconds until the next token is
+    available).
+    """
+    if state is None:
+        tokens = float(burst)
+    else:
+        tokens, updated = state
+        tokens = min(float(burst), tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return (tokens - cost, now), True, tokens - cost, 0.0
+    return (tokens, now), False, tokens, (1 - tokens) / rate
+
+
+class MemoryBackend:
+    """Buckets in process memory"""
+
+    # Buckets idle that long are forgotten (they are full anyway)
+    MAX_IDLE = 3600
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def consume(self, key, rate, burst, now, cost=1):
+        with self._lock:
+            state, allowed, tokens, retry_after = take_token(
+                self._buckets.get(key), rate, burst, now, cost)
+            self._buckets[key] = state
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                self._prune(now)
+        return allowed, tokens, retry_after
+
+    def _prune(self, now):
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if now - updated > self.MAX_IDLE:
+                del self._buckets[key]
+
+
+class CacheBackend:
+    """Buckets in werkzeug cache, shared between processes and hosts"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def consume(self, key, rate, burst, now, cost=1):
+        key = 'rate-limit:' + key
+        state, allowed, tokens, retry_after = take_token(
+            self.cache.get(key), rate, burst, now, cost)
+        # Bucket is full again when the entry expires
+        self.cache.set(key, state,
+                       timeout=int(math.ceil((burst - tokens) / rate)) + 1)
+        return allowed, tokens, retry_after
+
+
+def _make_backend(config):
+    kind = config['ELIBRARIAN_RATE_LIMIT_BACKEND']
+    if kind == 'redis':
+        return CacheBackend(RedisCache(
+            host=config['ELIBRARIAN_RATE_LIMIT_REDIS_HOST']))
+    if kind == 'memcached':
+        return CacheBackend(MemcachedCache(
+            config['ELIBRARIAN_RATE_LIMIT_MEMCACHED_SERVERS']))
+    if kind == 'simple':
+        # Local stand-in for a shared backend
+        return CacheBackend(SimpleCache())
+    return MemoryBackend()
+
+
+def get_backend():
+    """Returns rate limiting backend of current application"""
+    extensions = current_app.extensions
+    if EXTENSION_NAME not in extensions:
+        extensions[EXTENSION_NAME] = _make_backend(current_app.config)
+    return extensions[EXTENSION_NAME]
+
+
+def client_key():
+    """Bucket key of current request's caller"""
+    user = g.get('current_user')
+    if user is None or user.is_anonymous():
+        return 'ip:{0}'.format(request.remote_addr)
+    if g.get('token_used'):
+        token = request.authorization.username.encode('utf-8')
+        return 'token:{0}'.format(hashlib.sha1(token).hexdigest())
+    return 'user:{0}'.format(user.id)
+
+
+def user_limit():
+    """
+        (rate, burst) of current user: the first configured limit whose
+    permissions user has, or the last one.
+    """
+    limits = current_app.config['ELIBRARIAN_RATE_LIMITS']
+    user = g.get('current_user')
+    for permissions, rate, burst in limits:
+        if user is not None and user.can(permissions):
+            return rate, burst
+    return limits[-1][1:]
+
+
+def _consume(key, rate, burst, cost=1):
+    """
+        Take a token from the bucket and remember the state for response
+    headers. Returns "429 Too Many Requests" response if bucket is empty.
+    """
+    allowed, tokens, retry_after = get_backend().consume(key, rate, burst,
+                                                         time.time(), cost)
+    g.rate_limit = (burst, int(tokens),
+                    int(math.ceil((burst - tokens) / rate)))
+    if allowed:
+        return None
+    response = too_many_requests('Rate limit exceeded, retry later')
+    response.headers['Retry-After'] = str(int(math.ceil(retry_after)))
+    return response
+
+
+def _password_checks_key():
+    return 'password:{0}'.format(request.remote_addr)
+
+
+@api.before_request
+def limit_password_checks():
+    """
+        Reject requests with passwords before they are verified, while the
+    client IP has no failed checks left. Registered before authentication
+    hook.
+    """
+    if not current_app.config['ELIBRARIAN_RATE_LIMIT']:
+        return None
+    auth = request.authorization
+    if not auth or not auth.username or not auth.password:
+        return None
+    rate, burst = current_app.config['ELIBRARIAN_RATE_LIMIT_PASSWORD_CHECKS']
+    return _consume(_password_checks_key(), rate, burst, cost=0)
+
+
+def count_failed_password_check():
+    """
+        Count failed password check of client IP. Called by authentication
+    hook, successful checks are limited by the user's bucket only.
+    """
+    if not current_app.config['ELIBRARIAN_RATE_LIMIT']:
+        return
+    rate, burst = current_app.config['ELIBRARIAN_RATE_LIMIT_PASSWORD_CHECKS']
+    _consume(_password_checks_key(), rate, burst)
+
+
+def limit_request():
+    """
+        Limit requests of authenticated caller. Called by authentication hook
+    when current user is known.
+    """
+    if not current_app.config['ELIBRARIAN_RATE_LIMIT']:
+        return None
+    rate, burst = user_limit()
+    return _consume(client_key(), rate, burst)
+
+
+@api.after_request
+def add_rate_limit_headers(response):
+    """Report state of the caller's bucket"""
+    state = g.get('rate_limit')
+    if state is not None:
+        limit, remaining, reset = state
+        response.headers['X-RateLimit-Limit'] = str(limit)
+        response.headers['X-RateLimit-Remaining'] = str(remaining)
+        response.headers['X-RateLimit-Reset'] = str(reset)
+    return response
@@ -0,0 +1,86 @@
+"""
+    "Readers also read" recommendations served from precomputed neighbours
+of literary works (see elibrarian_app.recommendations).
+"""
+from flask import current_app, g, request, url_for
+from . import api, parse_representation_arguments
+from .authentication import permission_required
+from .encoding import json_response
+from .errors import bad_request
+from ..models import LiteraryWork, LiteraryWorkNeighbour, Permission, \
+    load_by_ids
+
+
+def recommendations_response(scored, lang, representation, href,
+                             href_parent, title, parent_title):
+    """Literary works of (work id, score) pairs in the same order"""
+    works, _ = load_by_ids(LiteraryWork, [work_id for work_id, _ in scored])
+    scores = dict(scored)
+    items = LiteraryWork.to_json_bulk(works, lang=lang, **representation)
+    for item in items:
+        item['score'] = scores[item['id']]
+    return json_response({
+        "_items": items,
+        "_links": {
+            "self": {
+                "href": href,
+                "title": title
+            },
+            "parent": {
+                "href": href_parent,
+                "title": parent_title
+            }
+        }
+    })
+
+
+def parse_limit_argument():
+    """Number of recommended works, at most kept neighbours count"""
+    maximum = current_app.config['ELIBRARIAN_RECOMMENDATIONS_NEIGHBOURS']
+    limit = request.args.get('limit', maximum, type=int)
+    if not 0 < limit <= maximum:
+        raise ValueError("Limit should be in range 1,...,{0}".format(maximum))
+    return limit
+
+
+@api.route('/literary-works/<int:work_id>/similar', methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_similar_literary_works(work_id):
+    """Literary works read by readers of the work, the most similar first"""
+    lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
+    try:
+        limit = parse_limit_argument()
+        representation = parse_representation_arguments(LiteraryWork)
+    except ValueError as exc:
+        return bad_request(str(exc))
+    LiteraryWork.query.get_or_404(work_id)
+    return recommendations_response(
+        LiteraryWorkNeighbour.similar(work_id, limit), lang, representation,
+        href=url_for('api.get_similar_literary_works', work_id=work_id,
+                     _external=True),
+        href_parent=url_for('api.get_literary_work', work_id=work_id,
+                            _external=True),
+        title="Similar literary works", parent_title="Literary work")
+
+
+@api.route('/suggestions', methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def get_suggestions():
+    """
+        Literary works suggested to current user by recently read works of
+    the personal library
+    """
+    lang = request.args.get('lang', g.current_user.preferred_lang, type=str)
+    try:
+        limit = parse_limit_argument()
+        representation = parse_representation_arguments(LiteraryWork)
+    except ValueError as exc:
+        return bad_request(str(exc))
+    scored = LiteraryWorkNeighbour.suggestions(
+        g.current_user.id, limit,
+        current_app.config['ELIBRARIAN_RECOMMENDATIONS_SEEDS'])
+    return recommendations_response(
+        scored, lang, representation,
+        href=url_for('api.get_suggestions', _external=True),
+        href_parent=url_for('api.index', _external=True),
+        title="Suggested literary works", parent_title="API root")
@@ -0,0 +1,71 @@
+"""
+    Full-text search inside contents of stored books (see
+elibrarian_app.content_index).
+"""
+from flask import current_app, g, request, url_for
+from . import api, make_json_response
+from .authentication import permission_required
+from .errors import bad_request
+from .. import content_index
+from ..models import Permission
+
+
+@api.route('/search', methods=['GET'])
+@permission_required(Permission.VIEW_LIBRARY_ITEMS)
+def search_book_contents():
+    """
+        Passages of stored books containing words of ?q in the language
+    (?lang), the most relevant first. Snippets of passages have matched
+    words enclosed in ELIBRARIAN_SEARCH_HIGHLIGHT marks.
+    """
+    query = request.args.get('q', '', type=str).strip()
+    lang = request.args.get('lang', g.current_user.preferred_lang,
+                            type=str) or "en"
+    page = request.args.get('page', 1, type=int)
+    if not query:
+        return bad_request("Search query 'q' is required")
+    if len(query) > content_index.MAX_QUERY_LENGTH:
+        return bad_request("Search query should be at most {0} "
+                           "characters".format(content_index.MAX_QUERY_LENGTH))
+    if page < 1:
+        return bad_request("Page should be a positive number")
+    per_page = current_app.config['ELIBRARIAN_SEARCH_PER_PAGE']
+    total, hits = content_index.search(query, lang, page, per_page)
+    located = content_index.locate([hit['checksum'] for hit in hits], lang)
+    items = []
+    for hit in hits:
+        # Files removed since the last indexing are skipped
+        if hit['checksum'] not in located:
+            continue
+        work_id, file_id = located[hit['checksum']]
+        items.append({
+            'literary_work_id': work_id,
+            'file_id': file_id,
+            'chunk_no': hit['chunk_no'],
+            'score': hit['score'],
+            'snippet': hit['snippet'],
+            'url': url_for('api.get_literary_work', work_id=work_id,
+                           _external=True),
+            'file_url': url_for('api.download_literary_work_file',
+                                work_id=work_id, file_id=file_id,
+                                _external=True)
+        })
+    prev_page = None
+    if page > 1:
+        prev_page = url_for('api.search_book_contents', q=query, lang=lang,
+                            page=page - 1, _external=True)
+    next_page = None
+    if page * per_page < total:
+        next_page = url_for('api.search_book_contents', q=query, lang=lang,
+                            page=page + 1, _external=True)
+    return make_json_response(page=page,
+                              pages=total,
+                              per_page=per_page,
+                              href=url_for('api.search_book_contents',
+                                           q=query, lang=lang,
+                                           _external=True),
+                              title="Search in book contents",
+                              href_parent=url_for('api.index', _external=True),
+                              items=items,
+                              next_page=next_page,
+                              prev=prev_page)
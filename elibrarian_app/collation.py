@@ -0,0 +1,51 @@
+"""
+    Language aware collation keys of titles and names.
+    Keys are computed once on write and stored as hex strings, so the
+database orders them with plain comparison of ASCII strings and an index on
+(lang, sort_key) serves alphabetical listings. ICU collator of the language
+is used if PyICU is installed, otherwise text is compared case and accent
+insensitively by code points. Run "manage.py rebuild_sort_keys" after
+installing or removing PyICU.
+"""
+import binascii
+import unicodedata
+
+try:
+    import icu
+except ImportError:
+    icu = None
+
+# Longer keys are cut, ties of equal prefixes are ordered by id
+SORT_KEY_BYTES = 127
+SORT_KEY_LENGTH = 2 * SORT_KEY_BYTES
+
+_collators = {}
+
+
+def _collator(lang):
+    collator = _collators.get(lang)
+    if collator is None:
+        collator = _collators[lang] = icu.Collator.createInstance(
+            icu.Locale(lang or 'en'))
+    return collator
+
+
+def _fallback_key(text):
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(char for char in decomposed
+                   if not unicodedata.combining(char)).encode('utf-8')
+
+
+def sort_key(lang, *parts):
+    """
+        Collation key of text parts (e.g. last and first name) in language.
+    Parts are compared one after another, missing parts sort first.
+    """
+    parts = [part or '' for part in parts]
+    if icu is not None:
+        collator = _collator(lang)
+        # ICU keys end with zero byte, so concatenated keys compare by parts
+        key = b''.join(collator.getSortKey(part) for part in parts)
+    else:
+        key = b'\x00'.join(_fallback_key(part) for part in parts)
+    return binascii.hexlify(key[:SORT_KEY_BYTES]).decode('ascii')
@@ -0,0 +1,348 @@
+"""
+    Full-text search inside stored book files.
+    Text of active original files (EPUB, FB2, zipped FB2 and plain text) is
+split at paragraph boundaries into chunks of about
+ELIBRARIAN_SEARCH_CHUNK_SIZE characters, a chunk is a search hit. Files are
+indexed by "index_book_contents" job in a process pool, by checksum of the
+file data and language of its literary work details: only new and changed
+file versions are indexed, files of the same content share the index and
+the index of contents no active file has anymore is removed.
+    On PostgreSQL chunks have tsvector column built with text search
+configuration of the language (ELIBRARIAN_SEARCH_CONFIGS) and GIN index,
+hits are ranked by ts_rank and snippets made by ts_headline. Other databases
+(SQLite of tests and development) get an inverted index of casefolded words
+in "book_text_terms" table: hits contain all words of the query and are
+ranked by their occurrences, words are not stemmed.
+"""
+import html
+import re
+from collections import Counter
+from flask import current_app
+from sqlalchemy import and_, exists, func, or_, text
+from . import db
+from .extraction import ProcessPool, iter_paragraphs
+from .models import BookTextChunk, BookTextIndex, BookTextTerm, \
+    LiteraryWorkDetail, LiteraryWorkStorage
+
+WORD_RE = re.compile(r'\w+')
+MAX_TERM_LENGTH = 64
+MAX_QUERY_LENGTH = 500
+MAX_QUERY_TERMS = 16
+# Characters of snippets made without ts_headline
+SNIPPET_CHARS = 240
+
+TSQUERY = 'plainto_tsquery(CAST(:config AS regconfig), :query)'
+INSERT_CHUNKS = text(
+    'INSERT INTO book_text_chunks (checksum, lang, chunk_no, text, '
+    'search_vector) VALUES (:checksum, :lang, :chunk_no, :text, '
+    'to_tsvector(CAST(:config AS regconfig), :text))')
+COUNT_HITS = text(
+    'SELECT count(*) FROM book_text_chunks '
+    'WHERE lang = :lang AND search_vector @@ ' + TSQUERY)
+# Headlines are made for the page of hits only
+SEARCH_HITS = text(
+    'SELECT c.checksum, c.chunk_no, hits.rank, '
+    'ts_headline(CAST(:config AS regconfig), c.text, ' + TSQUERY + ', '
+    ':options) '
+    'FROM (SELECT checksum, chunk_no, '
+    'ts_rank(search_vector, ' + TSQUERY + ') AS rank '
+    'FROM book_text_chunks WHERE lang = :lang AND search_vector @@ ' +
+    TSQUERY + ' ORDER BY rank DESC, checksum, chunk_no '
+    'LIMIT :limit OFFSET :offset) AS hits '
+    'JOIN book_text_chunks AS c ON c.checksum = hits.checksum AND '
+    'c.lang = :lang AND c.chunk_no = hits.chunk_no '
+    'ORDER BY hits.rank DESC, c.checksum, c.chunk_no')
+# ts_headline does not escape text, so matches are enclosed in these
+# characters, replaced with ELIBRARIAN_SEARCH_HIGHLIGHT marks after escaping
+SENTINELS = ('\x02', '\x03')
+HEADLINE_OPTIONS = ('StartSel="{0}", StopSel="{1}", MinWords=15, '
+                    'MaxWords=35, MaxFragments=2, FragmentDelimiter=" ... "')
+
+
+def _is_postgresql():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def search_config(lang):
+    """PostgreSQL text search configuration of the language"""
+    return current_app.config['ELIBRARIAN_SEARCH_CONFIGS'].get(lang, 'simple')
+
+
+def words(value):
+    """Casefolded words of text, terms of the inverted index"""
+    return [word[:MAX_TERM_LENGTH]
+            for word in WORD_RE.findall(value.casefold())]
+
+
+def _pieces(paragraph, size):
+    """Paragraph split at spaces into pieces of at most ``size``"""
+    while len(paragraph) > size:
+        cut = paragraph.rfind(' ', 0, size + 1)
+        if cut <= 0:
+            cut = size
+        yield paragraph[:cut]
+        paragraph = paragraph[cut:].lstrip()
+    if paragraph:
+        yield paragraph
+
+
+def make_chunks(paragraphs, size):
+    """Joins paragraphs into text chunks of at most ``size`` characters"""
+    chunk = []
+    length = -1
+    for paragraph in paragraphs:
+        for piece in _pieces(paragraph, size):
+            if chunk and length + 1 + len(piece) > size:
+                yield '\n'.join(chunk)
+                chunk = []
+                length = -1
+            chunk.append(piece)
+            length += 1 + len(piece)
+    if chunk:
+        yield '\n'.join(chunk)
+
+
+def index_file(data, mime_type, chunk_size, with_terms):
+    """
+        Text chunks of book file data and, ``with_terms``, {word: count} of
+    every chunk. Runs in pool processes, so errors are returned as "error"
+    message, not raised.
+    """
+    try:
+        chunks = list(make_chunks(iter_paragraphs(data, mime_type),
+                                  chunk_size))
+        terms = [dict(Counter(words(chunk))) for chunk in chunks] \
+            if with_terms else None
+        error = None
+    except Exception as exc:
+        chunks, terms = [], None
+        error = '{0}: {1}'.format(type(exc).__name__, exc)
+    return {'chunks': chunks, 'terms': terms, 'error': error}
+
+
+def _delete_index(session, checksum, lang):
+    for model in (BookTextTerm, BookTextChunk, BookTextIndex):
+        session.execute(model.__table__.delete().where(and_(
+            model.checksum == checksum, model.lang == lang)))
+
+
+def store_index(session, checksum, lang, result, postgresql):
+    """Replaces stored index of the contents in the language"""
+    _delete_index(session, checksum, lang)
+    rows = [{'checksum': checksum, 'lang': lang, 'chunk_no': number,
+             'text': chunk} for number, chunk in enumerate(result['chunks'])]
+    if rows and postgresql:
+        config = search_config(lang)
+        session.execute(INSERT_CHUNKS, [dict(row, config=config)
+                                        for row in rows])
+    elif rows:
+        session.execute(BookTextChunk.__table__.insert(), rows)
+        terms = [{'term': term, 'lang': lang, 'checksum': checksum,
+                  'chunk_no': number, 'count': count}
+                 for number, counts in enumerate(result['terms'])
+                 for term, count in counts.items()]
+        if terms:
+            session.execute(BookTextTerm.__table__.insert(), terms)
+    session.execute(BookTextIndex.__table__.insert(), [{
+        'checksum': checksum, 'lang': lang, 'chunks': len(rows),
+        'error': result['error']}])
+
+
+def _active_originals(query):
+    storage = LiteraryWorkStorage
+    return query.join(
+        LiteraryWorkDetail,
+        LiteraryWorkDetail.id == storage.literary_work_details_id
+    ).filter(storage.is_active.is_(True),
+             storage.content_encoding.is_(None))
+
+
+def remove_stale(session):
+    """
+        Removes index of contents which no active original file of the
+    language has anymore. Returns number of removed contents.
+    """
+    storage = LiteraryWorkStorage
+    detail = LiteraryWorkDetail
+    index = BookTextIndex
+    used = exists().where(and_(
+        storage.checksum == index.checksum,
+        storage.is_active.is_(True),
+        storage.content_encoding.is_(None),
+        detail.id == storage.literary_work_details_id,
+        detail.lang == index.lang))
+    stale = session.query(index.checksum, index.lang).filter(~used).all()
+    for checksum, lang in stale:
+        _delete_index(session, checksum, lang)
+    return len(stale)
+
+
+def pending_files():
+    """
+        (checksum, lang, file id) of contents not indexed in the language of
+    their details yet, a file per checksum and language
+    """
+    storage = LiteraryWorkStorage
+    index = BookTextIndex
+    first_id = func.min(storage.id)
+    return _active_originals(db.session.query(
+        storage.checksum, LiteraryWorkDetail.lang, first_id
+    )).outerjoin(index, and_(
+        index.checksum == storage.checksum,
+        index.lang == LiteraryWorkDetail.lang
+    )).filter(
+        storage.checksum.isnot(None),
+        index.checksum.is_(None)
+    ).group_by(storage.checksum, LiteraryWorkDetail.lang).order_by(
+        first_id).all()
+
+
+def index_pending(processes=None):
+    """
+        Removes stale index and indexes pending contents in a pool of
+    ``processes`` (ELIBRARIAN_EXTRACTION_PROCESSES). Files data is loaded a
+    pool-full at a time and indexes are committed after every batch. Yields
+    (processed, total) contents after every batch.
+    """
+    config = current_app.config
+    if processes is None:
+        processes = config['ELIBRARIAN_EXTRACTION_PROCESSES']
+    chunk_size = config['ELIBRARIAN_SEARCH_CHUNK_SIZE']
+    postgresql = _is_postgresql()
+    remove_stale(db.session)
+    pending = pending_files()
+    db.session.commit()
+    storage = LiteraryWorkStorage
+    processed = 0
+    pool = ProcessPool(processes)
+    try:
+        for start in range(0, len(pending), processes):
+            batch = pending[start:start + processes]
+            files = dict((file_id, (mime_type, data))
+                         for file_id, mime_type, data in db.session.query(
+                storage.id, storage.mime_type, storage.binary_data
+            ).filter(storage.id.in_([row[2] for row in batch])))
+            # Drivers may return buffers, which are not picklable
+            results = pool.run(index_file, [
+                (bytes(files[file_id][1]), files[file_id][0], chunk_size,
+                 not postgresql) for _, _, file_id in batch],
+                lambda exc: {'chunks': [], 'terms': [], 'error': '{0}: {1}'
+                             .format(type(exc).__name__, exc)})
+            for (checksum, lang, _), result in zip(batch, results):
+                store_index(db.session, checksum, lang, result, postgresql)
+            db.session.commit()
+            processed += len(batch)
+            yield processed, len(pending)
+    finally:
+        pool.shutdown()
+
+
+def make_snippet(chunk_text, terms, marks, width=SNIPPET_CHARS):
+    """
+        HTML escaped fragment of chunk text around the first occurrence of
+    ``terms``, their occurrences are enclosed in (start, stop) ``marks``
+    """
+    pattern = re.compile(r'\b(?:{0})\b'.format('|'.join(
+        re.escape(term) for term in sorted(terms, key=len, reverse=True))),
+        re.IGNORECASE)
+    match = pattern.search(chunk_text)
+    center = match.start() if match else 0
+    start = 0
+    if center > width // 3:
+        start = chunk_text.find(' ', center - width // 3, center) + 1 or \
+            center - width // 3
+    end = start + width
+    if end < len(chunk_text):
+        space = chunk_text.rfind(' ', center, end)
+        if space > center:
+            end = space
+    fragment = ' '.join(chunk_text[start:end].split())
+    # Book text is unescaped on extraction, only the marks are markup
+    parts = []
+    pos = 0
+    for found in pattern.finditer(fragment):
+        parts.extend((html.escape(fragment[pos:found.start()]), marks[0],
+                      html.escape(found.group(0)), marks[1]))
+        pos = found.end()
+    parts.append(html.escape(fragment[pos:]))
+    return ''.join(parts)
+
+
+def _highlight(headline, marks):
+    """ts_headline made with SENTINELS, escaped and with ``marks``"""
+    return html.escape(headline).replace(
+        SENTINELS[0], marks[0]).replace(SENTINELS[1], marks[1])
+
+
+def _search_tsvector(query, lang, offset, limit, marks):
+    params = {'query': query, 'lang': lang, 'config': search_config(lang)}
+    total = db.session.execute(COUNT_HITS, params).scalar()
+    rows = db.session.execute(SEARCH_HITS, dict(
+        params, limit=limit, offset=offset,
+        options=HEADLINE_OPTIONS.format(*SENTINELS)))
+    return total, [{'checksum': checksum, 'chunk_no': chunk_no,
+                    'score': rank, 'snippet': _highlight(headline, marks)}
+                   for checksum, chunk_no, rank, headline in rows]
+
+
+def _search_terms(query, lang, offset, limit, marks):
+    terms = sorted(set(words(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return 0, []
+    # Chunks containing all words are intersected by the database, postings
+    # are read by (term, lang) prefix of the primary key
+    term = BookTextTerm
+    score = func.sum(term.count).label('score')
+    matched = db.session.query(term.checksum, term.chunk_no, score).filter(
+        term.lang == lang, term.term.in_(terms)
+    ).group_by(term.checksum, term.chunk_no).having(
+        func.count(term.term) == len(terms))
+    total = matched.count()
+    hits = [((checksum, chunk_no), chunk_score)
+            for checksum, chunk_no, chunk_score in matched.order_by(
+                score.desc(), term.checksum, term.chunk_no
+            ).offset(offset).limit(limit)]
+    texts = {}
+    if hits:
+        chunk = BookTextChunk
+        texts = dict(((checksum, chunk_no), chunk_text)
+                     for checksum, chunk_no, chunk_text in db.session.query(
+            chunk.checksum, chunk.chunk_no, chunk.text
+        ).filter(chunk.lang == lang, or_(*[
+            and_(chunk.checksum == checksum, chunk.chunk_no == chunk_no)
+            for (checksum, chunk_no), _ in hits])))
+    return total, [{'checksum': key[0], 'chunk_no': key[1],
+                    'score': chunk_score,
+                    'snippet': make_snippet(texts[key], terms, marks)}
+                   for key, chunk_score in hits]
+
+
+def search(query, lang, page, per_page):
+    """
+        Text chunks of the language containing words of ``query``, the most
+    relevant first. Returns (total hits, hits of the page), hits are
+    dictionaries of checksum, chunk_no, score and HTML escaped snippet with
+    matched words enclosed in ELIBRARIAN_SEARCH_HIGHLIGHT marks.
+    """
+    marks = current_app.config['ELIBRARIAN_SEARCH_HIGHLIGHT']
+    search_hits = _search_tsvector if _is_postgresql() else _search_terms
+    return search_hits(query, lang, (page - 1) * per_page, per_page, marks)
+
+
+def locate(checksums, lang):
+    """
+        {checksum: (literary work id, file id)} of the first active original
+    file of every contents among files of details in the language
+    """
+    located = {}
+    if not checksums:
+        return located
+    storage = LiteraryWorkStorage
+    for checksum, work_id, file_id in _active_originals(db.session.query(
+            storage.checksum, LiteraryWorkDetail.literary_work_id, storage.id
+    )).filter(
+        storage.checksum.in_(sorted(set(checksums))),
+        LiteraryWorkDetail.lang == lang
+    ).order_by(storage.id):
+        located.setdefault(checksum, (work_id, file_id))
+    return located
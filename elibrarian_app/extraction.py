@@ -0,0 +1,504 @@
+"""
+    Covers, metadata and text extraction of stored book files (EPUB, FB2
+and zipped FB2, text also of plain text files).
+    Archives are read member by member and FB2 documents with incremental
+XML parsing, so a book is never unpacked or parsed as a whole. Extracted
+metadata, page count (estimated from text length) and cover downscaled to
+ELIBRARIAN_COVER_SIZES thumbnails are stored by checksum of the file data,
+so files of the same content share them. Thumbnails are made if Pillow is
+installed, the original cover image is stored anyway. XML is parsed with
+defusedxml if installed.
+    Parsing runs in a process pool of "extract_book_files" job, web workers
+only serve the stored results. Text paragraphs (iter_paragraphs) are indexed
+by "index_book_contents" job, see elibrarian_app.content_index.
+"""
+import base64
+import codecs
+import html
+import io
+import math
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json import dumps as json_dumps
+from urllib.parse import unquote
+from flask import current_app
+from sqlalchemy import func
+from . import db
+from .models import BookCover, BookFileMetadata, LiteraryWorkStorage
+
+try:
+    from defusedxml import ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CHUNK_SIZE = 64 * 1024
+# Characters of a printed page, pages are estimated from text length
+CHARS_PER_PAGE = 1800
+MAX_COVER_SIZE = 16 * 1024 * 1024
+# Documents of EPUB are read whole to extract their text
+MAX_DOCUMENT_SIZE = 32 * 1024 * 1024
+WHITESPACE_RE = re.compile(r'\s+')
+ZIP_SIGNATURE = b'PK\x03\x04'
+TAG_RE = re.compile(r'<[^>]*>')
+# Tags ending a paragraph of (X)HTML text and elements without text
+BLOCK_TAG_RE = re.compile(
+    r'<(?:/?(?:p|div|h[1-6]|li|dt|dd|tr|blockquote|pre|section|article|'
+    r'aside|header|footer|table)\b[^>]*|br\b[^>]*)>', re.IGNORECASE)
+SKIPPED_RE = re.compile(r'<(head|script|style)\b.*?</\1\s*>',
+                        re.IGNORECASE | re.DOTALL)
+# Plain text files are UTF-8 or, failing that, Windows Cyrillic
+TEXT_ENCODINGS = ('utf-8-sig', 'cp1251')
+PARAGRAPH_BREAK_RE = re.compile(r'\n\s*\n')
+
+CONTAINER_NS = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+OPF_NS = '{http://www.idpf.org/2007/opf}'
+DC_NS = '{http://purl.org/dc/elements/1.1/}'
+XLINK_HREF = '{http://www.w3.org/1999/xlink}href'
+# FB2 elements holding text of the book body
+FB2_TEXT_ELEMENTS = ('p', 'v', 'subtitle', 'text-author')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _count_text(stream):
+    """Length of text outside of markup tags, whitespace runs count once"""
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    count = 0
+    in_tag = False
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        text = decoder.decode(chunk, final=not chunk)
+        pos = 0
+        while pos < len(text):
+            if in_tag:
+                end = text.find('>', pos)
+                if end < 0:
+                    break
+                in_tag = False
+                pos = end + 1
+            else:
+                start = text.find('<', pos)
+                segment = text[pos:] if start < 0 else text[pos:start]
+                count += len(WHITESPACE_RE.sub(' ', segment))
+                if start < 0:
+                    break
+                in_tag = True
+                pos = start + 1
+        if not chunk:
+            return count
+
+
+def _pages(chars):
+    return int(math.ceil(chars / float(CHARS_PER_PAGE))) if chars else None
+
+
+def _read_member(archive, name, limit):
+    info = archive.getinfo(name)
+    if info.file_size > limit:
+        raise ValueError("{0} is too large".format(name))
+    return archive.read(info)
+
+
+def _epub_package(archive):
+    """Package document and its directory of EPUB zip archive"""
+    container = ElementTree.parse(
+        archive.open('META-INF/container.xml')).getroot()
+    rootfile = container.find('.//{0}rootfile'.format(CONTAINER_NS))
+    if rootfile is None:
+        raise ValueError("EPUB container has no rootfile")
+    opf_path = rootfile.get('full-path')
+    package = ElementTree.parse(archive.open(opf_path)).getroot()
+    return package, posixpath.dirname(opf_path)
+
+
+def _epub_manifest(package):
+    return dict((item.get('id'), item)
+                for item in package.iter(OPF_NS + 'item'))
+
+
+def _epub_path(base, item):
+    return posixpath.normpath(posixpath.join(base, unquote(item.get('href'))))
+
+
+def _epub_spine(package, base, manifest):
+    """Archive paths of EPUB documents in reading order"""
+    for itemref in package.iter(OPF_NS + 'itemref'):
+        item = manifest.get(itemref.get('idref'))
+        if item is not None:
+            yield _epub_path(base, item)
+
+
+def extract_epub(archive):
+    """Metadata and (mime type, data) cover of EPUB zip archive"""
+    package, base = _epub_package(archive)
+    metadata = package.find(OPF_NS + 'metadata')
+    if metadata is None:
+        raise ValueError("EPUB package has no metadata")
+
+    def values(name):
+        return [element.text.strip()
+                for element in metadata.findall(DC_NS + name)
+                if element.text and element.text.strip()]
+
+    titles = values('title')
+    langs = values('language')
+    details = dict((name, values(name)) for name in (
+        'publisher', 'date', 'identifier', 'subject', 'description'))
+    manifest = _epub_manifest(package)
+    # EPUB 3 cover property, EPUB 2 cover meta or an image named cover
+    cover_item = next((item for item in manifest.values() if 'cover-image' in
+                       (item.get('properties') or '').split()), None)
+    if cover_item is None:
+        cover_item = next((manifest.get(meta.get('content'))
+                           for meta in metadata.iter(OPF_NS + 'meta')
+                           if meta.get('name') == 'cover'), None)
+    if cover_item is None:
+        cover_item = next((
+            item for item in manifest.values()
+            if (item.get('media-type') or '').startswith('image/') and
+            'cover' in (item.get('id', '') + item.get('href', '')).lower()),
+            None)
+    cover = None
+    if cover_item is not None:
+        cover = (cover_item.get('media-type'),
+                 _read_member(archive, _epub_path(base, cover_item),
+                              MAX_COVER_SIZE))
+    chars = sum(_count_text(archive.open(path))
+                for path in _epub_spine(package, base, manifest))
+    return {
+        'format': 'epub',
+        'title': titles[0] if titles else None,
+        'authors': values('creator'),
+        'lang': langs[0] if langs else None,
+        'page_count': _pages(chars),
+        'details': dict((name, value) for name, value in details.items()
+                        if value)
+    }, cover
+
+
+def extract_fb2(stream):
+    """
+        Metadata and (mime type, data) cover of FB2 document. Parsed
+    incrementally, text elements and binaries are dropped once processed.
+    """
+    result = {'format': 'fb2', 'title': None, 'authors': [], 'lang': None,
+              'page_count': None, 'details': {}}
+    details = result['details']
+    cover_id = None
+    cover = None
+    chars = 0
+    path = []
+    for event, element in ElementTree.iterparse(stream,
+                                                events=('start', 'end')):
+        name = _local_name(element.tag)
+        if event == 'start':
+            path.append(name)
+            continue
+        path.pop()
+        parent = path[-1] if path else None
+        text = (element.text or '').strip()
+        if parent == 'title-info':
+            if name == 'book-title':
+                result['title'] = text or None
+            elif name == 'author':
+                parts = [(child.text or '').strip() for child in element
+                         if _local_name(child.tag) in (
+                             'first-name', 'middle-name', 'last-name')]
+                author = ' '.join(part for part in parts if part)
+                if author:
+                    result['authors'].append(author)
+            elif name == 'lang':
+                result['lang'] = text or None
+            elif name == 'genre' and text:
+                details.setdefault('subject', []).append(text)
+            elif name == 'annotation':
+                annotation = ' '.join(''.join(element.itertext()).split())
+                if annotation:
+                    details['description'] = [annotation]
+            elif name == 'date' and text:
+                details['date'] = [text]
+        elif parent == 'publish-info' and text and \
+                name in ('publisher', 'year', 'isbn'):
+            details[{'year': 'date', 'isbn': 'identifier'}.get(
+                name, name)] = [text]
+        elif parent == 'coverpage' and name == 'image':
+            cover_id = (element.get(XLINK_HREF) or '').lstrip('#')
+        elif name in FB2_TEXT_ELEMENTS and 'body' in path:
+            chars += len(' '.join(''.join(element.itertext()).split()))
+            element.clear()
+        elif name == 'binary':
+            if cover_id and element.get('id') == cover_id:
+                data = element.text or ''
+                # Base64 takes 4 characters per 3 bytes
+                if len(data) // 4 * 3 > MAX_COVER_SIZE:
+                    raise ValueError("{0} is too large".format(cover_id))
+                cover = (element.get('content-type'),
+                         base64.b64decode(data))
+            element.clear()
+    result['page_count'] = _pages(chars)
+    return result, cover
+
+
+def _zipped_fb2(archive):
+    """Name of FB2 member of zipped FB2 archive, None for EPUB archive"""
+    names = archive.namelist()
+    if 'META-INF/container.xml' in names:
+        return None
+    fb2_names = [name for name in names if name.lower().endswith('.fb2')]
+    if not fb2_names:
+        raise ValueError("Archive is neither EPUB nor zipped FB2")
+    return fb2_names[0]
+
+
+def _markup_paragraphs(markup):
+    """Paragraphs of (X)HTML document text, block elements end paragraphs"""
+    text = TAG_RE.sub('', BLOCK_TAG_RE.sub('\n', SKIPPED_RE.sub(' ', markup)))
+    for line in html.unescape(text).split('\n'):
+        line = ' '.join(line.split())
+        if line:
+            yield line
+
+
+def iter_epub_paragraphs(archive):
+    """Text paragraphs of EPUB zip archive documents in reading order"""
+    package, base = _epub_package(archive)
+    for path in _epub_spine(package, base, _epub_manifest(package)):
+        markup = _read_member(archive, path, MAX_DOCUMENT_SIZE)
+        for paragraph in _markup_paragraphs(
+                markup.decode('utf-8', 'replace')):
+            yield paragraph
+
+
+def iter_fb2_paragraphs(stream):
+    """Text paragraphs of FB2 document body, parsed incrementally"""
+    path = []
+    for event, element in ElementTree.iterparse(stream,
+                                                events=('start', 'end')):
+        name = _local_name(element.tag)
+        if event == 'start':
+            path.append(name)
+            continue
+        path.pop()
+        if name in FB2_TEXT_ELEMENTS and 'body' in path:
+            text = ' '.join(''.join(element.itertext()).split())
+            element.clear()
+            if text:
+                yield text
+        elif name in ('binary', 'description'):
+            element.clear()
+
+
+def iter_plain_paragraphs(data):
+    """Paragraphs (separated by blank lines) of plain text file"""
+    for encoding in TEXT_ENCODINGS:
+        try:
+            text = data.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = data.decode('utf-8', 'replace')
+    for paragraph in PARAGRAPH_BREAK_RE.split(text):
+        paragraph = ' '.join(paragraph.split())
+        if paragraph:
+            yield paragraph
+
+
+def iter_paragraphs(data, mime_type=None):
+    """
+        Text paragraphs of book file data: EPUB, FB2, zipped FB2 or plain
+    text (by ``mime_type``). Raises ValueError for other formats.
+    """
+    if data[:4] == ZIP_SIGNATURE:
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            fb2_name = _zipped_fb2(archive)
+            if fb2_name is None:
+                paragraphs = iter_epub_paragraphs(archive)
+            else:
+                paragraphs = iter_fb2_paragraphs(archive.open(fb2_name))
+            for paragraph in paragraphs:
+                yield paragraph
+    elif b'<FictionBook' in data[:1024]:
+        for paragraph in iter_fb2_paragraphs(io.BytesIO(data)):
+            yield paragraph
+    elif (mime_type or '').startswith('text/plain'):
+        for paragraph in iter_plain_paragraphs(data):
+            yield paragraph
+    else:
+        raise ValueError("Unsupported file format")
+
+
+def make_covers(mime_type, data, sizes):
+    """
+        Cover images as (size, mime type, width, height, data): original
+    image and, with Pillow, JPEG thumbnails fitting into ``sizes``
+    ({name: (width, height)}). Thumbnails of unreadable images are not made.
+    """
+    if Image is None:
+        return [('original', mime_type, None, None, data)]
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        # Image plugins raise various errors for broken or unknown images,
+        # such a cover is kept as it is
+        return [('original', mime_type, None, None, data)]
+    covers = [('original', mime_type or Image.MIME.get(image.format),
+               image.size[0], image.size[1], data)]
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    resample = getattr(Image, 'LANCZOS', None) or Image.ANTIALIAS
+    for name, size in sorted(sizes.items()):
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size, resample)
+        output = io.BytesIO()
+        thumbnail.save(output, 'JPEG', quality=85)
+        covers.append((name, 'image/jpeg', thumbnail.size[0],
+                       thumbnail.size[1], output.getvalue()))
+    return covers
+
+
+def extract_file(data, sizes):
+    """
+        Extract metadata and covers of book file data. Returns dictionary of
+    BookFileMetadata fields and "covers" list of make_covers. Runs in pool
+    processes, so errors are returned as "error" message, not raised.
+    """
+    try:
+        cover = None
+        if data[:4] == ZIP_SIGNATURE:
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                fb2_name = _zipped_fb2(archive)
+                if fb2_name is None:
+                    result, cover = extract_epub(archive)
+                else:
+                    result, cover = extract_fb2(archive.open(fb2_name))
+        elif b'<FictionBook' in data[:1024]:
+            result, cover = extract_fb2(io.BytesIO(data))
+        else:
+            raise ValueError("Unsupported file format")
+        result['covers'] = make_covers(cover[0], cover[1], sizes) \
+            if cover is not None and cover[1] else []
+        result['error'] = None
+    except Exception as exc:
+        result = {'error': '{0}: {1}'.format(type(exc).__name__, exc),
+                  'covers': []}
+    return result
+
+
+class ProcessPool:
+    """
+        Process pool running batches of tasks, which survives death of its
+    processes (e.g. killed for memory by a malformed file): the executor is
+    replaced and tasks of the broken batch are rerun one by one, so only the
+    task which kills a process fails.
+    """
+
+    def __init__(self, processes):
+        self.processes = processes
+        self.executor = ProcessPoolExecutor(processes)
+
+    def renew(self):
+        """Replace executor, a broken one doesn't take tasks any more"""
+        self.executor.shutdown()
+        self.executor = ProcessPoolExecutor(self.processes)
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+    def run(self, func, tasks, error):
+        """
+            Returns list of ``func(*args)`` results for every args tuple of
+        ``tasks``. A task which kills a pool process gets ``error(exception)``
+        result instead.
+        """
+        executor = self.executor
+        futures = [executor.submit(func, *args) for args in tasks]
+        results = []
+        for args, future in zip(tasks, futures):
+            try:
+                results.append(future.result())
+                continue
+            except BrokenProcessPool:
+                pass
+            # Any task of the batch could have killed the process
+            if self.executor is executor:
+                self.renew()
+            try:
+                results.append(self.executor.submit(func, *args).result())
+            except BrokenProcessPool as exc:
+                results.append(error(exc))
+                self.renew()
+        return results
+
+
+def store_result(session, checksum, result):
+    """Replaces stored metadata and covers of checksum with extracted ones"""
+    session.execute(BookCover.__table__.delete().where(
+        BookCover.checksum == checksum))
+    session.execute(BookFileMetadata.__table__.delete().where(
+        BookFileMetadata.checksum == checksum))
+    row = dict((name, result.get(name)) for name in (
+        'format', 'title', 'lang', 'page_count', 'error'))
+    if row['title']:
+        row['title'] = row['title'][:255]
+    row.update(checksum=checksum,
+               authors=json_dumps(result.get('authors') or []),
+               details=json_dumps(result.get('details') or {}))
+    session.execute(BookFileMetadata.__table__.insert(), [row])
+    covers = [{'checksum': checksum, 'size': size, 'mime_type': mime_type,
+               'width': width, 'height': height, 'data': data}
+              for size, mime_type, width, height, data in result['covers']]
+    if covers:
+        session.execute(BookCover.__table__.insert(), covers)
+
+
+def extract_pending(processes=None):
+    """
+        Extracts files which have no metadata of their checksum yet, in a
+    pool of ``processes`` (ELIBRARIAN_EXTRACTION_PROCESSES). Files data is
+    loaded a pool-full at a time and results are committed after every
+    batch. Yields (processed, total) checksums after every batch.
+    """
+    config = current_app.config
+    if processes is None:
+        processes = config['ELIBRARIAN_EXTRACTION_PROCESSES']
+    sizes = dict(config['ELIBRARIAN_COVER_SIZES'])
+    storage = LiteraryWorkStorage
+    # A file of every checksum
+    ids = [row[0] for row in db.session.query(func.min(storage.id)).outerjoin(
+        BookFileMetadata, BookFileMetadata.checksum == storage.checksum
+    ).filter(
+        storage.content_encoding.is_(None),
+        storage.checksum.isnot(None),
+        BookFileMetadata.checksum.is_(None)
+    ).group_by(storage.checksum)]
+    db.session.commit()
+    processed = 0
+    pool = ProcessPool(processes)
+    try:
+        for start in range(0, len(ids), processes):
+            files = db.session.query(storage.checksum, storage.binary_data) \
+                .filter(storage.id.in_(ids[start:start + processes])).all()
+            # Drivers may return buffers, which are not picklable
+            results = pool.run(
+                extract_file, [(bytes(data), sizes) for _, data in files],
+                lambda exc: {'error': '{0}: {1}'.format(
+                    type(exc).__name__, exc), 'covers': []})
+            for (checksum, _), result in zip(files, results):
+                store_result(db.session, checksum, result)
+            db.session.commit()
+            processed += len(ids[start:start + processes])
+            yield processed, len(ids)
+    finally:
+        pool.shutdown()
@@ -0,0 +1,190 @@
+"""
+    Index advisor: replays recorded SQL statements with EXPLAIN, flags full
+scans of large tables and suggests indexes.
+    Statements are recorded into JSON lines file given by ELIBRARIAN_QUERY_LOG
+setting (environment variable) from every application context, e.g. while
+test or benchmark suite runs:
+
+    ELIBRARIAN_QUERY_LOG=queries.jsonl python manage.py test
+    python manage.py index_advisor -q queries.jsonl
+
+    A full scan is reported for tables of at least ``min_rows`` rows. Columns
+of the scanned table compared with ``=`` or ``IN`` in the statement, which
+are not the leading column of any index, are suggested for a new index.
+Scans with a suggestion are "missing index" findings, the others (e.g.
+unfiltered pages of a list) are informational.
+"""
+import json
+import re
+import threading
+from flask.ext.sqlalchemy import get_debug_queries
+import sqlalchemy as sa
+
+EXPLAINED_STATEMENTS = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+ALIAS_RE = re.compile(r'\b(\w+)\s+AS\s+(\w+)\b', re.IGNORECASE)
+# SQLite query plan line of a table scan, e.g. "SCAN TABLE authors AS a" in
+# older versions and "SCAN a" in newer ones
+SQLITE_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+COMPARISON_RE = r'(?<![\w.]){0}\.(\w+)\s*(?:=|\bIN\b)|=\s*{0}\.(\w+)\b'
+
+_log_lock = threading.Lock()
+
+
+def init_app(app):
+    """Record statements of every application context if log is configured"""
+    log_path = app.config.get('ELIBRARIAN_QUERY_LOG')
+    if not log_path:
+        return
+    app.config['SQLALCHEMY_RECORD_QUERIES'] = True
+
+    @app.teardown_appcontext
+    def log_queries(exc):
+        queries = get_debug_queries()
+        if not queries:
+            return
+        lines = []
+        for query in queries:
+            parameters = query.parameters
+            if isinstance(parameters, tuple):
+                parameters = list(parameters)
+            lines.append(json.dumps({
+                'statement': query.statement,
+                'parameters': parameters,
+                'context': query.context
+            }, default=str) + '\n')
+        with _log_lock:
+            with open(log_path, 'a') as log_file:
+                log_file.writelines(lines)
+
+
+def load_queries(path):
+    """Recorded queries of JSON lines file"""
+    with open(path) as log_file:
+        return [json.loads(line) for line in log_file if line.strip()]
+
+
+class IndexAdvisor:
+    """Explains statements on given engine and collects scans findings"""
+
+    def __init__(self, engine, min_rows=1000):
+        self.engine = engine
+        self.min_rows = min_rows
+        self.inspector = sa.inspect(engine)
+        self.table_names = set(self.inspector.get_table_names())
+        self._rows = {}
+        self._indexed = {}
+
+    def table_rows(self, table):
+        if table not in self._rows:
+            self._rows[table] = self.engine.execute(
+                sa.select([sa.func.count()]).select_from(
+                    sa.sql.table(table))).scalar()
+        return self._rows[table]
+
+    def indexed_columns(self, table):
+        """Leading columns of primary key, unique constraints and indexes"""
+        if table not in self._indexed:
+            leading = set()
+            primary_key = self.inspector.get_pk_constraint(table)
+            if primary_key.get('constrained_columns'):
+                leading.add(primary_key['constrained_columns'][0])
+            for unique in self.inspector.get_unique_constraints(table):
+                leading.add(unique['column_names'][0])
+            for index in self.inspector.get_indexes(table):
+                leading.add(index['column_names'][0])
+            self._indexed[table] = leading
+        return self._indexed[table]
+
+    def _explain_sqlite(self, cursor, statement, parameters):
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        scans = []
+        for row in cursor.fetchall():
+            match = SQLITE_SCAN_RE.match(row[-1])
+            # "SCAN ... USING INDEX" is ordered walk of an index
+            if match and 'USING' not in match.group(3):
+                scans.append(match.group(2) or match.group(1))
+        return scans
+
+    def _explain_postgresql(self, cursor, statement, parameters):
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scans = []
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            if node['Node Type'] == 'Seq Scan':
+                scans.append(node.get('Alias') or node['Relation Name'])
+            nodes.extend(node.get('Plans', ()))
+        return scans
+
+    def explain(self, statement, parameters):
+        """Names (tables or aliases) of tables fully scanned by statement"""
+        if isinstance(parameters, list):
+            parameters = tuple(parameters)
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            if self.engine.dialect.name == 'postgresql':
+                return self._explain_postgresql(cursor, statement, parameters)
+            return self._explain_sqlite(cursor, statement, parameters)
+        finally:
+            connection.rollback()
+            connection.close()
+
+    def suggest(self, statement, table, name):
+        """Columns of scanned table worth an index"""
+        columns = []
+        for match in re.finditer(COMPARISON_RE.format(re.escape(name)),
+                                 statement):
+            column = match.group(1) or match.group(2)
+            if column not in columns and \
+                    column not in self.indexed_columns(table):
+                columns.append(column)
+        return columns
+
+    def analyze(self, queries):
+        """
+            Explain distinct statements of recorded queries. Returns list of
+        findings, missing indexes first.
+        """
+        findings = {}
+        seen = set()
+        for query in queries:
+            statement = query['statement']
+            if statement in seen or not statement.lstrip().upper().startswith(
+                    EXPLAINED_STATEMENTS):
+                continue
+            seen.add(statement)
+            unquoted = statement.replace('"', '')
+            aliases = dict((alias, table) for table, alias in
+                           ALIAS_RE.findall(unquoted)
+                           if table in self.table_names)
+            for name in self.explain(statement, query['parameters']):
+                table = aliases.get(name, name)
+                if table not in self.table_names:
+                    continue
+                rows = self.table_rows(table)
+                if rows < self.min_rows:
+                    continue
+                key = (statement, table)
+                if key not in findings:
+                    findings[key] = {
+                        'table': table,
+                        'rows': rows,
+                        'statement': statement,
+                        'context': query.get('context'),
+                        'suggestions': [
+                            'CREATE INDEX ix_{0}_{1} ON {0} ({1})'.format(
+                                table, column)
+                            for column in self.suggest(unquoted, table, name)]
+                    }
+        return sorted(findings.values(),
+                      key=lambda finding: (not finding['suggestions'],
+                                           finding['table']))
+
+
+def missing_indexes(findings):
+    """Findings of filtered full scans, which have index suggestions"""
+    return [finding for finding in findings if finding['suggestions']]
@@ -0,0 +1,346 @@
+"""
+    Background jobs for long maintenance tasks.
+    Jobs are rows of "background_jobs" table, so no external broker is
+needed: web workers and scripts enqueue jobs, "manage.py worker" claims due
+jobs with conditional updates and runs them on a thread or process pool.
+Failed jobs are retried with exponential backoff until max attempts are
+spent, jobs of a dead worker are requeued when their heartbeat gets stale.
+Jobs listed in ELIBRARIAN_JOBS_PERIODIC are queued by workers once per
+interval.
+    Job function is registered with ``@job(name)`` and called with
+JobContext (progress reporting) and keyword arguments given on enqueue. Its
+return value is stored as JSON result.
+"""
+import os
+import socket
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from json import dumps as json_dumps
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from . import content_index, create_app, db, extraction, recommendations
+from .models import BackgroundJob, LiteraryWork, LiteraryWorkCard, \
+    LiteraryWorkCounters, rebuild_sort_keys
+
+# Registered job functions: name -> (function, default max attempts)
+JOBS = {}
+
+
+def job(name, max_attempts=3):
+    """Decorator registering job function under given name"""
+
+    def decorator(func):
+        JOBS[name] = (func, max_attempts)
+        return func
+
+    return decorator
+
+
+class JobContext:
+    """Running job information passed to job function"""
+
+    def __init__(self, job_id, attempt):
+        self.job_id = job_id
+        self.attempt = attempt
+
+    def progress(self, fraction, message=None):
+        """
+            Report progress (0.0 - 1.0) of the job. Written outside of the
+        job's session transaction, so it is visible immediately.
+        """
+        table = BackgroundJob.__table__
+        db.engine.execute(table.update().where(
+            table.c.id == self.job_id
+        ).values(progress=fraction, progress_message=message,
+                 heartbeat=datetime.utcnow()))
+
+
+def enqueue(name, args=None, idempotency_key=None, max_attempts=None,
+            run_after=None):
+    """
+        Queue job and return (job, created) pair. If job with the same
+    idempotency key exists, it is returned instead of creating a new one.
+    Raises ValueError for unknown job name.
+    """
+    if name not in JOBS:
+        raise ValueError("Unknown job '{0}'".format(name))
+    if idempotency_key is not None:
+        existing = BackgroundJob.query.filter_by(
+            idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return existing, False
+    new_job = BackgroundJob(
+        name=name, args=json_dumps(args or {}),
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts or JOBS[name][1],
+        run_after=run_after or datetime.utcnow())
+    db.session.add(new_job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same key was queued concurrently
+        db.session.rollback()
+        return BackgroundJob.query.filter_by(
+            idempotency_key=idempotency_key).one(), False
+    return new_job, True
+
+
+def claim_job(worker_id):
+    """
+        Move the oldest due queued job to running state. Conditional update
+    makes sure only one worker gets the job. Returns job id or None.
+    """
+    table = BackgroundJob.__table__
+    now = datetime.utcnow()
+    candidates = db.session.query(BackgroundJob.id).filter(
+        BackgroundJob.status == BackgroundJob.QUEUED,
+        BackgroundJob.run_after <= now
+    ).order_by(BackgroundJob.id).limit(10).all()
+    for (job_id,) in candidates:
+        result = db.session.execute(table.update().where(
+            table.c.id == job_id
+        ).where(
+            table.c.status == BackgroundJob.QUEUED
+        ).values(status=BackgroundJob.RUNNING, worker=worker_id, started=now,
+                 heartbeat=now, attempts=table.c.attempts + 1))
+        db.session.commit()
+        if result.rowcount == 1:
+            return job_id
+    return None
+
+
+def _finish_failed(job_id, worker, attempts, max_attempts, error):
+    """
+        Queue failed job for retry with backoff or mark it failed, unless it
+    was requeued and taken by another worker meanwhile
+    """
+    table = BackgroundJob.__table__
+    now = datetime.utcnow()
+    values = {'error': error, 'worker': None}
+    if attempts < max_attempts:
+        delay = current_app.config['ELIBRARIAN_JOBS_RETRY_DELAY'] * \
+            2 ** (attempts - 1)
+        values.update(status=BackgroundJob.QUEUED,
+                      run_after=now + timedelta(seconds=delay))
+    else:
+        values.update(status=BackgroundJob.FAILED, finished=now)
+    db.engine.execute(table.update().where(
+        table.c.id == job_id
+    ).where(
+        table.c.status == BackgroundJob.RUNNING
+    ).where(
+        table.c.worker == worker
+    ).values(**values))
+
+
+def run_job(job_id):
+    """Run claimed job in current application context and store outcome"""
+    table = BackgroundJob.__table__
+    running_job = BackgroundJob.query.get(job_id)
+    name, args = running_job.name, running_job.get_args()
+    attempts, max_attempts = running_job.attempts, running_job.max_attempts
+    # Outcome is stored only while the job is still ours: a job considered
+    # stale could be requeued and claimed by another worker
+    worker = running_job.worker
+    db.session.commit()
+    try:
+        if name not in JOBS:
+            raise LookupError("Job '{0}' is not registered".format(name))
+        result = JOBS[name][0](JobContext(job_id, attempts), **args)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Job %s (%s) failed", job_id, name)
+        _finish_failed(job_id, worker, attempts, max_attempts,
+                       traceback.format_exc())
+    else:
+        db.engine.execute(table.update().where(
+            table.c.id == job_id
+        ).where(
+            table.c.status == BackgroundJob.RUNNING
+        ).where(
+            table.c.worker == worker
+        ).values(status=BackgroundJob.DONE, result=json_dumps(result),
+                 error=None, progress=1.0, finished=datetime.utcnow()))
+    finally:
+        db.session.remove()
+
+
+def requeue_stale_jobs(timeout):
+    """
+        Jobs running without heartbeat for ``timeout`` seconds belong to a
+    dead worker: retry them or mark failed. Returns number of such jobs.
+    """
+    stale = BackgroundJob.query.filter(
+        BackgroundJob.status == BackgroundJob.RUNNING,
+        BackgroundJob.heartbeat < datetime.utcnow() - timedelta(
+            seconds=timeout)
+    ).all()
+    for stale_job in stale:
+        _finish_failed(stale_job.id, stale_job.worker, stale_job.attempts,
+                       stale_job.max_attempts,
+                       'Worker {0} stopped responding'.format(
+                           stale_job.worker))
+    db.session.commit()
+    return len(stale)
+
+
+def enqueue_periodic(name, interval, now=None):
+    """
+        Queue job once per ``interval`` seconds. Idempotency key names the
+    interval, so the job is queued once even by several workers. Returns
+    (job, created) pair.
+    """
+    period = int((time.time() if now is None else now) // interval)
+    return enqueue(name, idempotency_key='periodic:{0}:{1}'.format(
+        name, period))
+
+
+def _run_in_thread(app, job_id):
+    with app.app_context():
+        run_job(job_id)
+
+
+_process_app = None
+
+
+def _run_in_process(config_name, job_id):
+    global _process_app
+    if _process_app is None:
+        _process_app = create_app(config_name)
+    with _process_app.app_context():
+        run_job(job_id)
+
+
+class Worker:
+    """Polls jobs table and runs due jobs on a thread or process pool"""
+
+    def __init__(self, app, config_name, concurrency=2, processes=False):
+        self.app = app
+        self.config_name = config_name
+        self.concurrency = concurrency
+        self.processes = processes
+        self.worker_id = '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        # Periodic job name -> interval number it was queued for
+        self._periods = {}
+
+    def _submit(self, executor, job_id):
+        if self.processes:
+            return executor.submit(_run_in_process, self.config_name, job_id)
+        return executor.submit(_run_in_thread, self.app, job_id)
+
+    def _heartbeat(self, job_ids):
+        if job_ids:
+            table = BackgroundJob.__table__
+            db.engine.execute(table.update().where(
+                table.c.id.in_(job_ids)).values(heartbeat=datetime.utcnow()))
+
+    def _enqueue_periodic(self):
+        now = time.time()
+        for name, interval in self.app.config['ELIBRARIAN_JOBS_PERIODIC']:
+            period = int(now // interval)
+            if self._periods.get(name) != period:
+                enqueue_periodic(name, interval, now)
+                self._periods[name] = period
+
+    def run(self, once=False):
+        """
+            Process jobs until interrupted. With ``once`` returns when there
+        are no due jobs left.
+        """
+        config = self.app.config
+        executor_class = ProcessPoolExecutor if self.processes else \
+            ThreadPoolExecutor
+        executor = executor_class(self.concurrency)
+        running = {}
+        try:
+            while True:
+                for future in [future for future in running
+                               if future.done()]:
+                    job_id = running.pop(future)
+                    if future.exception() is not None:
+                        self.app.logger.error("Job %s crashed the runner: %s",
+                                              job_id, future.exception())
+                claimed = False
+                with self.app.app_context():
+                    self._heartbeat(list(running.values()))
+                    self._enqueue_periodic()
+                    requeue_stale_jobs(
+                        config['ELIBRARIAN_JOBS_STALE_TIMEOUT'])
+                    while len(running) < self.concurrency:
+                        job_id = claim_job(self.worker_id)
+                        if job_id is None:
+                            break
+                        claimed = True
+                        running[self._submit(executor, job_id)] = job_id
+                    db.session.remove()
+                if once and not running and not claimed:
+                    return
+                time.sleep(config['ELIBRARIAN_JOBS_POLL_INTERVAL'])
+        finally:
+            executor.shutdown(wait=True)
+
+
+# ----=[ maintenance jobs ]=---------------------------------------------------
+@job('rebuild_work_cards')
+def rebuild_work_cards(context):
+    """Rebuild materialized literary work cards"""
+    total = LiteraryWork.query.count()
+    processed = 0
+    for processed in LiteraryWorkCard.rebuild_all():
+        context.progress(processed / float(total or 1),
+                         '{0} of {1} literary works'.format(processed, total))
+    return {'processed': processed}
+
+
+@job('reconcile_work_counters')
+def reconcile_work_counters(context):
+    """Recount literary works popularity counters from personal libraries"""
+    total = LiteraryWork.query.count()
+    processed = fixed = 0
+    for processed, fixed in LiteraryWorkCounters.reconcile():
+        context.progress(processed / float(total or 1),
+                         '{0} of {1} literary works, {2} fixed'.format(
+                             processed, total, fixed))
+    return {'processed': processed, 'fixed': fixed}
+
+
+@job('rebuild_sort_keys')
+def rebuild_sort_keys_job(context):
+    """Recompute collation keys of authors names and literary works titles"""
+    processed = 0
+    for processed in rebuild_sort_keys():
+        context.progress(None, '{0} rows processed'.format(processed))
+    return {'processed': processed}
+
+
+@job('rebuild_recommendations')
+def rebuild_recommendations(context):
+    """Recompute "readers also read" neighbours of literary works"""
+    processed = 0
+    for processed in recommendations.rebuild():
+        context.progress(None, '{0} literary works processed'.format(
+            processed))
+    return {'processed': processed}
+
+
+@job('extract_book_files')
+def extract_book_files(context):
+    """Extract covers and metadata of stored book files"""
+    processed = 0
+    for processed, total in extraction.extract_pending():
+        context.progress(processed / float(total or 1),
+                         '{0} of {1} files'.format(processed, total))
+    return {'processed': processed}
+
+
+@job('index_book_contents')
+def index_book_contents(context):
+    """Index text of stored book files for full-text search"""
+    processed = 0
+    for processed, total in content_index.index_pending():
+        context.progress(processed / float(total or 1),
+                         '{0} of {1} files'.format(processed, total))
+    return {'processed': processed}
@@ -0,0 +1,184 @@
+"""
+    Import of reading history from CSV files, e.g. exported from another
+reading tracker. The first line names columns:
+
+    title,author,lang,plan_to_read,read_flag,read_progress,read_date,rating
+
+    Only "title" is required. Titles are matched against the catalogue by
+collation keys of the languages (see elibrarian_app.collation), the way
+alphabetical listings compare them: without PyICU case and accents do not
+matter. "author" (any form of the name containing the last name) picks one
+of several works of the same title. Lookups are batched: a few queries per
+chunk of rows whatever the number of rows is. Matched rows are written with
+AuthUserPersonalLibrary.bulk_upsert, empty cells keep values of existing
+entries.
+"""
+import csv
+import io
+import re
+from collections import defaultdict
+from .collation import sort_key
+from .models import AuthUserPersonalLibrary, AuthorDetail, \
+    Authors2LiteraryWorks, IN_CLAUSE_CHUNK, LiteraryWorkDetail
+
+COLUMNS = ('title', 'author', 'lang') + AuthUserPersonalLibrary.SHELF_FIELDS
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 'x')
+FALSE_VALUES = ('0', 'false', 'no', 'n')
+WORD_RE = re.compile(r'\w+')
+
+
+def _words(text):
+    return set(WORD_RE.findall(text.casefold()))
+
+
+def parse_csv(text, max_rows):
+    """
+        Returns list of (line number, row dictionary) of CSV text. Raises
+    ValueError for unknown or missing columns and too many rows.
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    columns = [name.strip() for name in reader.fieldnames or ()]
+    if 'title' not in columns:
+        raise ValueError("CSV should have 'title' column")
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise ValueError("Unknown CSV columns: {0}".format(
+            ', '.join(sorted(unknown))))
+    reader.fieldnames = columns
+    rows = []
+    for row in reader:
+        if len(rows) >= max_rows:
+            raise ValueError("CSV should have at most {0} rows".format(
+                max_rows))
+        rows.append((reader.line_num, dict(
+            (name, (value or '').strip()) for name, value in row.items()
+            if name is not None)))
+    return rows
+
+
+def shelf_values(row):
+    """Shelf entry values of CSV row, empty cells are skipped"""
+    values = {}
+    for name in ('plan_to_read', 'read_flag'):
+        value = row.get(name, '').lower()
+        if value in TRUE_VALUES:
+            values[name] = True
+        elif value in FALSE_VALUES:
+            values[name] = False
+        elif value:
+            raise ValueError("{0} should be one of: {1}".format(
+                name, ', '.join(TRUE_VALUES + FALSE_VALUES)))
+    try:
+        if row.get('read_progress'):
+            values['read_progress'] = int(row['read_progress'])
+        if row.get('rating'):
+            rating = row['rating']
+            values['rating'] = int(rating) if rating.isdigit() else \
+                float(rating)
+    except ValueError:
+        raise ValueError("read_progress and rating should be numbers")
+    if row.get('read_date'):
+        values['read_date'] = row['read_date']
+    return values
+
+
+def _find_titles(session, keys):
+    """(lang, title key) -> literary work ids, a query per chunk of keys"""
+    detail = LiteraryWorkDetail
+    found = defaultdict(set)
+    by_lang = defaultdict(set)
+    for lang, key in keys:
+        by_lang[lang].add(key)
+    for lang, lang_keys in by_lang.items():
+        lang_keys = sorted(lang_keys)
+        for start in range(0, len(lang_keys), IN_CLAUSE_CHUNK):
+            for work_id, key in session.query(
+                    detail.literary_work_id, detail.sort_key).filter(
+                    detail.lang == lang,
+                    detail.sort_key.in_(
+                        lang_keys[start:start + IN_CLAUSE_CHUNK])):
+                found[(lang, key)].add(work_id)
+    return found
+
+
+def _find_last_names(session, work_ids):
+    """Literary work id -> words of its authors last names in any language"""
+    work_ids = sorted(work_ids)
+    last_names = defaultdict(list)
+    for start in range(0, len(work_ids), IN_CLAUSE_CHUNK):
+        for work_id, last_name in session.query(
+                Authors2LiteraryWorks.literary_work_id, AuthorDetail.last_name
+        ).join(
+            AuthorDetail, AuthorDetail.id == Authors2LiteraryWorks.author_id
+        ).filter(Authors2LiteraryWorks.literary_work_id.in_(
+                work_ids[start:start + IN_CLAUSE_CHUNK])):
+            last_names[work_id].append(_words(last_name))
+    return last_names
+
+
+def match_works(session, rows, langs):
+    """
+        Literary work ids of CSV rows, a (work id, error message) pair per
+    row. Row is looked up in its "lang" or in all ``langs``.
+    """
+    row_keys = []
+    for row in rows:
+        row_langs = [row['lang']] if row.get('lang') else langs
+        row_keys.append([(lang, sort_key(lang, row['title']))
+                         for lang in row_langs] if row['title'] else [])
+    found = _find_titles(session, set(
+        key for keys in row_keys for key in keys))
+    candidates = [set().union(*[found.get(key, ()) for key in keys])
+                  for keys in row_keys]
+    last_names = _find_last_names(session, set().union(*[
+        ids for row, ids in zip(rows, candidates)
+        if row.get('author') and len(ids) > 1]))
+    matches = []
+    for row, ids in zip(rows, candidates):
+        if not row['title']:
+            matches.append((None, "Title is required"))
+            continue
+        if row.get('author') and len(ids) > 1:
+            author = _words(row['author'])
+            ids = set(work_id for work_id in ids
+                      if any(name and name <= author
+                             for name in last_names[work_id]))
+        if len(ids) == 1:
+            matches.append((ids.pop(), None))
+        elif ids:
+            matches.append((None, "{0} literary works match, specify "
+                                  "author or lang".format(len(ids))))
+        else:
+            matches.append((None, "No literary work matches"))
+    return matches
+
+
+def import_csv(session, user_id, text, langs, max_rows):
+    """
+        Imports CSV reading history into user's personal library within the
+    session transaction, which the caller commits. Returns list of (line
+    number, result) pairs, results are the same as of bulk_upsert. Raises
+    ValueError for malformed CSV.
+    """
+    rows = parse_csv(text, max_rows)
+    results = [None] * len(rows)
+    entries = []
+    positions = []
+    for index, ((_, row), (work_id, error)) in enumerate(zip(
+            rows, match_works(session, [row for _, row in rows], langs))):
+        if error is None:
+            try:
+                entry = shelf_values(row)
+            except ValueError as exc:
+                error = str(exc)
+        if error is not None:
+            results[index] = {'literary_work_id': work_id, 'status': 'error',
+                              'message': error}
+            continue
+        entry['literary_work_id'] = work_id
+        entries.append(entry)
+        positions.append(index)
+    for index, result in zip(positions, AuthUserPersonalLibrary.bulk_upsert(
+            session, user_id, entries)):
+        results[index] = result
+    return [(line, result) for (line, _), result in zip(rows, results)]
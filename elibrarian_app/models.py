@@ -3,13 +3,23 @@
 behaviour.
 """
 import hashlib
-from datetime import datetime
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import chain
+from json import dumps as json_dumps, loads as json_loads
 from flask import current_app, g, request, url_for
+from flask.ext.sqlalchemy import SignallingSession
 from flask_login import AnonymousUserMixin, UserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 from itsdangerous import BadSignature, SignatureExpired
+from sqlalchemy import and_, bindparam, case, event, func, or_, select, \
+    union_all
+from sqlalchemy.orm import defer, object_mapper
+from sqlalchemy.orm.attributes import NEVER_SET, NO_VALUE, get_history
+from werkzeug.contrib.cache import SimpleCache
 from werkzeug.security import generate_password_hash, check_password_hash
 from . import db, login_manager
+from .collation import SORT_KEY_LENGTH, sort_key
 
 
 # ----=[ authentication support models ]=--------------------------------------
@@ -33,7 +43,8 @@ class AuthRole(db.Model):
     name = db.Column(db.String(64), unique=True)
     default = db.Column(db.Boolean, default=False, index=True)
     permissions = db.Column(db.Integer)
-    users = db.relationship('AuthUser', backref='role', lazy='dynamic')
+    users = db.relationship('AuthUser', back_populates='role',
+                            lazy='dynamic')
 
     def __init__(self, name, permissions=0, default=False):
         super(AuthRole, self).__init__()
@@ -63,6 +74,17 @@ class AuthRole(db.Model):
             db.session.add(role)
         db.session.commit()
 
+    def revoke_tokens(self):
+        """Invalidate authentication tokens of all users of the role"""
+        # Core update: called from attribute events, so without autoflush
+        db.session.execute(AuthUser.__table__.update().where(
+            AuthUser.role_id == self.id
+        ).values(token_version=AuthUser.token_version + 1))
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, AuthUser):
+                db.session.expire(obj, ['token_version'])
+        _token_versions_cache().clear()
+
     def __repr__(self):
         return "<Role {0}>".format(self.name)
 
@@ -77,6 +99,9 @@ class AuthUser(UserMixin, db.Model):
     email = db.Column(db.String(64), unique=True, index=True)
     username = db.Column(db.String(64), unique=True, index=True)
     role_id = db.Column(db.Integer, db.ForeignKey('auth_roles.id'))
+    # Declared here rather than as backref, so listeners can be attached to
+    # it at import time
+    role = db.relationship('AuthRole', back_populates='users')
     password_hash = db.Column(db.String(128))
     confirmed = db.Column(db.Boolean, default=False)
     name = db.Column(db.String(64))
@@ -84,6 +109,9 @@ class AuthUser(UserMixin, db.Model):
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
+    # Incremented to revoke all issued authentication tokens
+    token_version = db.Column(db.Integer, default=0, server_default='0',
+                              nullable=False)
 
     def __init__(self, **kwargs):
         super(AuthUser, self).__init__(**kwargs)
@@ -225,31 +253,136 @@ class AuthUser(UserMixin, db.Model):
 
     def generate_auth_token(self, expiration):
         """
-            Generate authorization token with user id inside and expiration
-        time in seconds and return a JSON.
+            Generate authorization token with expiration time in seconds. Token
+        carries claims enough to authorize requests without database queries:
+        user id, role permissions, confirmed flag, preferred language and
+        tokens version.
         """
         serializer = Serializer(current_app.config['SECRET_KEY'],
                                 expires_in=expiration)
-        return serializer.dumps({'id': self.id}).decode('ascii')
+        return serializer.dumps({
+            'id': self.id,
+            'perm': self.role.permissions if self.role is not None else None,
+            'confirmed': bool(self.confirmed),
+            'lang': self.preferred_lang,
+            'ver': self.token_version or 0
+        }).decode('ascii')
 
     @staticmethod
     def verify_auth_token(token):
         """
-            Checks that given token is valid and returns the user object given
-        by id inside token
+            Checks that given token is valid and not revoked and returns
+        TokenUser built from its claims. Tokens without claims (issued by
+        previous versions) give user object loaded by id inside token, until
+        tokens of the user are revoked for the first time.
         """
         serializer = Serializer(current_app.config['SECRET_KEY'])
         try:
             data = serializer.loads(token)
         except (BadSignature, SignatureExpired):
             return None
-        return AuthUser.query.get(data['id'])
+        if 'ver' not in data:
+            if AuthUser.get_token_version(data['id']):
+                return None
+            return AuthUser.query.get(data['id'])
+        if data['ver'] != AuthUser.get_token_version(data['id']):
+            return None
+        return TokenUser(data)
+
+    @staticmethod
+    def get_token_version(user_id):
+        """
+            Returns current tokens version of the user, or None if user does
+        not exist. Versions are cached for ELIBRARIAN_TOKEN_VERSION_CACHE_TIMEOUT
+        seconds, so revocation takes effect in other processes within that
+        time.
+        """
+        cache = _token_versions_cache()
+        cached = cache.get(user_id)
+        if cached is None:
+            cached = (db.session.query(AuthUser.token_version).filter_by(
+                id=user_id).scalar(),)
+            cache.set(user_id, cached, timeout=current_app.config[
+                'ELIBRARIAN_TOKEN_VERSION_CACHE_TIMEOUT'])
+        return cached[0]
+
+    def revoke_tokens(self):
+        """Invalidate all authentication tokens issued to the user"""
+        self.token_version = (self.token_version or 0) + 1
+        db.session.add(self)
+        _token_versions_cache().delete(self.id)
 
     def __repr__(self):
         return "<User {0}({1}, {2})>".format(
             self.username, self.id, self.email)
 
 
+def _token_versions_cache():
+    """Per application cache of users tokens versions"""
+    extensions = current_app.extensions
+    if 'token_versions' not in extensions:
+        extensions['token_versions'] = SimpleCache(threshold=10000)
+    return extensions['token_versions']
+
+
+@event.listens_for(AuthUser.role, 'set', active_history=True)
+@event.listens_for(AuthUser.confirmed, 'set', active_history=True)
+@event.listens_for(AuthUser.preferred_lang, 'set', active_history=True)
+def revoke_tokens_on_claims_change(user, value, oldvalue, initiator):
+    """
+        Tokens carrying permissions, confirmed flag and preferred language
+    become stale
+    """
+    if user.id is not None and oldvalue not in (NO_VALUE, NEVER_SET) and \
+            value != oldvalue:
+        user.revoke_tokens()
+
+
+@event.listens_for(AuthRole.permissions, 'set', active_history=True)
+def revoke_tokens_on_permissions_change(role, value, oldvalue, initiator):
+    """Tokens of the role users carry its permissions"""
+    if role.id is not None and oldvalue not in (NO_VALUE, NEVER_SET) and \
+            value != oldvalue:
+        role.revoke_tokens()
+
+
+class TokenUser:
+    """
+        User described by verified claims of authentication token. Answers
+    permission questions without database queries, full user object is
+    available with ``get_user``.
+    """
+
+    def __init__(self, claims):
+        self.id = claims['id']
+        self.permissions = claims['perm']
+        self.confirmed = claims['confirmed']
+        self.preferred_lang = claims['lang']
+        self.token_version = claims['ver']
+
+    def can(self, permissions):
+        """Return true if user has all the permissions"""
+        return self.permissions is not None and \
+            (self.permissions & permissions) == permissions
+
+    def is_administrator(self):
+        """Return true if user is administrator"""
+        return self.can(Permission.ADMINISTER)
+
+    def is_anonymous(self):
+        return False
+
+    def is_authenticated(self):
+        return True
+
+    def get_user(self):
+        """Returns AuthUser object of the token owner"""
+        return AuthUser.query.get(self.id)
+
+    def __repr__(self):
+        return "<TokenUser {0}>".format(self.id)
+
+
 class AnonymousUser(AnonymousUserMixin):
     """Disable all permissions for anonymous user"""
 
@@ -272,11 +405,108 @@ def load_user(user_id):
 
 
 # ----=[ primary library models ]=---------------------------------------------
+def _version_from_rows(rows):
+    """
+        Aggregates timestamps of rows contributing to object representation
+    into (last modification time, rows count) in a single query. The count
+    changes when a contributing row is deleted, so it is a part of version.
+    """
+    last_modified, count = db.session.query(
+        func.max(rows.c.timestamp), func.count()).select_from(rows).one()
+    if not count:
+        return None
+    return last_modified, count
+
+
+# Max number of bound parameters in a single "IN (...)" clause
+IN_CLAUSE_CHUNK = 500
+
+
+def keys_after(columns, values):
+    """
+        Condition selecting rows which follow ``values`` in order of
+    ``columns``: (c1, c2, ...) > (v1, v2, ...) spelled out for databases
+    without row values comparison
+    """
+    condition = columns[-1] > values[-1]
+    for column, value in reversed(list(zip(columns[:-1], values[:-1]))):
+        condition = or_(column > value, and_(column == value, condition))
+    return condition
+
+
+def _load_grouped(query, column, ids, key):
+    """
+        Loads rows of ``query`` where ``column`` value is one of ``ids`` and
+    groups them by ``key`` attribute. Ids are split into chunks to respect
+    database limits on bound parameters.
+    """
+    grouped = defaultdict(list)
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        chunk = ids[start:start + IN_CLAUSE_CHUNK]
+        for row in query.filter(column.in_(chunk)):
+            grouped[getattr(row, key)].append(row)
+    return grouped
+
+
+def _wanted(fields, *names):
+    """
+        True if any of ``names`` is requested in ``fields`` set. All fields
+    are requested when ``fields`` is None.
+    """
+    return fields is None or any(name in fields for name in names)
+
+
+def _pick_details(details, lang):
+    """
+        Choose details in preferred language, or english, or the first
+    available from the list of details objects.
+    """
+    if not details:
+        return None
+    english = None
+    for detail in details:
+        if detail.lang == lang:
+            return detail
+        if english is None and detail.lang == "en":
+            english = detail
+    return english or details[0]
+
+
+def _count_grouped(column, ids):
+    """
+        Counts rows per ``column`` value for all given ``ids`` with grouped
+    queries. Returns dictionary {id: rows count}, ids without rows are absent.
+    """
+    counts = {}
+    ids = list(ids)
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        chunk = ids[start:start + IN_CLAUSE_CHUNK]
+        counts.update(
+            db.session.query(column, func.count()).filter(
+                column.in_(chunk)).group_by(column))
+    return counts
+
+
+def load_by_ids(model, ids):
+    """
+        Loads objects of ``model`` by list of primary keys with a constant
+    number of queries. Returns list of found objects in requested order and
+    list of missing ids.
+    """
+    found = _load_grouped(model.query, model.id, ids, 'id')
+    objects = [found[obj_id][0] for obj_id in ids if obj_id in found]
+    missing = [obj_id for obj_id in ids if obj_id not in found]
+    return objects, missing
+
+
 class Author(db.Model):
     """Can be book author, translator or somebody who makes something"""
     __tablename__ = "authors"
     id = db.Column(db.Integer, primary_key=True)
     original_lang = db.Column(db.String(3), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
 
     details = db.relationship('AuthorDetail', backref='author', lazy='dynamic')
     literary_works = db.relationship('Authors2LiteraryWorks', backref='author')
@@ -312,6 +542,25 @@ class Author(db.Model):
             return details.to_json()
         return None
 
+    @staticmethod
+    def get_version(author_id):
+        """
+            Returns (last modification time, contributing rows count) of author
+        representation: author itself, its details, links to literary works and
+        details of linked works. Returns None if author does not exist.
+        """
+        a2lw = Authors2LiteraryWorks
+        rows = union_all(
+            select([Author.timestamp]).where(Author.id == author_id),
+            select([AuthorDetail.timestamp]).where(
+                AuthorDetail.id == author_id),
+            select([a2lw.timestamp]).where(a2lw.author_id == author_id),
+            select([LiteraryWorkDetail.timestamp]).where(
+                LiteraryWorkDetail.literary_work_id == a2lw.literary_work_id
+            ).where(a2lw.author_id == author_id)
+        ).alias('author_version')
+        return _version_from_rows(rows)
+
     def get_literary_works(self):
         """
             Returns list LiteraryWork objects. (Literary works created by this
@@ -319,38 +568,122 @@ class Author(db.Model):
         """
         return [assoc.literary_works for assoc in self.literary_works]
 
-    def to_json(self, lang="en", verbose=False):
+    # Attributes and relations which can be selected in JSON representation
+    JSON_FIELDS = ('id', 'url', 'full_name', 'lang', 'last_name', 'first_name',
+                   'middle_name', 'nickname', 'wikipedia_hyperlink',
+                   'original_lang', 'literary_works_count',
+                   'literary_works_url')
+    JSON_EMBEDS = ('literary_works',)
+    DETAILS_FIELDS = ('full_name', 'lang', 'last_name', 'first_name',
+                      'middle_name', 'nickname', 'wikipedia_hyperlink')
+
+    def to_json(self, lang="en", verbose=False, fields=None, embed=None):
         """
             Returns JSON representation of author object and related literary
         works list on a given language (if available, english by default), and
         verbose if needed.
         """
-        json = {
-            'id': self.id,
-            'url': url_for('api.get_author', author_id=self.id,
-                           _external=True),
-            'literary_works': []
-        }
-        if verbose:
-            json.update(self.get_details(lang=lang))
-        else:
-            json['full_name'] = self.get_details(lang=lang)['full_name']
-            json['lang'] = self.get_details(lang=lang)['lang']
-        if self.original_lang:
-            json['original_lang'] = self.original_lang
-
-        for literary_work in self.get_literary_works():
-            lw_base = {
-                'id': literary_work.id,
-                'url': url_for('api.get_literary_work',
-                               work_id=literary_work.id, _external=True)
-            }
-            lw_detail = literary_work.get_details(lang=lang)
-            if lw_detail:
-                for key in ('title', 'lang'):
-                    lw_base[key] = lw_detail[key]
-            json['literary_works'].append(lw_base)
-        return json
+        return Author.to_json_bulk([self], lang=lang, verbose=verbose,
+                                   fields=fields, embed=embed)[0]
+
+    @staticmethod
+    def to_json_bulk(authors, lang="en", verbose=False, fields=None,
+                     embed=None):
+        """
+            Returns JSON representations of given authors like ``to_json``
+        does. Every representation carries count of author's literary works;
+        verbose one also embeds first works, at most
+        ELIBRARIAN_EMBEDDED_WORKS_LIMIT of them (the rest are available with
+        paginated author's literary works resource). Data for all authors is
+        loaded at once with a constant number of queries.
+            ``fields`` limits representation to given attributes (id is always
+        present) and ``embed`` overrides default set of embedded relations.
+        Data required only by not requested attributes and relations is not
+        loaded at all.
+        """
+        if embed is None:
+            embed = ('literary_works',) if verbose else ()
+        if fields is None and not verbose:
+            fields = ('id', 'url', 'full_name', 'lang', 'original_lang',
+                      'literary_works_count', 'literary_works_url')
+        author_ids = [author.id for author in authors]
+        details = defaultdict(list)
+        if _wanted(fields, *Author.DETAILS_FIELDS):
+            details = _load_grouped(AuthorDetail.query, AuthorDetail.id,
+                                    author_ids, 'id')
+        works_counts = {}
+        if _wanted(fields, 'literary_works_count'):
+            works_counts = _count_grouped(Authors2LiteraryWorks.author_id,
+                                          author_ids)
+        links = defaultdict(list)
+        works_details = defaultdict(list)
+        if 'literary_works' in embed:
+            links = _load_grouped(
+                Authors2LiteraryWorks.query.filter(
+                    Authors2LiteraryWorks.literary_work_id.in_(
+                        Author._first_works_subquery(
+                            current_app.config[
+                                'ELIBRARIAN_EMBEDDED_WORKS_LIMIT']))
+                ).order_by(Authors2LiteraryWorks.literary_work_id),
+                Authors2LiteraryWorks.author_id, author_ids, 'author_id')
+            work_ids = set(link.literary_work_id
+                           for author_links in links.values()
+                           for link in author_links)
+            works_details = _load_grouped(
+                LiteraryWorkDetail.query.order_by(LiteraryWorkDetail.id),
+                LiteraryWorkDetail.literary_work_id, work_ids,
+                'literary_work_id')
+
+        result = []
+        for author in authors:
+            json = {'id': author.id}
+            if _wanted(fields, 'url'):
+                json['url'] = url_for('api.get_author', author_id=author.id,
+                                      _external=True)
+            if _wanted(fields, 'literary_works_count'):
+                json['literary_works_count'] = works_counts.get(author.id, 0)
+            if _wanted(fields, 'literary_works_url'):
+                json['literary_works_url'] = url_for(
+                    'api.get_author_literary_works', author_id=author.id,
+                    _external=True)
+            author_details = _pick_details(details[author.id], lang)
+            if author_details:
+                for key, value in author_details.to_json().items():
+                    if _wanted(fields, key):
+                        json[key] = value
+            if author.original_lang and _wanted(fields, 'original_lang'):
+                json['original_lang'] = author.original_lang
+
+            if 'literary_works' in embed:
+                json['literary_works'] = []
+                for link in links[author.id]:
+                    lw_base = {
+                        'id': link.literary_work_id,
+                        'url': url_for('api.get_literary_work',
+                                       work_id=link.literary_work_id,
+                                       _external=True)
+                    }
+                    lw_detail = _pick_details(
+                        works_details[link.literary_work_id], lang)
+                    if lw_detail:
+                        lw_base['title'] = lw_detail.title
+                        lw_base['lang'] = lw_detail.lang
+                    json['literary_works'].append(lw_base)
+            result.append(json)
+        return result
+
+    @staticmethod
+    def _first_works_subquery(limit):
+        """
+            Correlated subquery selecting ids of first ``limit`` literary works
+        of the author of outer authors_2_literary_works row. Allows to cap
+        embedded works per author in one query for many authors.
+        """
+        links = Authors2LiteraryWorks.__table__
+        inner = links.alias('first_works')
+        return select([inner.c.literary_work_id]).where(
+            inner.c.author_id == links.c.author_id
+        ).order_by(inner.c.literary_work_id).limit(limit).correlate(links)
 
 
 class AuthorDetail(db.Model):
@@ -363,9 +696,15 @@ class AuthorDetail(db.Model):
     middle_name = db.Column(db.String(63), nullable=True)
     nickname = db.Column(db.String(127), nullable=True)
     wikipedia_hyperlink = db.Column(db.String(255), nullable=True)
+    # Collation key of the name in the language, see elibrarian_app.collation
+    sort_key = db.Column(db.String(SORT_KEY_LENGTH), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.PrimaryKeyConstraint('id', 'lang', name='author_id-lang_pkey'),
+        db.Index('ix_authors_details_lang_sort_key', 'lang', 'sort_key',
+                 'id'),
         {},
     )
 
@@ -374,6 +713,9 @@ class AuthorDetail(db.Model):
         self.lang = lang
         self.last_name = last_name
 
+    # Authors are ordered by last name, then by first and middle names
+    SORT_KEY_COLUMNS = ('last_name', 'first_name', 'middle_name')
+
     def to_json(self):
         """Returns JSON representation of authors detailed information."""
         result = {
@@ -404,7 +746,8 @@ class LiteraryWork(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     creation_datestring = db.Column(db.String(63), nullable=True)
     original_lang = db.Column(db.String(3), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
 
     details = db.relationship('LiteraryWorkDetail', backref='literarywork',
                               lazy='dynamic')
@@ -414,6 +757,30 @@ class LiteraryWork(db.Model):
         if original_lang:
             self.original_lang = original_lang
 
+    @staticmethod
+    def get_version(work_id):
+        """
+            Returns (last modification time, contributing rows count) of
+        literary work representation: work itself, its details, links to
+        authors and linked authors with their details. Returns None if literary
+        work does not exist.
+        """
+        a2lw = Authors2LiteraryWorks
+        rows = union_all(
+            select([LiteraryWork.timestamp]).where(
+                LiteraryWork.id == work_id),
+            select([LiteraryWorkDetail.timestamp]).where(
+                LiteraryWorkDetail.literary_work_id == work_id),
+            select([a2lw.timestamp]).where(a2lw.literary_work_id == work_id),
+            select([Author.timestamp]).where(
+                Author.id == a2lw.author_id
+            ).where(a2lw.literary_work_id == work_id),
+            select([AuthorDetail.timestamp]).where(
+                AuthorDetail.id == a2lw.author_id
+            ).where(a2lw.literary_work_id == work_id)
+        ).alias('literary_work_version')
+        return _version_from_rows(rows)
+
     def get_authors(self):
         """
             Returns list of authors (instances of Author objects) belongs to
@@ -435,42 +802,91 @@ class LiteraryWork(db.Model):
         if not details:
             details = self.details.first()
         if details:
-            result = {
-                'title': details.title,
-                'lang': details.lang
-            }
-            if verbose and details.annotation:
-                result['annotation'] = details.annotation
-            return result
+            return details.to_json(verbose=verbose)
         return None
 
-    def to_json(self, lang="en", verbose=False):
+    # Attributes and relations which can be selected in JSON representation
+    JSON_FIELDS = ('id', 'url', 'original_lang', 'creation_datestring',
+                   'title', 'lang', 'annotation')
+    JSON_EMBEDS = ('authors',)
+
+    def to_json(self, lang="en", verbose=False, fields=None, embed=None):
         """
             Returns JSON representation of literary work on a given language
         if available, and verbose if needed.
         """
-        json = {
-            'id': self.id,
-            'url': url_for('api.get_literary_work', work_id=self.id,
-                           _external=True),
-            'original_lang': self.original_lang,
-            'authors': [
-                {
-                    'name': author.get_details(lang=lang)['full_name'],
-                    'id': author.id,
-                    'url': url_for('api.get_author', author_id=author.id,
-                                   _external=True)
-                }
-                for author in self.get_authors()
-            ]
-        }
-        if self.creation_datestring:
-            json['creation_datestring'] = self.creation_datestring
-        # catch-up literary works details
-        details = self.get_details(lang=lang, verbose=verbose)
-        if details:
-            json.update(details)
-        return json
+        return LiteraryWork.to_json_bulk([self], lang=lang, verbose=verbose,
+                                         fields=fields, embed=embed)[0]
+
+    @staticmethod
+    def to_json_bulk(works, lang="en", verbose=False, fields=None,
+                     embed=None, with_urls=True):
+        """
+            Returns JSON representations of given literary works like
+        ``to_json`` does. Details, authors links and authors details are
+        loaded for all works at once with a constant number of queries.
+            ``fields`` limits representation to given attributes (id is always
+        present) and ``embed`` overrides default set of embedded relations
+        (authors). Data required only by not requested attributes and
+        relations is not loaded at all.
+            ``with_urls`` set to False omits all resource URLs, so that the
+        representation doesn't depend on request (see LiteraryWorkCard).
+        """
+        if embed is None:
+            embed = ('authors',)
+        work_ids = [work.id for work in works]
+        details = defaultdict(list)
+        if _wanted(fields, 'title', 'lang', 'annotation'):
+            details = _load_grouped(
+                LiteraryWorkDetail.query.order_by(LiteraryWorkDetail.id),
+                LiteraryWorkDetail.literary_work_id, work_ids,
+                'literary_work_id')
+        links = defaultdict(list)
+        authors_details = defaultdict(list)
+        if 'authors' in embed:
+            links = _load_grouped(
+                Authors2LiteraryWorks.query.order_by(
+                    Authors2LiteraryWorks.author_id),
+                Authors2LiteraryWorks.literary_work_id, work_ids,
+                'literary_work_id')
+            author_ids = set(link.author_id
+                             for work_links in links.values()
+                             for link in work_links)
+            authors_details = _load_grouped(AuthorDetail.query,
+                                            AuthorDetail.id, author_ids, 'id')
+
+        result = []
+        for work in works:
+            json = {'id': work.id}
+            if with_urls and _wanted(fields, 'url'):
+                json['url'] = url_for('api.get_literary_work',
+                                      work_id=work.id, _external=True)
+            if _wanted(fields, 'original_lang'):
+                json['original_lang'] = work.original_lang
+            if 'authors' in embed:
+                json['authors'] = []
+                for link in links[work.id]:
+                    author = {'id': link.author_id}
+                    if with_urls:
+                        author['url'] = url_for('api.get_author',
+                                                author_id=link.author_id,
+                                                _external=True)
+                    author_details = _pick_details(
+                        authors_details[link.author_id], lang)
+                    if author_details:
+                        author['name'] = author_details.to_json()['full_name']
+                    json['authors'].append(author)
+            if work.creation_datestring and \
+                    _wanted(fields, 'creation_datestring'):
+                json['creation_datestring'] = work.creation_datestring
+            # catch-up literary works details
+            work_details = _pick_details(details[work.id], lang)
+            if work_details:
+                for key, value in work_details.to_json(verbose).items():
+                    if _wanted(fields, key):
+                        json[key] = value
+            result.append(json)
+        return result
 
 
 class LiteraryWorkDetail(db.Model):
@@ -484,10 +900,15 @@ class LiteraryWorkDetail(db.Model):
     lang = db.Column(db.String(5), nullable=False)
     title = db.Column(db.String(255), nullable=False)
     annotation = db.Column(db.Text, nullable=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Collation key of the title in the language
+    sort_key = db.Column(db.String(SORT_KEY_LENGTH), nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
 
     __table_args__ = (
         db.UniqueConstraint('literary_work_id', 'lang', name='lw_lang_unique'),
+        db.Index('ix_literary_works_details_lang_sort_key', 'lang',
+                 'sort_key', 'id'),
         {},
     )
 
@@ -500,6 +921,68 @@ class LiteraryWorkDetail(db.Model):
         self.lang = lang
         self.title = title
 
+    SORT_KEY_COLUMNS = ('title',)
+
+    def to_json(self, verbose=False):
+        """Returns JSON representation of literary work detailed information"""
+        result = {
+            'title': self.title,
+            'lang': self.lang
+        }
+        if verbose and self.annotation:
+            result['annotation'] = self.annotation
+        return result
+
+
+@event.listens_for(AuthorDetail, 'before_insert')
+@event.listens_for(AuthorDetail, 'before_update')
+@event.listens_for(LiteraryWorkDetail, 'before_insert')
+@event.listens_for(LiteraryWorkDetail, 'before_update')
+def update_sort_key(mapper, connection, target):
+    """Keeps collation key of title or name up to date"""
+    target.sort_key = sort_key(target.lang, *[
+        getattr(target, name) for name in target.SORT_KEY_COLUMNS])
+
+
+def rebuild_sort_keys(batch_size=IN_CLAUSE_CHUNK):
+    """
+        Recomputes collation keys of all titles and names (e.g. when PyICU
+    was installed), committing every batch. Only changed keys are written.
+    Yields number of processed rows after every batch.
+    """
+    processed = 0
+    for model in (AuthorDetail, LiteraryWorkDetail):
+        table = model.__table__
+        key_columns = list(table.primary_key.columns)
+        value_columns = [table.c.lang] + [table.c[name]
+                                          for name in model.SORT_KEY_COLUMNS]
+        last_key = None
+        while True:
+            query = select(key_columns + value_columns + [table.c.sort_key])
+            if last_key is not None:
+                query = query.where(keys_after(key_columns, last_key))
+            rows = db.session.execute(
+                query.order_by(*key_columns).limit(batch_size)).fetchall()
+            if not rows:
+                break
+            changes = []
+            for row in rows:
+                key = sort_key(*row[len(key_columns):-1])
+                if key != row[-1]:
+                    change = dict(('_' + column.name, value) for column, value
+                                  in zip(key_columns, row))
+                    change['new_sort_key'] = key
+                    changes.append(change)
+            if changes:
+                db.session.execute(table.update().where(and_(*[
+                    column == bindparam('_' + column.name)
+                    for column in key_columns])).values(
+                    sort_key=bindparam('new_sort_key')), changes)
+            db.session.commit()
+            last_key = tuple(rows[-1][:len(key_columns)])
+            processed += len(rows)
+            yield processed
+
 
 class LiteraryWorkStorage(db.Model):
     """Support storing of files - actual literary work (book) data for selected
@@ -509,7 +992,7 @@ class LiteraryWorkStorage(db.Model):
     literary_work_details_id = db.Column(
         db.Integer,
         db.ForeignKey('literary_works_details.id'),
-        nullable=False)
+        nullable=False, index=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     mime_type = db.Column(db.String(63), nullable=False)
@@ -518,7 +1001,176 @@ class LiteraryWorkStorage(db.Model):
     # Allow storing max 2^27=128MB files
     binary_data = db.Column(db.LargeBinary(2 ** 27), nullable=False)
     parent_id = db.Column(db.ForeignKey('literary_works_storage.id'),
-                          default=None, nullable=True)
+                          default=None, nullable=True, index=True)
+    # Content coding (gzip, br, zstd) of precompressed variant of the parent
+    # file, None for original files
+    content_encoding = db.Column(db.String(15), default=None, nullable=True)
+    # SHA-256 of binary data, key of extracted metadata and covers
+    checksum = db.Column(db.String(64), nullable=True, index=True)
+
+    @staticmethod
+    def get_original(work_id, file_id, load_data=True):
+        """
+            Returns active original (not precompressed) file of literary work
+        or None. Without ``load_data`` file data is loaded on access only.
+        """
+        query = LiteraryWorkStorage.query
+        if not load_data:
+            query = query.options(defer('binary_data'))
+        return query.filter_by(
+            id=file_id, is_active=True, content_encoding=None
+        ).join(
+            LiteraryWorkDetail,
+            LiteraryWorkDetail.id == LiteraryWorkStorage.literary_work_details_id
+        ).filter(LiteraryWorkDetail.literary_work_id == work_id).first()
+
+    @staticmethod
+    def read_data(file_id, chunk_size):
+        """
+            Returns (size, chunks iterator) of stored file data. Every chunk
+        is read by a query of its own, so the file is never loaded whole.
+        """
+        storage = LiteraryWorkStorage
+        size = db.session.query(func.length(storage.binary_data)).filter(
+            storage.id == file_id).scalar() or 0
+
+        def chunks():
+            for start in range(0, size, chunk_size):
+                data = db.session.query(func.substr(
+                    storage.binary_data, start + 1, chunk_size
+                )).filter(storage.id == file_id).scalar()
+                if data is None:
+                    # The file was deleted meanwhile
+                    return
+                # Drivers may return buffers
+                yield bytes(data)
+
+        return size, chunks()
+
+    def get_variants_encodings(self):
+        """Returns {content encoding: file id} of precompressed variants"""
+        return dict(LiteraryWorkStorage.query.filter_by(
+            parent_id=self.id, is_active=True
+        ).filter(
+            LiteraryWorkStorage.content_encoding.isnot(None)
+        ).with_entities(LiteraryWorkStorage.content_encoding,
+                        LiteraryWorkStorage.id))
+
+    def make_variant(self, encoding, data):
+        """Returns new precompressed variant of the file"""
+        return LiteraryWorkStorage(
+            literary_work_details_id=self.literary_work_details_id,
+            mime_type=self.mime_type,
+            original_file_name=self.original_file_name,
+            original_file_ext=self.original_file_ext,
+            binary_data=data,
+            parent_id=self.id,
+            content_encoding=encoding)
+
+
+@event.listens_for(LiteraryWorkStorage.binary_data, 'set')
+def update_checksum(target, value, oldvalue, initiator):
+    """Keeps checksum of stored file data up to date"""
+    target.checksum = hashlib.sha256(value).hexdigest() \
+        if value is not None else None
+
+
+class BookFileMetadata(db.Model):
+    """
+        Metadata extracted from stored book file (EPUB, FB2) by
+    "extract_book_files" job, see elibrarian_app.extraction. Keyed by
+    checksum of the file data, so files of the same content share it. Files
+    which could not be parsed get a row with error, so they are not retried.
+    """
+    __tablename__ = 'book_file_metadata'
+    checksum = db.Column(db.String(64), primary_key=True)
+    format = db.Column(db.String(15), nullable=True)
+    title = db.Column(db.String(255), nullable=True)
+    # JSON list of authors names
+    authors = db.Column(db.Text, nullable=False, default='[]')
+    lang = db.Column(db.String(15), nullable=True)
+    # Estimated from text length
+    page_count = db.Column(db.Integer, nullable=True)
+    # JSON of other embedded metadata: publisher, date, identifier...
+    details = db.Column(db.Text, nullable=False, default='{}')
+    error = db.Column(db.Text, nullable=True)
+    extracted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_json(self, work_id, file_id):
+        """Returns JSON representation with URLs of cover sizes"""
+        covers = db.session.query(BookCover.size, BookCover.width,
+                                  BookCover.height).filter_by(
+            checksum=self.checksum).order_by(BookCover.width)
+        return {
+            'format': self.format,
+            'title': self.title,
+            'authors': json_loads(self.authors),
+            'lang': self.lang,
+            'page_count': self.page_count,
+            'details': json_loads(self.details),
+            'error': self.error,
+            'covers': [{
+                'size': size,
+                'width': width,
+                'height': height,
+                'url': url_for('api.get_literary_work_file_cover',
+                               work_id=work_id, file_id=file_id, size=size,
+                               _external=True)
+            } for size, width, height in covers]
+        }
+
+
+class BookCover(db.Model):
+    """
+        Cover image of book file content: the original one and thumbnails
+    of ELIBRARIAN_COVER_SIZES.
+    """
+    __tablename__ = 'book_covers'
+    checksum = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.String(15), primary_key=True)
+    mime_type = db.Column(db.String(63), nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+
+class BookTextIndex(db.Model):
+    """
+        Full-text index state of book file content in the language of its
+    literary work details, see elibrarian_app.content_index. Keyed by
+    checksum, so only files of changed data get indexed again. Files which
+    text could not be extracted get a row with error.
+    """
+    __tablename__ = 'book_text_index'
+    checksum = db.Column(db.String(64), primary_key=True)
+    lang = db.Column(db.String(5), primary_key=True)
+    chunks = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    indexed = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class BookTextChunk(db.Model):
+    """
+        Passage of indexed book text, search hits are chunks. On PostgreSQL
+    the table also has "search_vector" tsvector column with GIN index, added
+    by migration; other databases index words of chunks in BookTextTerm.
+    """
+    __tablename__ = 'book_text_chunks'
+    checksum = db.Column(db.String(64), primary_key=True)
+    lang = db.Column(db.String(5), primary_key=True)
+    chunk_no = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    text = db.Column(db.Text, nullable=False)
+
+
+class BookTextTerm(db.Model):
+    """Inverted index of words of text chunks, used without tsvector"""
+    __tablename__ = 'book_text_terms'
+    term = db.Column(db.String(64), primary_key=True)
+    lang = db.Column(db.String(5), primary_key=True)
+    checksum = db.Column(db.String(64), primary_key=True)
+    chunk_no = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    # Occurrences of the word in the chunk
+    count = db.Column(db.Integer, nullable=False)
 
 
 class BookSeries(db.Model):
@@ -585,10 +1237,13 @@ class Authors2LiteraryWorks(db.Model):
     author_id = db.Column(db.Integer,
                           db.ForeignKey('authors.id'),
                           primary_key=True)
+    # Leading column of primary key is author_id, works are looked up by
+    # their authors with a separate index
     literary_work_id = db.Column(db.Integer,
                                  db.ForeignKey('literary_works.id'),
-                                 primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+                                 primary_key=True, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          onupdate=datetime.utcnow)
 
     literary_works = db.relationship('LiteraryWork', backref="author_assocs")
 
@@ -602,7 +1257,7 @@ class BookSeriesSnap(db.Model):
                                  primary_key=True)
     series_id = db.Column(db.Integer,
                           db.ForeignKey('literary_works_series.id'),
-                          primary_key=True)
+                          primary_key=True, index=True)
     position = db.Column(db.Integer, primary_key=True)
 
 
@@ -614,7 +1269,7 @@ class BookGenreSnap(db.Model):
                                  db.ForeignKey('literary_works.id'),
                                  primary_key=True)
     genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'),
-                         primary_key=True)
+                         primary_key=True, index=True)
 
 
 # ----=[ user relations with the library ]=------------------------------------
@@ -624,40 +1279,774 @@ class AuthUserPersonalLibrary(db.Model):
     __tablename__ = "users_personal_library"
     user_id = db.Column(db.Integer, db.ForeignKey('auth_users.id'))
     literary_work_id = db.Column(db.Integer,
-                                 db.ForeignKey('literary_works.id'))
+                                 db.ForeignKey('literary_works.id'),
+                                 index=True)
     __table_args__ = (
         db.PrimaryKeyConstraint('user_id', 'literary_work_id'),
         {},
     )
-    # Special flags about book in user's personal collection
-    plan_to_read = db.Column(db.Boolean, default=False, nullable=False)
-    read_flag = db.Column(db.Boolean, default=False, nullable=False)
+    # Special flags about book in user's personal collection. Columns counted
+    # in LiteraryWorkCounters keep their old value when changed on an expired
+    # entry, so update_work_counters can subtract the old contribution
+    plan_to_read = db.column_property(
+        db.Column(db.Boolean, default=False, nullable=False),
+        active_history=True)
+    read_flag = db.column_property(
+        db.Column(db.Boolean, default=False, nullable=False),
+        active_history=True)
     # read progress percentage, not null indicating that user start to read a
     # book
-    read_progress = db.Column(db.Integer, default=None, nullable=True)
+    read_progress = db.column_property(
+        db.Column(db.Integer, default=None, nullable=True),
+        active_history=True)
     read_date = db.Column(db.Date, nullable=True)
-    rating = db.Column(db.Integer, nullable=True)
+    _rating = db.column_property(db.Column('rating', db.Integer,
+                                           nullable=True),
+                                 active_history=True)
     comment = db.Column(db.Text, nullable=True)
 
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def __init__(self):
-        super(AuthUserPersonalLibrary, self).__init__()
-        self.plan_to_read = False
-        self.read_flag = False
+    def __init__(self, **kwargs):
+        super(AuthUserPersonalLibrary, self).__init__(**kwargs)
+        if self.plan_to_read is None:
+            self.plan_to_read = False
+        if self.read_flag is None:
+            self.read_flag = False
 
-    @property
-    def rating(self):
+    def _get_rating(self):
         """Return book rating by a given user"""
-        return self.rating
+        return self._rating
 
-    @rating.setter
-    def rating(self, rating):
+    def _set_rating(self, rating):
         """Set personal book rating for a given user"""
+        AuthUserPersonalLibrary.check_rating(rating)
+        self._rating = rating
+
+    @staticmethod
+    def check_rating(rating):
+        """Raises TypeError or ValueError for invalid rating"""
+        if rating is None:
+            return
         error_msg = "Rating should be integer or float in range 0.0,...,5.0"
-        if not (isinstance(rating, float) or isinstance(rating, int)):
+        if isinstance(rating, bool) or \
+                not (isinstance(rating, float) or isinstance(rating, int)):
             raise TypeError(error_msg)
-        if 0 <= rating <= 5:
-            self.rating = rating
-        else:
+        if not 0 <= rating <= 5:
             raise ValueError(error_msg)
+
+    rating = db.synonym('_rating', descriptor=property(_get_rating,
+                                                       _set_rating))
+
+    def counters_contribution(self, committed=False):
+        """
+            Contribution of the entry to its literary work counters, as
+        (literary work id, LiteraryWorkCounters.contribution() tuple). With
+        ``committed`` values loaded from database are used.
+        """
+        if committed:
+            values = []
+            for name in ('literary_work_id', 'read_flag', 'read_progress',
+                         'plan_to_read', '_rating'):
+                history = get_history(self, name)
+                old = history.deleted or history.unchanged
+                values.append(old[0] if old else None)
+        else:
+            values = [self.literary_work_id, self.read_flag,
+                      self.read_progress, self.plan_to_read, self._rating]
+        return values[0], LiteraryWorkCounters.contribution(*values[1:])
+
+    # Columns of shelf entry given to bulk_upsert and their defaults
+    SHELF_FIELDS = ('plan_to_read', 'read_flag', 'read_progress', 'read_date',
+                    'rating')
+    SHELF_DEFAULTS = {'plan_to_read': False, 'read_flag': False,
+                      'read_progress': None, 'read_date': None,
+                      'rating': None}
+
+    @staticmethod
+    def clean_entry(entry):
+        """
+            Validated values of shelf entry: dictionary of literary_work_id
+        and any of SHELF_FIELDS, read_date may be given as "YYYY-MM-DD"
+        string. Raises TypeError or ValueError.
+        """
+        if not isinstance(entry, dict):
+            raise TypeError("Entry should be an object")
+        unknown = set(entry) - set(AuthUserPersonalLibrary.SHELF_FIELDS) - \
+            {'literary_work_id'}
+        if unknown:
+            raise ValueError("Unknown fields: {0}".format(
+                ', '.join(sorted(unknown))))
+        values = dict(entry)
+        work_id = values.get('literary_work_id')
+        if isinstance(work_id, bool) or not isinstance(work_id, int):
+            raise TypeError("literary_work_id should be integer")
+        for name in ('plan_to_read', 'read_flag'):
+            if name in values and not isinstance(values[name], bool):
+                raise TypeError("{0} should be boolean".format(name))
+        progress = values.get('read_progress')
+        if progress is not None:
+            if isinstance(progress, bool) or not isinstance(progress, int):
+                raise TypeError("read_progress should be integer")
+            if not 0 <= progress <= 100:
+                raise ValueError("read_progress should be in range 0,...,100")
+        read_date = values.get('read_date')
+        if isinstance(read_date, str):
+            try:
+                values['read_date'] = datetime.strptime(read_date,
+                                                        '%Y-%m-%d').date()
+            except ValueError:
+                raise ValueError("read_date should be YYYY-MM-DD date")
+        elif read_date is not None and not isinstance(read_date, date):
+            raise TypeError("read_date should be YYYY-MM-DD date")
+        AuthUserPersonalLibrary.check_rating(values.get('rating'))
+        return values
+
+    @staticmethod
+    def bulk_upsert(session, user_id, entries):
+        """
+            Creates or updates user's shelf entries with a constant number of
+        statements: entries are validated in Python, then new rows are
+        inserted and existing ones updated with executemany, fields missing
+        in an entry keep their values. Literary works counters are adjusted
+        in the same transaction, which the caller commits.
+            Returns list of results in the order of entries: dictionaries of
+        literary_work_id, status ("created", "updated" or "error") and error
+        message.
+        """
+        library = AuthUserPersonalLibrary
+        table = library.__table__
+        results = [None] * len(entries)
+        cleaned = {}
+        for index, entry in enumerate(entries):
+            try:
+                values = library.clean_entry(entry)
+            except (TypeError, ValueError) as exc:
+                results[index] = {'literary_work_id': None, 'status': 'error',
+                                  'message': str(exc)}
+                continue
+            work_id = values.pop('literary_work_id')
+            if work_id in cleaned:
+                results[index] = {
+                    'literary_work_id': work_id, 'status': 'error',
+                    'message': 'Duplicated entry of literary work'}
+                continue
+            cleaned[work_id] = (index, values)
+        work_ids = sorted(cleaned)
+        known = set()
+        existing = {}
+        for start in range(0, len(work_ids), IN_CLAUSE_CHUNK):
+            chunk = work_ids[start:start + IN_CLAUSE_CHUNK]
+            known.update(row[0] for row in session.query(
+                LiteraryWork.id).filter(LiteraryWork.id.in_(chunk)))
+            for row in session.execute(select(
+                    [table.c.literary_work_id] +
+                    [table.c[name] for name in library.SHELF_FIELDS]).where(
+                    table.c.user_id == user_id).where(
+                    table.c.literary_work_id.in_(chunk))):
+                existing[row[0]] = dict(zip(library.SHELF_FIELDS, row[1:]))
+        now = datetime.utcnow()
+        deltas = defaultdict(lambda: (0, 0, 0, 0, 0))
+
+        def add(work_id, row, sign):
+            contribution = LiteraryWorkCounters.contribution(
+                row['read_flag'], row['read_progress'], row['plan_to_read'],
+                row['rating'])
+            deltas[work_id] = tuple(old + sign * value for old, value in zip(
+                deltas[work_id], contribution))
+
+        inserts = []
+        updates = []
+        for work_id in work_ids:
+            index, values = cleaned[work_id]
+            if work_id not in known:
+                results[index] = {'literary_work_id': work_id,
+                                  'status': 'error',
+                                  'message': 'Unknown literary work'}
+                continue
+            old = existing.get(work_id)
+            row = dict(library.SHELF_DEFAULTS if old is None else old)
+            row.update(values)
+            add(work_id, row, 1)
+            if old is None:
+                row.update(user_id=user_id, literary_work_id=work_id,
+                           timestamp=now)
+                inserts.append(row)
+                status = 'created'
+            else:
+                add(work_id, old, -1)
+                change = dict(('new_' + name, value)
+                              for name, value in row.items())
+                change.update(key_literary_work_id=work_id, new_timestamp=now)
+                updates.append(change)
+                status = 'updated'
+            results[index] = {'literary_work_id': work_id, 'status': status,
+                              'message': None}
+        if inserts:
+            session.execute(table.insert(), inserts)
+        if updates:
+            session.execute(table.update().where(
+                table.c.user_id == user_id
+            ).where(
+                table.c.literary_work_id == bindparam('key_literary_work_id')
+            ).values(dict(
+                (name, bindparam('new_' + name))
+                for name in library.SHELF_FIELDS + ('timestamp',))), updates)
+        LiteraryWorkCounters.apply_deltas(session, deltas)
+        return results
+
+
+class LiteraryWorkCounters(db.Model):
+    """
+        Denormalized statistics of literary work in personal libraries,
+    serving listings sorted by popularity and rating. Counters are changed
+    incrementally within the transaction which changes personal libraries
+    entries, "reconcile_work_counters" job recounts them periodically.
+        Every literary work has its counters row, so sorted listing is a
+    single index scan.
+    """
+    __tablename__ = 'literary_work_counters'
+    # No foreign key: counters of deleted work are removed after the work
+    literary_work_id = db.Column(db.Integer, primary_key=True)
+    # Users who have read or are reading the work
+    readers_count = db.Column(db.Integer, nullable=False, default=0)
+    reading_count = db.Column(db.Integer, nullable=False, default=0)
+    plan_to_read_count = db.Column(db.Integer, nullable=False, default=0)
+    ratings_count = db.Column(db.Integer, nullable=False, default=0)
+    ratings_sum = db.Column(db.Integer, nullable=False, default=0)
+    # Average rating, 0 for unrated works
+    rating_avg = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (
+        db.Index('ix_literary_work_counters_popular', 'readers_count',
+                 'literary_work_id'),
+        db.Index('ix_literary_work_counters_rating', 'rating_avg',
+                 'ratings_count', 'literary_work_id'),
+    )
+
+    COUNTERS = ('readers_count', 'reading_count', 'plan_to_read_count',
+                'ratings_count', 'ratings_sum')
+    SORTS = ('popular', 'rating')
+
+    @staticmethod
+    def contribution(read_flag, read_progress, plan_to_read, rating):
+        """Values added to COUNTERS by a personal library entry"""
+        reading = read_progress is not None and not read_flag
+        return (int(bool(read_flag) or read_progress is not None),
+                int(reading),
+                int(bool(plan_to_read)),
+                int(rating is not None),
+                rating or 0)
+
+    @staticmethod
+    def new_row(work_id, counts=(0, 0, 0, 0, 0)):
+        """Counters table row of given COUNTERS values"""
+        row = dict(zip(LiteraryWorkCounters.COUNTERS, counts))
+        row['literary_work_id'] = work_id
+        row['rating_avg'] = counts[4] / float(counts[3]) if counts[3] else 0.0
+        return row
+
+    @staticmethod
+    def sorted_query(sort):
+        """Query of counters rows in given sort order (one of SORTS)"""
+        counters = LiteraryWorkCounters
+        if sort == 'popular':
+            order = (counters.readers_count.desc(),
+                     counters.literary_work_id.desc())
+        else:
+            order = (counters.rating_avg.desc(), counters.ratings_count.desc(),
+                     counters.literary_work_id.desc())
+        return counters.query.order_by(*order)
+
+    @staticmethod
+    def apply_deltas(session, deltas):
+        """
+            Adds deltas (work id -> COUNTERS deltas tuple) to counters rows,
+        rows missing yet are created.
+        """
+        table = LiteraryWorkCounters.__table__
+        for work_id, delta in sorted(deltas.items()):
+            if not any(delta):
+                continue
+            values = dict((name, table.c[name] + value)
+                          for name, value in zip(
+                              LiteraryWorkCounters.COUNTERS, delta))
+            # Right hand side of SET sees values before the update
+            ratings_count = table.c.ratings_count + delta[3]
+            values['rating_avg'] = case(
+                [(ratings_count > 0,
+                  (table.c.ratings_sum + delta[4]) * 1.0 / ratings_count)],
+                else_=0.0)
+            result = session.execute(table.update().where(
+                table.c.literary_work_id == work_id).values(values))
+            if result.rowcount == 0:
+                session.execute(table.insert(), [
+                    LiteraryWorkCounters.new_row(work_id, delta)])
+
+    @staticmethod
+    def reconcile(batch_size=IN_CLAUSE_CHUNK):
+        """
+            Recounts counters of all literary works from personal libraries,
+        committing every batch. Missing rows are created, rows of deleted
+        works removed. Yields (processed works, fixed rows) after every
+        batch.
+        """
+        table = LiteraryWorkCounters.__table__
+        library = AuthUserPersonalLibrary
+        db.session.execute(table.delete().where(
+            ~table.c.literary_work_id.in_(select([LiteraryWork.id]))))
+        db.session.commit()
+        last_id = 0
+        processed = fixed = 0
+        while True:
+            ids = [row[0] for row in db.session.query(LiteraryWork.id).filter(
+                LiteraryWork.id > last_id).order_by(
+                LiteraryWork.id).limit(batch_size)]
+            if not ids:
+                break
+            expected = dict((work_id, (0, 0, 0, 0, 0)) for work_id in ids)
+            entries = db.session.query(
+                library.literary_work_id, library.read_flag,
+                library.read_progress, library.plan_to_read, library._rating
+            ).filter(library.literary_work_id.in_(ids))
+            for entry in entries:
+                contribution = LiteraryWorkCounters.contribution(*entry[1:])
+                expected[entry[0]] = tuple(
+                    map(sum, zip(expected[entry[0]], contribution)))
+            actual = dict(
+                (row[0], tuple(row[1:])) for row in db.session.query(
+                    table.c.literary_work_id,
+                    *[table.c[name] for name in LiteraryWorkCounters.COUNTERS]
+                ).filter(table.c.literary_work_id.in_(ids)))
+            for work_id, counts in expected.items():
+                if actual.get(work_id) == counts:
+                    continue
+                fixed += 1
+                if work_id in actual:
+                    LiteraryWorkCounters.apply_deltas(db.session, {
+                        work_id: tuple(new - old for new, old in zip(
+                            counts, actual[work_id]))})
+                else:
+                    db.session.execute(table.insert(), [
+                        LiteraryWorkCounters.new_row(work_id, counts)])
+            db.session.commit()
+            last_id = ids[-1]
+            processed += len(ids)
+            yield processed, fixed
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def update_work_counters(session, flush_context):
+    """
+        Applies changes of personal libraries entries to literary works
+    counters within the same transaction, creates counters of new works and
+    removes counters of deleted ones.
+    """
+    deltas = defaultdict(lambda: (0, 0, 0, 0, 0))
+
+    def add(work_id, values, sign):
+        if work_id is not None:
+            deltas[work_id] = tuple(old + sign * value for old, value in zip(
+                deltas[work_id], values))
+
+    new_work_ids = []
+    deleted_work_ids = []
+    for obj in session.new:
+        if isinstance(obj, AuthUserPersonalLibrary):
+            add(*obj.counters_contribution(), sign=1)
+        elif isinstance(obj, LiteraryWork):
+            new_work_ids.append(obj.id)
+    for obj in session.dirty:
+        if isinstance(obj, AuthUserPersonalLibrary) and \
+                session.is_modified(obj, include_collections=False):
+            add(*obj.counters_contribution(committed=True), sign=-1)
+            add(*obj.counters_contribution(), sign=1)
+    for obj in session.deleted:
+        if isinstance(obj, AuthUserPersonalLibrary):
+            add(*obj.counters_contribution(committed=True), sign=-1)
+        elif isinstance(obj, LiteraryWork):
+            deleted_work_ids.append(obj.id)
+    table = LiteraryWorkCounters.__table__
+    if new_work_ids:
+        session.execute(table.insert(), [
+            LiteraryWorkCounters.new_row(work_id) for work_id in new_work_ids])
+    if deltas:
+        LiteraryWorkCounters.apply_deltas(session, deltas)
+    for start in range(0, len(deleted_work_ids), IN_CLAUSE_CHUNK):
+        session.execute(table.delete().where(table.c.literary_work_id.in_(
+            deleted_work_ids[start:start + IN_CLAUSE_CHUNK])))
+
+
+# ----=[ catalogue changes tracking ]=-----------------------------------------
+class CatalogueChange(db.Model):
+    """
+        Append-only log of catalogue changes. Sequence number is monotonically
+    increasing and serves as a cursor for incremental synchronization.
+    """
+    __tablename__ = 'catalogue_changes'
+    UPSERT = 'upsert'
+    DELETE = 'delete'
+
+    seq = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(31), nullable=False)
+    # Primary key of changed row, composite keys are joined with ":"
+    entity_id = db.Column(db.String(63), nullable=False)
+    operation = db.Column(db.String(7), nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow,
+                          nullable=False)
+
+    # Tracked models and names of their entities in the changes log
+    TRACKED = (
+        (Author, 'author'),
+        (AuthorDetail, 'author_detail'),
+        (LiteraryWork, 'literary_work'),
+        (LiteraryWorkDetail, 'literary_work_detail'),
+        (Authors2LiteraryWorks, 'author_literary_work'),
+    )
+
+    @staticmethod
+    def entity_name(obj):
+        """Returns entity name of tracked object or None"""
+        for model, name in CatalogueChange.TRACKED:
+            if isinstance(obj, model):
+                return name
+        return None
+
+    @staticmethod
+    def entity_key(obj):
+        """Returns primary key of object as a string"""
+        return ':'.join(
+            str(value)
+            for value in object_mapper(obj).primary_key_from_instance(obj))
+
+    @staticmethod
+    def read_since(seq, limit=None):
+        """
+            Returns changes after ``seq`` in sequence order, up to the first
+        gap of sequence numbers younger than ELIBRARIAN_CHANGES_GAP_TIMEOUT:
+        the missing change may belong to a transaction flushed earlier and
+        committed later, which must not be skipped by cursors. Older gaps are
+        taken for rolled back transactions. So a change is still missed if
+        its transaction commits more than the timeout after its flush.
+        """
+        query = CatalogueChange.query.filter(
+            CatalogueChange.seq > seq).order_by(CatalogueChange.seq)
+        if limit is not None:
+            query = query.limit(limit)
+        settled = CatalogueChange.settled_before()
+        changes = []
+        for change in query:
+            if change.seq != seq + 1 and change.timestamp > settled:
+                break
+            changes.append(change)
+            seq = change.seq
+        return changes
+
+    @staticmethod
+    def settled_before():
+        """Changes flushed before this time are committed or rolled back"""
+        return datetime.utcnow() - timedelta(
+            seconds=current_app.config['ELIBRARIAN_CHANGES_GAP_TIMEOUT'])
+
+    def to_json(self):
+        """Returns JSON representation of change log entry"""
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'operation': self.operation,
+            'timestamp': self.timestamp.isoformat()
+        }
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def record_catalogue_changes(session, flush_context):
+    """
+        Writes changes of catalogue rows into the changes log within the same
+    transaction as the changes themselves.
+    """
+    rows = []
+    changes = ((session.new, CatalogueChange.UPSERT),
+               (session.dirty, CatalogueChange.UPSERT),
+               (session.deleted, CatalogueChange.DELETE))
+    for objects, operation in changes:
+        for obj in objects:
+            entity = CatalogueChange.entity_name(obj)
+            if entity is None:
+                continue
+            if objects is session.dirty and \
+                    not session.is_modified(obj, include_collections=False):
+                continue
+            rows.append({
+                'entity': entity,
+                'entity_id': CatalogueChange.entity_key(obj),
+                'operation': operation
+            })
+    if rows:
+        session.execute(CatalogueChange.__table__.insert(), rows)
+
+
+# ----=[ materialized read models ]=-------------------------------------------
+class LiteraryWorkCard(db.Model):
+    """
+        Denormalized ready-to-serve summary of literary work in a language,
+    with language fallbacks already resolved. Cards are built for languages
+    listed in ELIBRARIAN_WORK_CARD_LANGS and refreshed within the transaction
+    which changes any contributing row: literary work, its details, authors
+    links, linked authors and their details.
+        Primary key starts with language, so a page of cards is a single
+    index range scan.
+    """
+    __tablename__ = 'literary_work_cards'
+    lang = db.Column(db.String(5), primary_key=True)
+    # No foreign key: card of deleted work is removed only at commit time
+    literary_work_id = db.Column(db.Integer, primary_key=True, index=True)
+    # JSON representation of literary work without resource URLs
+    card = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_json(self):
+        """Returns card representation completed with resource URLs"""
+        json = json_loads(self.card)
+        json['url'] = url_for('api.get_literary_work',
+                              work_id=self.literary_work_id, _external=True)
+        for author in json.get('authors', ()):
+            author['url'] = url_for('api.get_author', author_id=author['id'],
+                                    _external=True)
+        return json
+
+    @staticmethod
+    def build(work_ids, langs):
+        """Returns cards table rows for given literary works and languages"""
+        works, _ = load_by_ids(LiteraryWork, list(work_ids))
+        now = datetime.utcnow()
+        rows = []
+        for lang in langs:
+            for card in LiteraryWork.to_json_bulk(works, lang=lang,
+                                                  with_urls=False):
+                rows.append({
+                    'lang': lang,
+                    'literary_work_id': card['id'],
+                    'card': json_dumps(card, separators=(',', ':')),
+                    'timestamp': now
+                })
+        return rows
+
+    @staticmethod
+    def refresh(session, work_ids, langs):
+        """Replaces cards of given literary works with freshly built ones"""
+        table = LiteraryWorkCard.__table__
+        work_ids = list(work_ids)
+        for start in range(0, len(work_ids), IN_CLAUSE_CHUNK):
+            chunk = work_ids[start:start + IN_CLAUSE_CHUNK]
+            session.execute(
+                table.delete().where(table.c.literary_work_id.in_(chunk)))
+            rows = LiteraryWorkCard.build(chunk, langs)
+            if rows:
+                session.execute(table.insert(), rows)
+
+    @staticmethod
+    def rebuild_all(batch_size=IN_CLAUSE_CHUNK):
+        """
+            Rebuilds cards of all literary works, committing every batch.
+            Yields number of processed literary works after every batch.
+        """
+        langs = current_app.config['ELIBRARIAN_WORK_CARD_LANGS']
+        db.session.execute(LiteraryWorkCard.__table__.delete())
+        db.session.commit()
+        last_id = 0
+        processed = 0
+        while True:
+            ids = [row[0] for row in db.session.query(LiteraryWork.id).filter(
+                LiteraryWork.id > last_id).order_by(
+                LiteraryWork.id).limit(batch_size)]
+            if not ids:
+                break
+            LiteraryWorkCard.refresh(db.session, ids, langs)
+            db.session.commit()
+            last_id = ids[-1]
+            processed += len(ids)
+            yield processed
+
+
+WORK_CARDS_PENDING = 'work_cards_pending'
+
+
+def _work_cards_enabled(session):
+    """Cards are maintained only if enabled in application config"""
+    app = getattr(session, 'app', None)
+    return app is not None and app.config.get('ELIBRARIAN_WORK_CARDS')
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def track_work_cards_changes(session, flush_context):
+    """Remember literary works and authors whose cards should be refreshed"""
+    if not _work_cards_enabled(session):
+        return
+    work_ids, author_ids = session.info.setdefault(WORK_CARDS_PENDING,
+                                                   (set(), set()))
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, LiteraryWork):
+            work_ids.add(obj.id)
+        elif isinstance(obj, (LiteraryWorkDetail, Authors2LiteraryWorks)):
+            work_ids.add(obj.literary_work_id)
+        elif isinstance(obj, (Author, AuthorDetail)):
+            author_ids.add(obj.id)
+
+
+@event.listens_for(SignallingSession, 'before_commit')
+def refresh_work_cards(session):
+    """Refresh cards of changed literary works before transaction commits"""
+    if not _work_cards_enabled(session):
+        return
+    work_ids, author_ids = set(), set()
+    while True:
+        # Commit flushes after this hook, so flush now to see all changes
+        session.flush()
+        pending = session.info.pop(WORK_CARDS_PENDING, None)
+        if not pending:
+            break
+        work_ids.update(pending[0])
+        author_ids.update(pending[1])
+    if author_ids:
+        links = _load_grouped(Authors2LiteraryWorks.query,
+                              Authors2LiteraryWorks.author_id, author_ids,
+                              'author_id')
+        work_ids.update(link.literary_work_id
+                        for author_links in links.values()
+                        for link in author_links)
+    if work_ids:
+        LiteraryWorkCard.refresh(session, work_ids,
+                                 session.app.config[
+                                     'ELIBRARIAN_WORK_CARD_LANGS'])
+
+
+@event.listens_for(SignallingSession, 'after_rollback')
+def forget_work_cards_changes(session):
+    """Changes are rolled back, so cards stay as they are"""
+    session.info.pop(WORK_CARDS_PENDING, None)
+
+
+class LiteraryWorkNeighbour(db.Model):
+    """
+        Precomputed "readers also read" neighbours of literary work: works
+    most often read by the same users, ranked by cosine similarity of their
+    readers sets. Built offline by elibrarian_app.recommendations
+    ("rebuild_recommendations" job), serves similar works and personal
+    suggestions.
+    """
+    __tablename__ = 'literary_work_neighbours'
+    # No foreign keys: neighbours of deleted works are removed by rebuild
+    literary_work_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbour_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    @staticmethod
+    def replace(session, neighbours):
+        """
+            Replaces neighbours of literary works with given (work id,
+        [(neighbour id, score), ...]) pairs, best neighbour first.
+        """
+        table = LiteraryWorkNeighbour.__table__
+        work_ids = [work_id for work_id, _ in neighbours]
+        for start in range(0, len(work_ids), IN_CLAUSE_CHUNK):
+            session.execute(table.delete().where(table.c.literary_work_id.in_(
+                work_ids[start:start + IN_CLAUSE_CHUNK])))
+        rows = [{'literary_work_id': work_id, 'rank': rank,
+                 'neighbour_id': neighbour_id, 'score': score}
+                for work_id, items in neighbours
+                for rank, (neighbour_id, score) in enumerate(items, 1)]
+        if rows:
+            session.execute(table.insert(), rows)
+
+    @staticmethod
+    def similar(work_id, limit):
+        """Neighbours of literary work as (neighbour id, score) pairs"""
+        neighbours = LiteraryWorkNeighbour
+        return db.session.query(
+            neighbours.neighbour_id, neighbours.score
+        ).filter(neighbours.literary_work_id == work_id).order_by(
+            neighbours.rank).limit(limit).all()
+
+    @staticmethod
+    def suggestions(user_id, limit, seeds):
+        """
+            Works suggested to user as (work id, score) pairs: neighbours of
+        ``seeds`` most recently read works of user's personal library, scored
+        by sum of similarities. Works already in the library are excluded.
+        """
+        library = AuthUserPersonalLibrary
+        neighbours = LiteraryWorkNeighbour
+        seed_ids = [row[0] for row in db.session.query(
+            library.literary_work_id
+        ).filter(
+            library.user_id == user_id,
+            or_(library.read_flag, library.read_progress.isnot(None))
+        ).order_by(library.timestamp.desc()).limit(seeds)]
+        if not seed_ids:
+            return []
+        owned = db.session.query(library.literary_work_id).filter(
+            library.user_id == user_id)
+        score = func.sum(neighbours.score).label('score')
+        return db.session.query(neighbours.neighbour_id, score).filter(
+            neighbours.literary_work_id.in_(seed_ids),
+            ~neighbours.neighbour_id.in_(owned)
+        ).group_by(neighbours.neighbour_id).order_by(
+            score.desc(), neighbours.neighbour_id).limit(limit).all()
+
+
+# ----=[ background jobs ]=----------------------------------------------------
+class BackgroundJob(db.Model):
+    """
+        Maintenance task queued for the background worker ("manage.py
+    worker"). Job names refer to functions registered in elibrarian_app.jobs,
+    arguments and result are stored as JSON. Job with an idempotency key is
+    queued only once.
+    """
+    __tablename__ = 'background_jobs'
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(63), nullable=False)
+    args = db.Column(db.Text, nullable=False, default='{}')
+    idempotency_key = db.Column(db.String(127), unique=True, nullable=True)
+    status = db.Column(db.String(15), nullable=False, default=QUEUED,
+                       index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    progress = db.Column(db.Float, nullable=True)
+    progress_message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker = db.Column(db.String(127), nullable=True)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started = db.Column(db.DateTime, nullable=True)
+    heartbeat = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+
+    def get_args(self):
+        return json_loads(self.args) if self.args else {}
+
+    def to_json(self):
+        """Returns JSON representation of the job"""
+        return {
+            'id': self.id,
+            'url': url_for('api.get_job', job_id=self.id, _external=True),
+            'name': self.name,
+            'args': self.get_args(),
+            'idempotency_key': self.idempotency_key,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'result': json_loads(self.result) if self.result else None,
+            'error': self.error,
+            'created': self.created.isoformat(),
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None
+        }
@@ -0,0 +1,210 @@
+"""
+    Helpers for Alembic migrations of large tables, which should not lock a
+table for longer than a moment.
+    Conventions:
+    * index of a big table is built with ``create_index_concurrently``. On
+PostgreSQL it runs CREATE INDEX CONCURRENTLY on a separate autocommit
+connection, so writes to the table are not blocked. Other databases get a
+plain index;
+    * data changes are made with ``backfill`` (SQL expressions) or
+``backfill_rows`` (values computed in Python) in batches, every batch in
+its own short transaction, with progress output and a pause between
+batches. ``where`` clause should select only rows which are not backfilled
+yet, then interrupted migration just continues;
+    * these operations go to a migration of their own, without schema
+changes. env.py runs every migration in its own transaction, so the columns
+they depend on are committed before.
+"""
+import time
+from contextlib import contextmanager
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+from .models import keys_after
+
+
+def _setting(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        # Migration run without application context
+        return default
+
+
+def _is_offline():
+    return op.get_context().as_sql
+
+
+def _is_postgresql():
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def _quote(name):
+    return op.get_context().dialect.identifier_preparer.quote(name)
+
+
+@contextmanager
+def _autocommit_connection():
+    """Connection outside of migration transaction, statements autocommit"""
+    connection = op.get_bind().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def _index_exists(index_name, table_name):
+    inspector = sa.inspect(op.get_bind())
+    return any(index['name'] == index_name
+               for index in inspector.get_indexes(table_name))
+
+
+def create_index_concurrently(index_name, table_name, columns, unique=False):
+    """
+        Create index without blocking writes on PostgreSQL. Existing index
+    is kept, invalid index left by interrupted build is rebuilt.
+    """
+    if not _is_postgresql():
+        if _is_offline() or not _index_exists(index_name, table_name):
+            op.create_index(index_name, table_name, columns, unique=unique)
+        return
+    statement = 'CREATE {0}INDEX CONCURRENTLY {1} ON {2} ({3})'.format(
+        'UNIQUE ' if unique else '', _quote(index_name), _quote(table_name),
+        ', '.join(_quote(column) for column in columns))
+    if _is_offline():
+        # CONCURRENTLY is not allowed inside of transaction block
+        op.execute('COMMIT')
+        op.execute(statement)
+        return
+    with _autocommit_connection() as connection:
+        valid = connection.execute(sa.text(
+            'SELECT i.indisvalid FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE c.relname = :name'), name=index_name).scalar()
+        if valid:
+            return
+        if valid is not None:
+            connection.execute('DROP INDEX CONCURRENTLY {0}'.format(
+                _quote(index_name)))
+        connection.execute(statement)
+
+
+def drop_index_concurrently(index_name, table_name):
+    """Drop index without blocking writes on PostgreSQL"""
+    if not _is_postgresql():
+        if _is_offline() or _index_exists(index_name, table_name):
+            op.drop_index(index_name, table_name=table_name)
+        return
+    statement = 'DROP INDEX CONCURRENTLY IF EXISTS {0}'.format(
+        _quote(index_name))
+    if _is_offline():
+        op.execute('COMMIT')
+        op.execute(statement)
+        return
+    with _autocommit_connection() as connection:
+        connection.execute(statement)
+
+
+def print_progress(table_name, done, total):
+    print("  {0}: {1} of {2} rows backfilled".format(table_name, done, total))
+
+
+def backfill(table, values, where=None, key='id', batch_size=None,
+             pause=None, progress=print_progress):
+    """
+        Update rows of ``table`` (``table()`` construct) with ``values``
+    in batches of ``key`` column range. Every batch is committed separately
+    and followed by ``pause`` seconds of sleep, ``progress(table name, done,
+    total)`` is called after every batch. Returns number of updated rows.
+        Batch size and pause default to ELIBRARIAN_MIGRATION_BATCH_SIZE and
+    ELIBRARIAN_MIGRATION_BATCH_PAUSE settings.
+    """
+    condition = where if where is not None else sa.true()
+    if _is_offline():
+        op.execute(table.update().where(condition).values(values))
+        return None
+    if batch_size is None:
+        batch_size = _setting('ELIBRARIAN_MIGRATION_BATCH_SIZE', 1000)
+    if pause is None:
+        pause = _setting('ELIBRARIAN_MIGRATION_BATCH_PAUSE', 0)
+    engine = op.get_bind().engine
+    key_column = table.c[key]
+    total = engine.execute(sa.select([sa.func.count()]).select_from(
+        table).where(condition)).scalar()
+    done = 0
+    last_key = None
+    while True:
+        query = sa.select([key_column]).where(condition)
+        if last_key is not None:
+            query = query.where(key_column > last_key)
+        keys = [row[0] for row in engine.execute(
+            query.order_by(key_column).limit(batch_size))]
+        if not keys:
+            break
+        # Range covers all rows of the last key, even if they did not fit
+        # into the batch, so it is safe for non-unique keys
+        with engine.begin() as connection:
+            result = connection.execute(table.update().where(condition).where(
+                key_column.between(keys[0], keys[-1])).values(values))
+        done += result.rowcount
+        last_key = keys[-1]
+        if progress is not None:
+            progress(table.name, done, total)
+        if pause:
+            time.sleep(pause)
+    return done
+
+
+def backfill_rows(table, key_columns, compute, where, batch_size=None,
+                  pause=None, progress=print_progress):
+    """
+        Update rows of ``table`` (``table()`` construct) selected by
+    ``where`` with values computed in Python: ``compute(row)`` returns
+    dictionary of new column values. Rows are updated by ``key_columns``
+    names, which must be unique together, and are taken in batches ordered
+    by them, so every row is visited once. Returns number of updated rows.
+    """
+    if _is_offline():
+        raise RuntimeError(
+            "Values computed in Python can't be backfilled in offline mode")
+    if batch_size is None:
+        batch_size = _setting('ELIBRARIAN_MIGRATION_BATCH_SIZE', 1000)
+    if pause is None:
+        pause = _setting('ELIBRARIAN_MIGRATION_BATCH_PAUSE', 0)
+    engine = op.get_bind().engine
+    keys = [table.c[name] for name in key_columns]
+    update = table.update().where(sa.and_(*[
+        key == sa.bindparam('key_' + key.name) for key in keys]))
+    total = engine.execute(sa.select([sa.func.count()]).select_from(
+        table).where(where)).scalar()
+    done = 0
+    last_row = None
+    while True:
+        query = sa.select([table]).where(where)
+        if last_row is not None:
+            last_key = [last_row[key] for key in keys]
+            query = query.where(keys_after(keys, last_key))
+        rows = engine.execute(
+            query.order_by(*keys).limit(batch_size)).fetchall()
+        if not rows:
+            break
+        changes = []
+        for row in rows:
+            change = dict(('new_' + name, value)
+                          for name, value in compute(row).items())
+            change.update(('key_' + key.name, row[key]) for key in keys)
+            changes.append(change)
+        names = [name[len('new_'):] for name in changes[0]
+                 if name.startswith('new_')]
+        with engine.begin() as connection:
+            connection.execute(update.values(dict(
+                (name, sa.bindparam('new_' + name)) for name in names)),
+                changes)
+        done += len(rows)
+        last_row = rows[-1]
+        if progress is not None:
+            progress(table.name, done, total)
+        if pause:
+            time.sleep(pause)
+    return done
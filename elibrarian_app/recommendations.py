@@ -0,0 +1,163 @@
+"""
+    Offline "readers also read" recommendations.
+    Personal libraries are streamed into a sparse users x works matrix of
+readers (entries which are read or being read). Item-item cosine similarity
+is computed block by block as sparse product of the matrix with its column
+block, so memory stays bounded by a block of co-occurrences. Top-K
+neighbours of every work are stored in "literary_work_neighbours" table,
+which serves similar works and per-user suggestions without any computation
+at request time.
+    NumPy and SciPy are used if installed, otherwise co-occurrences are
+counted in pure Python, which is fine for small libraries only.
+"""
+import math
+from array import array
+from collections import defaultdict
+from heapq import nlargest
+from flask import current_app
+from sqlalchemy import or_, select
+from . import db
+from .models import AuthUserPersonalLibrary, IN_CLAUSE_CHUNK, \
+    LiteraryWorkNeighbour
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:
+    numpy = sparse = None
+
+FETCH_SIZE = 10000
+
+
+def load_interactions():
+    """
+        Streams (user id, work id) pairs of readers into two integer arrays.
+    Server side cursor is used where supported, so the table is never fully
+    materialized as Python objects.
+    """
+    table = AuthUserPersonalLibrary.__table__
+    query = select([table.c.user_id, table.c.literary_work_id]).where(
+        or_(table.c.read_flag, table.c.read_progress.isnot(None)))
+    result = db.session.connection().execution_options(
+        stream_results=True).execute(query)
+    user_ids, work_ids = array('l'), array('l')
+    while True:
+        rows = result.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for user_id, work_id in rows:
+            user_ids.append(user_id)
+            work_ids.append(work_id)
+    return user_ids, work_ids
+
+
+def _top(candidates, neighbours):
+    return nlargest(neighbours, candidates, key=lambda item: (item[1],
+                                                              -item[0]))
+
+
+def iter_neighbours_numpy(user_ids, work_ids, neighbours, min_common,
+                          block_size):
+    """Yields (work id, [(neighbour id, score), ...]) computed with SciPy"""
+    works, work_index = numpy.unique(numpy.frombuffer(work_ids, dtype='l'),
+                                     return_inverse=True)
+    users, user_index = numpy.unique(numpy.frombuffer(user_ids, dtype='l'),
+                                     return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (numpy.ones(len(work_index), dtype=numpy.float32),
+         (user_index, work_index)), shape=(len(users), len(works)))
+    # Duplicated pairs are summed up, every reader counts once
+    matrix.data[:] = 1
+    norms = numpy.sqrt(numpy.asarray(matrix.sum(axis=0)).ravel())
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(works), block_size):
+        end = min(start + block_size, len(works))
+        # Co-occurrences of all works with the block: works x block
+        block = transposed.dot(matrix[:, start:end]).tocsc()
+        for column in range(end - start):
+            work = start + column
+            rows = block.indices[block.indptr[column]:block.indptr[column + 1]]
+            common = block.data[block.indptr[column]:block.indptr[column + 1]]
+            mask = (rows != work) & (common >= min_common)
+            rows, common = rows[mask], common[mask]
+            if not len(rows):
+                yield int(works[work]), []
+                continue
+            scores = common / (norms[rows] * norms[work])
+            if len(rows) > neighbours:
+                best = numpy.argpartition(-scores, neighbours - 1)[:neighbours]
+                rows, scores = rows[best], scores[best]
+            yield int(works[work]), _top(
+                [(int(works[row]), float(score))
+                 for row, score in zip(rows, scores)], neighbours)
+
+
+def iter_neighbours_python(user_ids, work_ids, neighbours, min_common):
+    """Yields (work id, [(neighbour id, score), ...]) counted in Python"""
+    libraries = defaultdict(set)
+    for user_id, work_id in zip(user_ids, work_ids):
+        libraries[user_id].add(work_id)
+    readers = defaultdict(int)
+    common = defaultdict(lambda: defaultdict(int))
+    for works in libraries.values():
+        for work_id in works:
+            readers[work_id] += 1
+            for other_id in works:
+                if other_id != work_id:
+                    common[work_id][other_id] += 1
+    for work_id in sorted(readers):
+        yield work_id, _top(
+            [(other_id,
+              count / math.sqrt(readers[work_id] * readers[other_id]))
+             for other_id, count in common[work_id].items()
+             if count >= min_common], neighbours)
+
+
+def rebuild(neighbours=None, min_common=None, block_size=None):
+    """
+        Recomputes neighbours of all works. Neighbours of every chunk of
+    works are replaced and committed at once, so readers see either old or
+    new neighbours of a work. Yields number of processed works after every
+    chunk.
+    """
+    config = current_app.config
+    if neighbours is None:
+        neighbours = config['ELIBRARIAN_RECOMMENDATIONS_NEIGHBOURS']
+    if min_common is None:
+        min_common = config['ELIBRARIAN_RECOMMENDATIONS_MIN_COMMON']
+    if block_size is None:
+        block_size = config['ELIBRARIAN_RECOMMENDATIONS_BLOCK_SIZE']
+    user_ids, work_ids = load_interactions()
+    if numpy is not None:
+        results = iter_neighbours_numpy(user_ids, work_ids, neighbours,
+                                        min_common, block_size)
+    else:
+        results = iter_neighbours_python(user_ids, work_ids, neighbours,
+                                         min_common)
+    table = LiteraryWorkNeighbour.__table__
+    built = set()
+    chunk = []
+    processed = 0
+    for item in results:
+        chunk.append(item)
+        if len(chunk) >= IN_CLAUSE_CHUNK:
+            LiteraryWorkNeighbour.replace(db.session, chunk)
+            db.session.commit()
+            built.update(work_id for work_id, _ in chunk)
+            processed += len(chunk)
+            chunk = []
+            yield processed
+    if chunk:
+        LiteraryWorkNeighbour.replace(db.session, chunk)
+        db.session.commit()
+        built.update(work_id for work_id, _ in chunk)
+        processed += len(chunk)
+        yield processed
+    # Works nobody reads any more
+    stale = [row[0] for row in db.session.execute(
+        select([table.c.literary_work_id]).distinct())
+        if row[0] not in built]
+    for start in range(0, len(stale), IN_CLAUSE_CHUNK):
+        db.session.execute(table.delete().where(table.c.literary_work_id.in_(
+            stale[start:start + IN_CLAUSE_CHUNK])))
+    db.session.commit()
@@ -0,0 +1,404 @@
+"""
+    Optional in-memory snapshot of catalogue metadata: ids, original
+languages, per-language titles and author names.
+    Snapshot is loaded once per worker on first use into compact structures
+(``__slots__`` records, flat tuples, arrays of ids, interned language codes)
+and refreshed incrementally from the catalogue changes log. Readers never
+take locks: refresh replaces records and id arrays with single reference
+assignments.
+"""
+import sys
+import time
+from array import array
+from threading import Lock
+from flask import current_app, url_for
+from flask.ext.sqlalchemy import Pagination
+from .models import Author, AuthorDetail, Authors2LiteraryWorks, \
+    CatalogueChange, LiteraryWork, LiteraryWorkDetail, _load_grouped
+
+EXTENSION_NAME = 'catalogue_snapshot'
+
+
+class WorkRecord:
+    """Literary work metadata. Titles are flat (lang, title, ...) tuple"""
+    __slots__ = ('id', 'original_lang', 'creation_datestring', 'titles',
+                 'author_ids')
+
+    def __init__(self, work_id, original_lang, creation_datestring, titles,
+                 author_ids):
+        self.id = work_id
+        self.original_lang = original_lang
+        self.creation_datestring = creation_datestring
+        self.titles = titles
+        self.author_ids = author_ids
+
+
+class AuthorRecord:
+    """Author metadata. Names are flat (lang, full name, ...) tuple"""
+    __slots__ = ('id', 'original_lang', 'names', 'work_ids')
+
+    def __init__(self, author_id, original_lang, names, work_ids):
+        self.id = author_id
+        self.original_lang = original_lang
+        self.names = names
+        self.work_ids = work_ids
+
+
+def _intern(lang):
+    return sys.intern(lang) if lang else lang
+
+
+def _pick(pairs, lang):
+    """
+        Choose (lang, value) from flat pairs tuple in preferred language, or
+    english, or the first available. Returns None if there are no pairs.
+    """
+    if not pairs:
+        return None
+    english = None
+    for idx in range(0, len(pairs), 2):
+        if pairs[idx] == lang:
+            return pairs[idx], pairs[idx + 1]
+        if english is None and pairs[idx] == "en":
+            english = pairs[idx], pairs[idx + 1]
+    return english or (pairs[0], pairs[1])
+
+
+def _wanted(fields, name):
+    return fields is None or name in fields
+
+
+class CatalogueSnapshot:
+    """In-memory catalogue metadata with lock-free reads"""
+    # Attributes and relations representation can be served with
+    WORK_FIELDS = ('id', 'url', 'original_lang', 'creation_datestring',
+                   'title', 'lang')
+    WORK_EMBEDS = ('authors',)
+    AUTHOR_FIELDS = ('id', 'url', 'full_name', 'lang', 'original_lang',
+                     'literary_works_count', 'literary_works_url')
+    AUTHOR_EMBEDS = ('literary_works',)
+
+    def __init__(self):
+        self.works = {}
+        self.authors = {}
+        self.work_ids = array('i')
+        self.author_ids = array('i')
+        self.cursor = 0
+        self.loaded = False
+        self.refreshed_at = 0.0
+        self._lock = Lock()
+
+    # ----=[ loading ]=--------------------------------------------------------
+    def _load_works(self, work_ids):
+        """Returns {id: WorkRecord} for given works read from database"""
+        works = _load_grouped(LiteraryWork.query, LiteraryWork.id, work_ids,
+                              'id')
+        details = _load_grouped(
+            LiteraryWorkDetail.query.order_by(LiteraryWorkDetail.id),
+            LiteraryWorkDetail.literary_work_id, work_ids, 'literary_work_id')
+        links = _load_grouped(
+            Authors2LiteraryWorks.query.order_by(
+                Authors2LiteraryWorks.author_id),
+            Authors2LiteraryWorks.literary_work_id, work_ids,
+            'literary_work_id')
+        records = {}
+        for work_id, (work,) in works.items():
+            titles = []
+            for detail in details[work_id]:
+                titles.extend((_intern(detail.lang), detail.title))
+            records[work_id] = WorkRecord(
+                work_id, _intern(work.original_lang), work.creation_datestring,
+                tuple(titles),
+                tuple(link.author_id for link in links[work_id]))
+        return records
+
+    def _load_authors(self, author_ids):
+        """Returns {id: AuthorRecord} for given authors read from database"""
+        authors = _load_grouped(Author.query, Author.id, author_ids, 'id')
+        details = _load_grouped(AuthorDetail.query, AuthorDetail.id,
+                                author_ids, 'id')
+        links = _load_grouped(
+            Authors2LiteraryWorks.query.order_by(
+                Authors2LiteraryWorks.literary_work_id),
+            Authors2LiteraryWorks.author_id, author_ids, 'author_id')
+        records = {}
+        for author_id, (author,) in authors.items():
+            names = []
+            for detail in details[author_id]:
+                names.extend((_intern(detail.lang),
+                              detail.to_json()['full_name']))
+            records[author_id] = AuthorRecord(
+                author_id, _intern(author.original_lang), tuple(names),
+                array('i', (link.literary_work_id
+                            for link in links[author_id])))
+        return records
+
+    def _settled_cursor(self):
+        """
+            Sequence number of the latest change all changes before which are
+        visible: after the latest settled change, up to a recent gap
+        """
+        change = CatalogueChange.query.filter(
+            CatalogueChange.timestamp <= CatalogueChange.settled_before()
+        ).order_by(CatalogueChange.seq.desc()).first()
+        cursor = change.seq if change else 0
+        changes = CatalogueChange.read_since(cursor)
+        return changes[-1].seq if changes else cursor
+
+    def load(self):
+        """Loads the whole snapshot from database"""
+        cursor = self._settled_cursor()
+        work_ids = [row[0] for row in
+                    LiteraryWork.query.with_entities(LiteraryWork.id)]
+        author_ids = [row[0] for row in
+                      Author.query.with_entities(Author.id)]
+        works = self._load_works(work_ids)
+        authors = self._load_authors(author_ids)
+        self.works = works
+        self.authors = authors
+        self.work_ids = array('i', sorted(works))
+        self.author_ids = array('i', sorted(authors))
+        self.cursor = cursor
+        self.loaded = True
+        self.refreshed_at = time.time()
+
+    def refresh(self):
+        """
+            Applies catalogue changes made since the last refresh: reloads
+        changed works and authors and forgets deleted ones. Returns number of
+        applied changes.
+        """
+        changes = CatalogueChange.read_since(self.cursor)
+        self.refreshed_at = time.time()
+        if not changes:
+            return 0
+        work_ids, author_ids, detail_ids = set(), set(), set()
+        for change in changes:
+            key = change.entity_id.split(':')
+            if change.entity == 'literary_work':
+                work_ids.add(int(key[0]))
+            elif change.entity == 'literary_work_detail':
+                detail_ids.add(int(key[0]))
+            elif change.entity in ('author', 'author_detail'):
+                # Author detail key is "author id:lang"
+                author_ids.add(int(key[0]))
+            elif change.entity == 'author_literary_work':
+                author_ids.add(int(key[0]))
+                work_ids.add(int(key[1]))
+        if detail_ids:
+            details = LiteraryWorkDetail.query.filter(
+                LiteraryWorkDetail.id.in_(detail_ids)).all()
+            if len(details) < len(detail_ids):
+                # Change log doesn't keep work id of deleted detail
+                self.load()
+                return len(changes)
+            work_ids.update(detail.literary_work_id for detail in details)
+
+        works = self._load_works(work_ids)
+        authors = self._load_authors(author_ids)
+        works_changed = self._apply(self.works, work_ids, works)
+        authors_changed = self._apply(self.authors, author_ids, authors)
+        # Id arrays are replaced, not modified, so readers see either state
+        if works_changed:
+            self.work_ids = array('i', sorted(self.works))
+        if authors_changed:
+            self.author_ids = array('i', sorted(self.authors))
+        self.cursor = changes[-1].seq
+        return len(changes)
+
+    @staticmethod
+    def _apply(records, ids, loaded):
+        """
+            Replace ``records`` of given ``ids`` with ``loaded`` ones, ids
+        absent in ``loaded`` are deleted. Returns True if set of ids changed.
+        """
+        changed = False
+        for record_id in ids:
+            if record_id in loaded:
+                changed = changed or record_id not in records
+                records[record_id] = loaded[record_id]
+            elif records.pop(record_id, None) is not None:
+                changed = True
+        return changed
+
+    # ----=[ reading ]=--------------------------------------------------------
+    def can_serve(self, kind, fields, embed, verbose=False):
+        """
+            True if representation with given ``fields`` and ``embed`` of
+        ``kind`` ('work' or 'author') can be built from the snapshot.
+        """
+        if kind == 'work':
+            all_fields, all_embeds = self.WORK_FIELDS, self.WORK_EMBEDS
+        else:
+            all_fields, all_embeds = self.AUTHOR_FIELDS, self.AUTHOR_EMBEDS
+        if fields is None:
+            # Verbose representations carry attributes snapshot doesn't keep
+            if verbose:
+                return False
+        elif not set(fields).issubset(all_fields):
+            return False
+        return embed is None or set(embed).issubset(all_embeds)
+
+    def paginate(self, kind, page, per_page):
+        """
+            Returns ``Pagination`` of ``kind`` ('work' or 'author') ids in
+        primary key order.
+        """
+        ids = self.work_ids if kind == 'work' else self.author_ids
+        start = (page - 1) * per_page
+        return Pagination(None, page, per_page, len(ids),
+                          list(ids[start:start + per_page]))
+
+    def works_json(self, work_ids, lang="en", verbose=False, fields=None,
+                   embed=None):
+        """
+            Returns representations of literary works like
+        ``LiteraryWork.to_json_bulk`` does, ids missing in snapshot are
+        skipped. Annotations are not kept in snapshot, so verbose
+        representation is the same as the short one.
+        """
+        if embed is None:
+            embed = ('authors',)
+        result = []
+        works, authors = self.works, self.authors
+        for work_id in work_ids:
+            work = works.get(work_id)
+            if work is None:
+                continue
+            json = {'id': work.id}
+            if _wanted(fields, 'url'):
+                json['url'] = url_for('api.get_literary_work',
+                                      work_id=work.id, _external=True)
+            if _wanted(fields, 'original_lang'):
+                json['original_lang'] = work.original_lang
+            if 'authors' in embed:
+                json['authors'] = []
+                for author_id in work.author_ids:
+                    author_json = {
+                        'id': author_id,
+                        'url': url_for('api.get_author', author_id=author_id,
+                                       _external=True)
+                    }
+                    author = authors.get(author_id)
+                    name = _pick(author.names, lang) if author else None
+                    if name:
+                        author_json['name'] = name[1]
+                    json['authors'].append(author_json)
+            if work.creation_datestring and \
+                    _wanted(fields, 'creation_datestring'):
+                json['creation_datestring'] = work.creation_datestring
+            title = _pick(work.titles, lang)
+            if title:
+                if _wanted(fields, 'title'):
+                    json['title'] = title[1]
+                if _wanted(fields, 'lang'):
+                    json['lang'] = title[0]
+            result.append(json)
+        return result
+
+    def authors_json(self, author_ids, lang="en", verbose=False, fields=None,
+                     embed=None):
+        """
+            Returns representations of authors like ``Author.to_json_bulk``
+        does, ids missing in snapshot are skipped.
+        """
+        if embed is None:
+            embed = ('literary_works',) if verbose else ()
+        limit = current_app.config['ELIBRARIAN_EMBEDDED_WORKS_LIMIT']
+        result = []
+        works, authors = self.works, self.authors
+        for author_id in author_ids:
+            author = authors.get(author_id)
+            if author is None:
+                continue
+            json = {'id': author.id}
+            if _wanted(fields, 'url'):
+                json['url'] = url_for('api.get_author', author_id=author.id,
+                                      _external=True)
+            if _wanted(fields, 'literary_works_count'):
+                json['literary_works_count'] = len(author.work_ids)
+            if _wanted(fields, 'literary_works_url'):
+                json['literary_works_url'] = url_for(
+                    'api.get_author_literary_works', author_id=author.id,
+                    _external=True)
+            name = _pick(author.names, lang)
+            if name:
+                if _wanted(fields, 'full_name'):
+                    json['full_name'] = name[1]
+                if _wanted(fields, 'lang'):
+                    json['lang'] = name[0]
+            if author.original_lang and _wanted(fields, 'original_lang'):
+                json['original_lang'] = author.original_lang
+            if 'literary_works' in embed:
+                json['literary_works'] = []
+                for work_id in author.work_ids[:limit]:
+                    work_json = {
+                        'id': work_id,
+                        'url': url_for('api.get_literary_work',
+                                       work_id=work_id, _external=True)
+                    }
+                    work = works.get(work_id)
+                    title = _pick(work.titles, lang) if work else None
+                    if title:
+                        work_json['title'] = title[1]
+                        work_json['lang'] = title[0]
+                    json['literary_works'].append(work_json)
+            result.append(json)
+        return result
+
+    # ----=[ statistics ]=-----------------------------------------------------
+    def memory_footprint(self):
+        """Approximate memory used by snapshot structures, in bytes"""
+        size = sys.getsizeof(self.works) + sys.getsizeof(self.authors)
+        size += sys.getsizeof(self.work_ids) + sys.getsizeof(self.author_ids)
+        for work in list(self.works.values()):
+            size += sys.getsizeof(work) + sys.getsizeof(work.titles)
+            size += sys.getsizeof(work.author_ids)
+            size += sum(sys.getsizeof(title) for title in work.titles[1::2])
+            if work.creation_datestring:
+                size += sys.getsizeof(work.creation_datestring)
+        for author in list(self.authors.values()):
+            size += sys.getsizeof(author) + sys.getsizeof(author.names)
+            size += sys.getsizeof(author.work_ids)
+            size += sum(sys.getsizeof(name) for name in author.names[1::2])
+        return size
+
+    def stats(self):
+        """Snapshot statistics as a dictionary"""
+        return {
+            'works': len(self.work_ids),
+            'authors': len(self.author_ids),
+            'cursor': self.cursor,
+            'memory_bytes': self.memory_footprint()
+        }
+
+
+def init_app(app):
+    """Attach catalogue snapshot to application if it is enabled"""
+    if app.config.get('ELIBRARIAN_SNAPSHOT'):
+        app.extensions[EXTENSION_NAME] = CatalogueSnapshot()
+
+
+def get_snapshot():
+    """
+        Returns catalogue snapshot of current application, loading it on the
+    first use and refreshing it when refresh interval passed. Returns None if
+    snapshot is disabled. Only one thread loads or refreshes snapshot at a
+    time, other threads keep reading the current state.
+    """
+    snapshot = current_app.extensions.get(EXTENSION_NAME)
+    if snapshot is None:
+        return None
+    if not snapshot.loaded:
+        with snapshot._lock:
+            if not snapshot.loaded:
+                snapshot.load()
+        return snapshot
+    interval = current_app.config['ELIBRARIAN_SNAPSHOT_REFRESH_INTERVAL']
+    if time.time() - snapshot.refreshed_at >= interval and \
+            snapshot._lock.acquire(False):
+        try:
+            snapshot.refresh()
+        finally:
+            snapshot._lock.release()
+    return snapshot
@@ -10,9 +10,11 @@ if os.environ.get('FLASK_COVERAGE'):
 
 from elibrarian_app import create_app, db
 from elibrarian_app.models import AuthRole, AuthUser, AuthUserPersonalLibrary, \
-    Author, AuthorDetail, Authors2LiteraryWorks, \
-    BookGenreSnap, BookSeries, BookSeriesDetail, BookSeriesSnap, Genre, \
-    GenreDetail, LiteraryWork, LiteraryWorkDetail, LiteraryWorkStorage
+    Author, AuthorDetail, Authors2LiteraryWorks, BackgroundJob, BookCover, \
+    BookFileMetadata, BookGenreSnap, BookSeries, BookSeriesDetail, \
+    BookSeriesSnap, BookTextChunk, BookTextIndex, BookTextTerm, Genre, \
+    GenreDetail, LiteraryWork, LiteraryWorkCard, LiteraryWorkCounters, \
+    LiteraryWorkDetail, LiteraryWorkNeighbour, LiteraryWorkStorage
 from flask.ext.migrate import Migrate, MigrateCommand, upgrade
 from flask.ext.script import Manager, Shell
 
@@ -27,11 +29,19 @@ def make_shell_context():
                 AuthUserPersonalLibrary=AuthUserPersonalLibrary,
                 Author=Author, AuthorDetail=AuthorDetail,
                 Authors2LiteraryWorks=Authors2LiteraryWorks,
-                BookGenreSnap=BookGenreSnap, BookSeries=BookSeries,
+                BackgroundJob=BackgroundJob, BookCover=BookCover,
+                BookFileMetadata=BookFileMetadata,
+                BookGenreSnap=BookGenreSnap,
+                BookTextChunk=BookTextChunk, BookTextIndex=BookTextIndex,
+                BookTextTerm=BookTextTerm,
+                BookSeries=BookSeries,
                 BookSeriesDetail=BookSeriesDetail,
                 BookSeriesSnap=BookSeriesSnap, Genre=Genre,
                 GenreDetail=GenreDetail, LiteraryWork=LiteraryWork,
+                LiteraryWorkCard=LiteraryWorkCard,
+                LiteraryWorkCounters=LiteraryWorkCounters,
                 LiteraryWorkDetail=LiteraryWorkDetail,
+                LiteraryWorkNeighbour=LiteraryWorkNeighbour,
                 LiteraryWorkStorage=LiteraryWorkStorage)
 
 
@@ -76,6 +86,180 @@ def resetdb():
     AuthRole.insert_roles()
 
 
+@manager.command
+def rebuild_work_cards():
+    """Rebuild materialized literary work cards"""
+    from elibrarian_app.models import LiteraryWorkCard
+
+    print("Rebuilding literary work cards:...")
+    processed = 0
+    for processed in LiteraryWorkCard.rebuild_all():
+        print("...{0} literary works processed".format(processed))
+    print("Done, {0} literary works processed".format(processed))
+
+
+@manager.command
+def rebuild_sort_keys():
+    """Recompute collation keys of authors names and literary works titles"""
+    from elibrarian_app.models import rebuild_sort_keys as rebuild
+
+    print("Rebuilding sort keys:...")
+    processed = 0
+    for processed in rebuild():
+        print("...{0} rows processed".format(processed))
+    print("Done, {0} rows processed".format(processed))
+
+
+@manager.command
+def reconcile_work_counters():
+    """Recount literary works popularity counters"""
+    print("Reconciling literary work counters:...")
+    processed = fixed = 0
+    for processed, fixed in LiteraryWorkCounters.reconcile():
+        print("...{0} literary works processed".format(processed))
+    print("Done, {0} literary works processed, {1} counters fixed".format(
+        processed, fixed))
+
+
+@manager.command
+def rebuild_recommendations():
+    """Recompute "readers also read" neighbours of literary works"""
+    from elibrarian_app import recommendations
+
+    print("Rebuilding recommendations ({0}):...".format(
+        'NumPy' if recommendations.numpy is not None else 'pure Python'))
+    processed = 0
+    for processed in recommendations.rebuild():
+        print("...{0} literary works processed".format(processed))
+    print("Done, {0} literary works processed".format(processed))
+
+
+@manager.option('-p', '--processes', dest='processes', type=int,
+                default=None, help='Number of parsing processes')
+def extract_book_files(processes=None):
+    """Extract covers and metadata of stored book files"""
+    from elibrarian_app.extraction import extract_pending
+
+    print("Extracting book files:...")
+    processed = 0
+    for processed, total in extract_pending(processes):
+        print("...{0} of {1} files processed".format(processed, total))
+    print("Done, {0} files processed".format(processed))
+
+
+@manager.option('-p', '--processes', dest='processes', type=int,
+                default=None, help='Number of text extraction processes')
+def index_book_contents(processes=None):
+    """Index text of stored book files for full-text search"""
+    from elibrarian_app.content_index import index_pending
+
+    print("Indexing book contents:...")
+    processed = 0
+    for processed, total in index_pending(processes):
+        print("...{0} of {1} files indexed".format(processed, total))
+    print("Done, {0} files indexed".format(processed))
+
+
+@manager.option('-c', '--concurrency', dest='concurrency', type=int,
+                default=2, help='Number of jobs run at once')
+@manager.option('-p', '--processes', dest='processes', action='store_true',
+                default=False, help='Run jobs in processes instead of threads')
+@manager.option('-o', '--once', dest='once', action='store_true',
+                default=False, help='Exit when there are no due jobs')
+def worker(concurrency=2, processes=False, once=False):
+    """Run background jobs"""
+    from elibrarian_app.jobs import Worker
+
+    print("Starting jobs worker:...")
+    Worker(app, config_name, concurrency, processes).run(once)
+
+
+@manager.option('-e', '--encodings', dest='encodings', default=None,
+                help='Comma separated encodings, all installed by default')
+def precompress_files(encodings=None):
+    """Create precompressed variants of compressible stored files"""
+    from elibrarian_app.api_1_0.compression import COMPRESSORS, compress
+
+    if encodings is None:
+        encodings = sorted(COMPRESSORS)
+    else:
+        encodings = encodings.split(',')
+    levels = app.config['ELIBRARIAN_PRECOMPRESSION_LEVELS']
+    originals_ids = [row[0] for row in LiteraryWorkStorage.query.filter(
+        LiteraryWorkStorage.content_encoding.is_(None),
+        LiteraryWorkStorage.mime_type.in_(
+            app.config['ELIBRARIAN_COMPRESSION_MIMETYPES'])
+    ).with_entities(LiteraryWorkStorage.id)]
+    created = 0
+    for original_id in originals_ids:
+        original = LiteraryWorkStorage.query.get(original_id)
+        existing = original.get_variants_encodings()
+        for encoding in encodings:
+            if encoding in existing:
+                continue
+            data = compress(original.binary_data, encoding, levels[encoding])
+            if len(data) < len(original.binary_data):
+                db.session.add(original.make_variant(encoding, data))
+                created += 1
+        db.session.commit()
+    print("Done, {0} precompressed variants created".format(created))
+
+
+@manager.option('-q', '--queries', dest='queries_file', required=True,
+                help='JSON lines file recorded with ELIBRARIAN_QUERY_LOG')
+@manager.option('-m', '--min-rows', dest='min_rows', type=int, default=None,
+                help='Report full scans of tables with at least such rows')
+@manager.option('-c', '--check', dest='check', action='store_true',
+                default=False, help='Exit with error on missing indexes')
+def index_advisor(queries_file, min_rows=None, check=False):
+    """Explain recorded queries, report full scans and suggest indexes"""
+    import sys
+    from elibrarian_app.index_advisor import IndexAdvisor, load_queries, \
+        missing_indexes
+
+    if min_rows is None:
+        min_rows = app.config['ELIBRARIAN_INDEX_ADVISOR_MIN_ROWS']
+    queries = load_queries(queries_file)
+    findings = IndexAdvisor(db.engine, min_rows).analyze(queries)
+    for finding in findings:
+        print("Full scan of {0} ({1} rows) at {2}:".format(
+            finding['table'], finding['rows'], finding['context']))
+        print("    {0}".format(' '.join(finding['statement'].split())))
+        for suggestion in finding['suggestions']:
+            print("  suggested: {0}".format(suggestion))
+    missing = missing_indexes(findings)
+    print("Done, {0} statements explained, {1} full scans, {2} with missing "
+          "indexes".format(len(set(query['statement'] for query in queries)),
+                           len(findings), len(missing)))
+    if check and missing:
+        sys.exit(1)
+
+
+@manager.option('-u', '--user', dest='email', required=True,
+                help='E-mail of the user whose library is imported')
+@manager.option('-f', '--file', dest='csv_file', required=True,
+                help='CSV file of reading history')
+def import_reading_history(email, csv_file):
+    """Import reading history from CSV into user's personal library"""
+    from elibrarian_app.library_import import import_csv
+
+    user = AuthUser.query.filter_by(email=email).first()
+    if user is None:
+        print("Unknown user {0}".format(email))
+        return
+    with open(csv_file, encoding='utf-8-sig') as history:
+        results = import_csv(db.session, user.id, history.read(),
+                             app.config['ELIBRARIAN_LIBRARY_IMPORT_LANGS'],
+                             float('inf'))
+    db.session.commit()
+    for line, result in results:
+        if result['status'] == 'error':
+            print("  line {0}: {1}".format(line, result['message']))
+    print("Done, {0} of {1} rows imported".format(
+        sum(result['status'] != 'error' for _, result in results),
+        len(results)))
+
+
 @manager.command
 def filldata():
     """Upgrade database and try to import some initial test data"""
@@ -37,7 +37,7 @@ def run_migrations_offline():
 
     """
     url = config.get_main_option("sqlalchemy.url")
-    context.configure(url=url)
+    context.configure(url=url, transaction_per_migration=True)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -55,9 +55,12 @@ def run_migrations_online():
                 poolclass=pool.NullPool)
 
     connection = engine.connect()
+    # Every migration is committed separately, so long migrations of large
+    # tables (see elibrarian_app.online_migrations) start on committed schema
     context.configure(
                 connection=connection,
-                target_metadata=target_metadata
+                target_metadata=target_metadata,
+                transaction_per_migration=True
                 )
 
     try:
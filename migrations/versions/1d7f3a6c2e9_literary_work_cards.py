@@ -0,0 +1,28 @@
+"""literary work cards
+
+Revision ID: 1d7f3a6c2e9
+Revises: 46c1d9a0b3e
+Create Date: 2026-10-19 15:02:47.930121
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1d7f3a6c2e9'
+down_revision = '46c1d9a0b3e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('literary_work_cards',
+    sa.Column('lang', sa.String(length=5), nullable=False),
+    sa.Column('literary_work_id', sa.Integer(), nullable=False),
+    sa.Column('card', sa.Text(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('lang', 'literary_work_id')
+    )
+
+
+def downgrade():
+    op.drop_table('literary_work_cards')
@@ -0,0 +1,49 @@
+"""details sort keys backfill
+
+Revision ID: 1e9b5d3c7f6
+Revises: 7c4f1e8a2d5
+Create Date: 2026-10-19 20:43:52.640913
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1e9b5d3c7f6'
+down_revision = '7c4f1e8a2d5'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import column, table
+from elibrarian_app.collation import sort_key
+from elibrarian_app.online_migrations import backfill_rows, \
+    create_index_concurrently, drop_index_concurrently
+
+authors_details = table('authors_details', column('id'), column('lang'),
+                        column('last_name'), column('first_name'),
+                        column('middle_name'), column('sort_key'))
+literary_works_details = table('literary_works_details', column('id'),
+                               column('lang'), column('title'),
+                               column('sort_key'))
+
+
+def upgrade():
+    backfill_rows(
+        authors_details, ['id', 'lang'],
+        lambda row: {'sort_key': sort_key(row.lang, row.last_name,
+                                          row.first_name, row.middle_name)},
+        where=authors_details.c.sort_key.is_(None))
+    backfill_rows(
+        literary_works_details, ['id'],
+        lambda row: {'sort_key': sort_key(row.lang, row.title)},
+        where=literary_works_details.c.sort_key.is_(None))
+    create_index_concurrently('ix_authors_details_lang_sort_key',
+                              'authors_details', ['lang', 'sort_key', 'id'])
+    create_index_concurrently('ix_literary_works_details_lang_sort_key',
+                              'literary_works_details',
+                              ['lang', 'sort_key', 'id'])
+
+
+def downgrade():
+    drop_index_concurrently('ix_literary_works_details_lang_sort_key',
+                            'literary_works_details')
+    drop_index_concurrently('ix_authors_details_lang_sort_key',
+                            'authors_details')
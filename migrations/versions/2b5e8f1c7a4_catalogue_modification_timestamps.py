@@ -0,0 +1,28 @@
+"""catalogue modification timestamps
+
+Revision ID: 2b5e8f1c7a4
+Revises: 3e898dd6d52
+Create Date: 2026-10-19 10:12:40.511203
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2b5e8f1c7a4'
+down_revision = '3e898dd6d52'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('authors', sa.Column('timestamp', sa.DateTime(),
+                                       nullable=True))
+    op.add_column('authors_details', sa.Column('timestamp', sa.DateTime(),
+                                               nullable=True))
+    op.execute("UPDATE authors SET timestamp = CURRENT_TIMESTAMP")
+    op.execute("UPDATE authors_details SET timestamp = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    op.drop_column('authors_details', 'timestamp')
+    op.drop_column('authors', 'timestamp')
@@ -0,0 +1,46 @@
+"""background jobs
+
+Revision ID: 2f8b4d0c9a6
+Revises: 3c6e1a8d5b2
+Create Date: 2026-10-19 19:03:51.209348
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f8b4d0c9a6'
+down_revision = '3c6e1a8d5b2'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('background_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=63), nullable=False),
+    sa.Column('args', sa.Text(), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=127), nullable=True),
+    sa.Column('status', sa.String(length=15), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('progress', sa.Float(), nullable=True),
+    sa.Column('progress_message', sa.String(length=255), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('worker', sa.String(length=127), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('started', sa.DateTime(), nullable=True),
+    sa.Column('heartbeat', sa.DateTime(), nullable=True),
+    sa.Column('finished', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key')
+    )
+    op.create_index(op.f('ix_background_jobs_status'), 'background_jobs',
+                    ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_background_jobs_status'),
+                  table_name='background_jobs')
+    op.drop_table('background_jobs')
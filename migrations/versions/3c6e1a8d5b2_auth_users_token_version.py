@@ -0,0 +1,24 @@
+"""auth users token version
+
+Revision ID: 3c6e1a8d5b2
+Revises: 5a2c9e7b1f3
+Create Date: 2026-10-19 18:26:05.774120
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c6e1a8d5b2'
+down_revision = '5a2c9e7b1f3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('auth_users',
+                  sa.Column('token_version', sa.Integer(), nullable=False,
+                            server_default='0'))
+
+
+def downgrade():
+    op.drop_column('auth_users', 'token_version')
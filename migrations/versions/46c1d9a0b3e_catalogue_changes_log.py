@@ -0,0 +1,29 @@
+"""catalogue changes log
+
+Revision ID: 46c1d9a0b3e
+Revises: 2b5e8f1c7a4
+Create Date: 2026-10-19 13:40:02.118734
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '46c1d9a0b3e'
+down_revision = '2b5e8f1c7a4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('catalogue_changes',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=31), nullable=False),
+    sa.Column('entity_id', sa.String(length=63), nullable=False),
+    sa.Column('operation', sa.String(length=7), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('seq')
+    )
+
+
+def downgrade():
+    op.drop_table('catalogue_changes')
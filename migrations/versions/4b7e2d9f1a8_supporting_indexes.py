@@ -0,0 +1,38 @@
+"""supporting indexes
+
+Revision ID: 4b7e2d9f1a8
+Revises: 2f8b4d0c9a6
+Create Date: 2026-10-19 19:48:27.530114
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2d9f1a8'
+down_revision = '2f8b4d0c9a6'
+
+from alembic import op
+import sqlalchemy as sa
+from elibrarian_app.online_migrations import create_index_concurrently, \
+    drop_index_concurrently
+
+# (table, column) pairs, indexes are named by SQLAlchemy convention
+INDEXES = (
+    ('authors_2_literary_works', 'literary_work_id'),
+    ('literary_works_2_genres', 'genre_id'),
+    ('literary_works_2_series', 'series_id'),
+    ('literary_works_storage', 'literary_work_details_id'),
+    ('literary_works_storage', 'parent_id'),
+    ('literary_work_cards', 'literary_work_id'),
+    ('users_personal_library', 'literary_work_id'),
+)
+
+
+def upgrade():
+    for table, column in INDEXES:
+        create_index_concurrently('ix_{0}_{1}'.format(table, column), table,
+                                  [column])
+
+
+def downgrade():
+    for table, column in reversed(INDEXES):
+        drop_index_concurrently('ix_{0}_{1}'.format(table, column), table)
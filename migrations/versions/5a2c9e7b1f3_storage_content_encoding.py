@@ -0,0 +1,24 @@
+"""storage content encoding
+
+Revision ID: 5a2c9e7b1f3
+Revises: 1d7f3a6c2e9
+Create Date: 2026-10-19 17:41:12.318402
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a2c9e7b1f3'
+down_revision = '1d7f3a6c2e9'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('literary_works_storage',
+                  sa.Column('content_encoding', sa.String(length=15),
+                            nullable=True))
+
+
+def downgrade():
+    op.drop_column('literary_works_storage', 'content_encoding')
@@ -0,0 +1,29 @@
+"""literary work neighbours
+
+Revision ID: 5c8a2f6e3d1
+Revises: 1e9b5d3c7f6
+Create Date: 2026-10-19 23:05:12.418306
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c8a2f6e3d1'
+down_revision = '1e9b5d3c7f6'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Filled by "manage.py rebuild_recommendations" or the periodic job
+    op.create_table('literary_work_neighbours',
+    sa.Column('literary_work_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('neighbour_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('literary_work_id', 'rank')
+    )
+
+
+def downgrade():
+    op.drop_table('literary_work_neighbours')
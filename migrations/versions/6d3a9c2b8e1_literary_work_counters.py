@@ -0,0 +1,57 @@
+"""literary work counters
+
+Revision ID: 6d3a9c2b8e1
+Revises: 4b7e2d9f1a8
+Create Date: 2026-10-19 20:14:36.902571
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6d3a9c2b8e1'
+down_revision = '4b7e2d9f1a8'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('literary_work_counters',
+    sa.Column('literary_work_id', sa.Integer(), nullable=False),
+    sa.Column('readers_count', sa.Integer(), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('plan_to_read_count', sa.Integer(), nullable=False),
+    sa.Column('ratings_count', sa.Integer(), nullable=False),
+    sa.Column('ratings_sum', sa.Integer(), nullable=False),
+    sa.Column('rating_avg', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('literary_work_id')
+    )
+    # Only reads the existing tables, the new one is not used yet
+    op.execute(
+        'INSERT INTO literary_work_counters (literary_work_id, '
+        'readers_count, reading_count, plan_to_read_count, ratings_count, '
+        'ratings_sum, rating_avg) '
+        'SELECT w.id, '
+        'COUNT(CASE WHEN l.read_flag OR l.read_progress IS NOT NULL '
+        'THEN 1 END), '
+        'COUNT(CASE WHEN l.read_progress IS NOT NULL AND NOT l.read_flag '
+        'THEN 1 END), '
+        'COUNT(CASE WHEN l.plan_to_read THEN 1 END), '
+        'COUNT(l.rating), COALESCE(SUM(l.rating), 0), '
+        'COALESCE(AVG(l.rating * 1.0), 0) '
+        'FROM literary_works w LEFT JOIN users_personal_library l '
+        'ON l.literary_work_id = w.id GROUP BY w.id')
+    op.create_index('ix_literary_work_counters_popular',
+                    'literary_work_counters',
+                    ['readers_count', 'literary_work_id'], unique=False)
+    op.create_index('ix_literary_work_counters_rating',
+                    'literary_work_counters',
+                    ['rating_avg', 'ratings_count', 'literary_work_id'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_literary_work_counters_rating',
+                  table_name='literary_work_counters')
+    op.drop_index('ix_literary_work_counters_popular',
+                  table_name='literary_work_counters')
+    op.drop_table('literary_work_counters')
@@ -0,0 +1,26 @@
+"""details sort keys
+
+Revision ID: 7c4f1e8a2d5
+Revises: 6d3a9c2b8e1
+Create Date: 2026-10-19 20:41:08.114267
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c4f1e8a2d5'
+down_revision = '6d3a9c2b8e1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('authors_details',
+                  sa.Column('sort_key', sa.String(length=254), nullable=True))
+    op.add_column('literary_works_details',
+                  sa.Column('sort_key', sa.String(length=254), nullable=True))
+
+
+def downgrade():
+    op.drop_column('literary_works_details', 'sort_key')
+    op.drop_column('authors_details', 'sort_key')
@@ -0,0 +1,46 @@
+"""book file metadata
+
+Revision ID: 8a4f2c6d9e3
+Revises: 5c8a2f6e3d1
+Create Date: 2026-10-20 00:12:40.275194
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a4f2c6d9e3'
+down_revision = '5c8a2f6e3d1'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('literary_works_storage',
+                  sa.Column('checksum', sa.String(length=64), nullable=True))
+    op.create_table('book_file_metadata',
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('format', sa.String(length=15), nullable=True),
+    sa.Column('title', sa.String(length=255), nullable=True),
+    sa.Column('authors', sa.Text(), nullable=False),
+    sa.Column('lang', sa.String(length=15), nullable=True),
+    sa.Column('page_count', sa.Integer(), nullable=True),
+    sa.Column('details', sa.Text(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('extracted', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum')
+    )
+    op.create_table('book_covers',
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.String(length=15), nullable=False),
+    sa.Column('mime_type', sa.String(length=63), nullable=True),
+    sa.Column('width', sa.Integer(), nullable=True),
+    sa.Column('height', sa.Integer(), nullable=True),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum', 'size')
+    )
+
+
+def downgrade():
+    op.drop_table('book_covers')
+    op.drop_table('book_file_metadata')
+    op.drop_column('literary_works_storage', 'checksum')
@@ -0,0 +1,36 @@
+"""storage checksum backfill
+
+Revision ID: 9d5b3e7f1a2
+Revises: 8a4f2c6d9e3
+Create Date: 2026-10-20 00:14:03.581726
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9d5b3e7f1a2'
+down_revision = '8a4f2c6d9e3'
+
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql import column, table
+from elibrarian_app.online_migrations import backfill_rows, \
+    create_index_concurrently, drop_index_concurrently
+
+literary_works_storage = table('literary_works_storage', column('id'),
+                               column('binary_data'), column('checksum'))
+
+
+def upgrade():
+    # Rows carry whole files, so batches are small
+    backfill_rows(
+        literary_works_storage, ['id'],
+        lambda row: {'checksum': hashlib.sha256(row.binary_data).hexdigest()},
+        where=literary_works_storage.c.checksum.is_(None), batch_size=10)
+    create_index_concurrently('ix_literary_works_storage_checksum',
+                              'literary_works_storage', ['checksum'])
+
+
+def downgrade():
+    drop_index_concurrently('ix_literary_works_storage_checksum',
+                            'literary_works_storage')
@@ -0,0 +1,56 @@
+"""book text index
+
+Revision ID: b3e6a1d4c8f
+Revises: 9d5b3e7f1a2
+Create Date: 2026-10-20 00:16:21.904318
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3e6a1d4c8f'
+down_revision = '9d5b3e7f1a2'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+def upgrade():
+    op.create_table('book_text_index',
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('lang', sa.String(length=5), nullable=False),
+    sa.Column('chunks', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('indexed', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum', 'lang')
+    )
+    op.create_table('book_text_chunks',
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('lang', sa.String(length=5), nullable=False),
+    sa.Column('chunk_no', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('text', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('checksum', 'lang', 'chunk_no')
+    )
+    op.create_table('book_text_terms',
+    sa.Column('term', sa.String(length=64), nullable=False),
+    sa.Column('lang', sa.String(length=5), nullable=False),
+    sa.Column('checksum', sa.String(length=64), nullable=False),
+    sa.Column('chunk_no', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('term', 'lang', 'checksum', 'chunk_no')
+    )
+    if op.get_context().dialect.name == 'postgresql':
+        # Filled by the indexer with to_tsvector of the language
+        # configuration, not mapped by the model
+        op.add_column('book_text_chunks',
+                      sa.Column('search_vector', postgresql.TSVECTOR(),
+                                nullable=True))
+        op.create_index('ix_book_text_chunks_search_vector',
+                        'book_text_chunks', ['search_vector'],
+                        postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_table('book_text_terms')
+    op.drop_table('book_text_chunks')
+    op.drop_table('book_text_index')
@@ -1,10 +1,29 @@
+import gzip
+import shutil
+import tempfile
 import unittest
+import zlib
 from base64 import b64encode
-from elibrarian_app import create_app, db
-from elibrarian_app.models import AuthRole, AuthUser, Author, AuthorDetail, \
-    LiteraryWork, LiteraryWorkDetail
+from datetime import datetime, timedelta
+from elibrarian_app import content_index, create_app, db, extraction, \
+    recommendations
+from elibrarian_app.api_1_0 import metrics
+from elibrarian_app.models import AuthRole, AuthUser, \
+    AuthUserPersonalLibrary, Author, AuthorDetail, Authors2LiteraryWorks, \
+    CatalogueChange, LiteraryWork, LiteraryWorkDetail, LiteraryWorkStorage
 from flask import current_app, url_for
-from json import loads
+from flask.ext.sqlalchemy import get_debug_queries
+from json import dumps, loads
+
+SOLARIS_FB2 = (
+    b'<?xml version="1.0" encoding="utf-8"?>'
+    b'<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0" '
+    b'xmlns:l="http://www.w3.org/1999/xlink"><description><title-info>'
+    b'<author><first-name>Stanislaw</first-name><last-name>Lem</last-name>'
+    b'</author><book-title>Solaris</book-title><coverpage>'
+    b'<image l:href="#cover.jpg"/></coverpage></title-info></description>'
+    b'<body><p>Ocean</p></body><binary id="cover.jpg" '
+    b'content-type="image/jpeg">Y292ZXI=</binary></FictionBook>')
 
 
 class RESTAPITestCase(unittest.TestCase):
@@ -334,6 +353,898 @@ class RESTAPITestCase(unittest.TestCase):
         self.assertTrue('Insufficient permissions' in
                         response.get_data(as_text=True))
 
+    def test_query_stats_headers(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        db.session.commit()
+
+        # headers are disabled by default
+        response = self.client.get(
+            self.authors_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue('X-Query-Count' not in response.headers)
+
+        current_app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+        response = self.client.get(
+            self.authors_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertTrue(response.status_code == 200)
+        query_count = int(response.headers['X-Query-Count'])
+        self.assertTrue(query_count > 0)
+        self.assertTrue(
+            response.headers['Server-Timing'].startswith('db;dur='))
+        # only queries of the request itself are counted
+        response = self.client.get(
+            self.authors_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertEqual(int(response.headers['X-Query-Count']), query_count)
+
+        with current_app.test_request_context('/'):
+            query_stats_lnk = url_for('api.get_query_stats')
+        response = self.client.delete(
+            query_stats_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertEqual(response.status_code, 204)
+        self.client.get(
+            self.authors_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        response = self.client.get(
+            query_stats_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        stats = loads(response.data.decode('utf-8'))['api.get_authors']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['query_count']['max'], query_count)
+
+    def test_metrics(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        reader = AuthUser(email="reader@example.com", username="reader",
+                          password="reader-pass", confirmed=True)
+        db.session.add(duke)
+        db.session.add(reader)
+        db.session.commit()
+
+        with current_app.test_request_context('/'):
+            metrics_lnk = url_for('api.get_metrics')
+        metrics.registry.clear()
+        current_app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+
+        response = self.client.get(
+            self.authors_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertTrue(response.status_code == 200)
+        query_count = response.headers['X-Query-Count']
+
+        # only administrators can read metrics
+        response = self.client.get(
+            metrics_lnk,
+            headers=self.generate_auth_header("reader@example.com",
+                                              "reader-pass")
+        )
+        self.assertTrue(response.status_code == 403)
+
+        response = self.client.get(
+            metrics_lnk,
+            headers=self.generate_auth_header("duke@example.com", "hardcore")
+        )
+        self.assertTrue(response.status_code == 200)
+        body = response.get_data(as_text=True)
+        self.assertTrue('elibrarian_api_request_duration_seconds_bucket'
+                        in body)
+        self.assertTrue('elibrarian_api_auth_total{method="basic"}' in body)
+        self.assertTrue('elibrarian_api_requests_total' in body)
+        # queries of the request only, not of the whole application context
+        self.assertIn('elibrarian_api_db_queries_sum{{route="{0}"}} {1}\n'
+                      .format(self.authors_lnk, query_count), body)
+
+    def test_conditional_get(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lwd = LiteraryWorkDetail("en", "Burning Daylight")
+        lw.details.append(lwd)
+        db.session.commit()
+
+        with current_app.test_request_context('/'):
+            lw_lnk = url_for('api.get_literary_work', work_id=lw.id)
+            missing_lnk = url_for('api.get_literary_work', work_id=lw.id + 1)
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+
+        response = self.client.get(lw_lnk, headers=headers)
+        self.assertTrue(response.status_code == 200)
+        etag = response.headers['ETag']
+        self.assertTrue(etag)
+        self.assertTrue(response.headers['Last-Modified'])
+        self.assertTrue('no-cache' in response.headers['Cache-Control'])
+
+        # unchanged resource is answered with 304
+        response = self.client.get(
+            lw_lnk, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertTrue(response.status_code == 304)
+        self.assertTrue(response.data == b'')
+
+        # validator for other language does not match
+        response = self.client.get(
+            lw_lnk + '?lang=ru',
+            headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertTrue(response.status_code == 200)
+
+        # adding a detail changes the version
+        lw.details.append(LiteraryWorkDetail("ru", "Time-Is-Money"))
+        db.session.commit()
+        response = self.client.get(
+            lw_lnk, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertTrue(response.status_code == 200)
+        self.assertTrue(response.headers['ETag'] != etag)
+
+        response = self.client.get(missing_lnk, headers=headers)
+        self.assertTrue(response.status_code == 404)
+
+    def test_batch_lookup(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+
+        author1 = Author()
+        db.session.add(author1)
+        author1_details = AuthorDetail("en", "London")
+        author1_details.first_name = "Jack"
+        author1.details.append(author1_details)
+
+        works = []
+        for i in range(20):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(i)))
+            works.append(lw)
+        db.session.commit()
+        for lw in works:
+            db.session.add(Authors2LiteraryWorks(author_id=author1.id,
+                                                 literary_work_id=lw.id))
+        db.session.commit()
+
+        current_app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        ids = [works[5].id, works[2].id, 100500, works[5].id]
+        response = self.client.get(
+            self.lws_lnk + '?ids=' + ','.join(str(i) for i in ids),
+            headers=headers)
+        self.assertTrue(response.status_code == 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [works[5].id, works[2].id])
+        self.assertEqual(json_response['_missing'], [100500])
+        self.assertEqual(json_response['_items'][0]['title'], "Title 5")
+        self.assertEqual(json_response['_items'][0]['authors'][0]['name'],
+                         "Jack London")
+        # requests of the test client share the session, so the user's role
+        # is loaded by the first one only: count the repeated request
+        response = self.client.get(
+            self.lws_lnk + '?ids=' + ','.join(str(i) for i in ids),
+            headers=headers)
+        few_queries = int(response.headers['X-Query-Count'])
+
+        # number of queries doesn't depend on number of requested works
+        response = self.client.get(
+            self.lws_lnk + '?ids=' + ','.join(str(lw.id) for lw in works),
+            headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['_items']), 20)
+        self.assertEqual(int(response.headers['X-Query-Count']), few_queries)
+
+        response = self.client.get(
+            self.authors_lnk + '?ids={0}'.format(author1.id), headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0]['full_name'],
+                         "Jack London")
+        self.assertEqual(json_response['_missing'], [])
+
+        response = self.client.get(self.lws_lnk + '?ids=1,two',
+                                   headers=headers)
+        self.assertTrue(response.status_code == 400)
+
+    def test_author_embedded_works(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+
+        author1 = Author()
+        db.session.add(author1)
+        author1.details.append(AuthorDetail("en", "London"))
+        works = []
+        for i in range(25):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(i)))
+            works.append(lw)
+        db.session.commit()
+        for lw in works:
+            db.session.add(Authors2LiteraryWorks(author_id=author1.id,
+                                                 literary_work_id=lw.id))
+        db.session.commit()
+
+        limit = current_app.config['ELIBRARIAN_EMBEDDED_WORKS_LIMIT']
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            author_lnk = url_for('api.get_author', author_id=author1.id)
+            author_works_lnk = url_for('api.get_author_literary_works',
+                                       author_id=author1.id, _external=True)
+            author_works_lnk_pg2 = url_for('api.get_author_literary_works',
+                                           author_id=author1.id, page=2)
+
+        response = self.client.get(author_lnk, headers=headers)
+        self.assertTrue(response.status_code == 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['literary_works_count'], 25)
+        self.assertEqual(len(json_response['literary_works']), limit)
+        self.assertEqual(json_response['literary_works'][0]['id'],
+                         works[0].id)
+        self.assertEqual(json_response['literary_works_url'],
+                         author_works_lnk)
+
+        # listing carries only works count
+        response = self.client.get(self.authors_lnk, headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0]['literary_works_count'],
+                         25)
+        self.assertTrue('literary_works' not in json_response['_items'][0])
+
+        response = self.client.get(author_works_lnk_pg2, headers=headers)
+        self.assertTrue(response.status_code == 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_meta']['total'], 25)
+        self.assertEqual(
+            json_response['_items'][0]['id'],
+            works[current_app.config['ELIBRARIAN_ITEMS_PER_PAGE']].id)
+        self.assertTrue('prev' in json_response['_links'])
+
+    def test_sparse_fieldsets(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+
+        author1 = Author()
+        db.session.add(author1)
+        author1.details.append(AuthorDetail("en", "London"))
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lw.details.append(LiteraryWorkDetail("en", "Burning Daylight"))
+        db.session.commit()
+        db.session.add(Authors2LiteraryWorks(author_id=author1.id,
+                                             literary_work_id=lw.id))
+        db.session.commit()
+
+        current_app.config['ELIBRARIAN_QUERY_STATS_HEADERS'] = True
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+
+        # the first request also loads the user's role into the session
+        # shared by test client requests, so the repeated one is counted
+        self.client.get(self.lws_lnk, headers=headers)
+        response = self.client.get(self.lws_lnk, headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertTrue('authors' in json_response['_items'][0])
+        self.assertTrue('url' in json_response['_items'][0])
+        full_queries = int(response.headers['X-Query-Count'])
+
+        response = self.client.get(self.lws_lnk + '?fields=id,title&embed=',
+                                   headers=headers)
+        self.assertTrue(response.status_code == 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0],
+                         {'id': lw.id, 'title': "Burning Daylight"})
+        self.assertTrue(int(response.headers['X-Query-Count']) <
+                        full_queries)
+
+        response = self.client.get(self.authors_lnk + '?fields=full_name',
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0],
+                         {'id': author1.id, 'full_name': "London"})
+
+        response = self.client.get(
+            self.authors_lnk + '?fields=id&embed=literary_works',
+            headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0]['literary_works'][0]['id'],
+                         lw.id)
+
+        response = self.client.get(self.lws_lnk + '?fields=id,isbn',
+                                   headers=headers)
+        self.assertTrue(response.status_code == 400)
+        response = self.client.get(self.authors_lnk + '?embed=genres',
+                                   headers=headers)
+        self.assertTrue(response.status_code == 400)
+
+    def test_changes_feed(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        db.session.commit()
+
+        with current_app.test_request_context('/'):
+            changes_lnk = url_for('api.get_changes')
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+
+        response = self.client.get(changes_lnk, headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'], [])
+        cursor = json_response['_meta']['cursor']
+
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lwd = LiteraryWorkDetail("en", "Burning Daylight")
+        lw.details.append(lwd)
+        db.session.commit()
+
+        response = self.client.get(changes_lnk + '?since={0}'.format(cursor),
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        changed = set((item['entity'], item['operation'])
+                      for item in json_response['_items'])
+        self.assertEqual(changed, set([('literary_work', 'upsert'),
+                                       ('literary_work_detail', 'upsert')]))
+        self.assertFalse(json_response['_meta']['has_more'])
+        cursor = json_response['_meta']['cursor']
+
+        lwd_id = lwd.id
+        lwd.title = "Time-Is-Money"
+        db.session.commit()
+        db.session.delete(lwd)
+        db.session.commit()
+
+        # both changes of the detail collapse into the latest one
+        response = self.client.get(changes_lnk + '?since={0}'.format(cursor),
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['_items']), 1)
+        self.assertEqual(json_response['_items'][0]['operation'], 'delete')
+        self.assertEqual(json_response['_items'][0]['id'], str(lwd_id))
+
+        # paging with limit
+        response = self.client.get(changes_lnk + '?since=0&limit=1',
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['_items']), 1)
+        self.assertTrue(json_response['_meta']['has_more'])
+
+        # a change flushed before but committed after a newer one is not
+        # skipped: the page ends before the recent gap
+        current_app.config['ELIBRARIAN_CHANGES_GAP_TIMEOUT'] = 60
+        response = self.client.get(changes_lnk, headers=headers)
+        cursor = loads(response.data.decode('utf-8'))['_meta']['cursor']
+
+        def add_change(seq, entity_id, age=0):
+            db.session.add(CatalogueChange(
+                seq=seq, entity='literary_work', entity_id=entity_id,
+                operation='upsert',
+                timestamp=datetime.utcnow() - timedelta(seconds=age)))
+            db.session.commit()
+
+        def read_changes(since):
+            response = self.client.get(
+                changes_lnk + '?since={0}'.format(since), headers=headers)
+            json_response = loads(response.data.decode('utf-8'))
+            return ([item['id'] for item in json_response['_items']],
+                    json_response['_meta']['cursor'])
+
+        add_change(cursor + 2, 'b')
+        self.assertEqual(read_changes(cursor), ([], cursor))
+        add_change(cursor + 1, 'a')
+        self.assertEqual(read_changes(cursor), (['a', 'b'], cursor + 2))
+        # gaps older than the timeout are left by rolled back transactions
+        add_change(cursor + 4, 'd', age=120)
+        self.assertEqual(read_changes(cursor + 2), (['d'], cursor + 4))
+
+    def test_rate_limit(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        db.session.commit()
+        current_app.config['ELIBRARIAN_RATE_LIMIT'] = True
+        current_app.config['ELIBRARIAN_RATE_LIMITS'] = (
+            (0x80, 0.001, 3),
+            (0x00, 0.001, 2),
+        )
+        current_app.config['ELIBRARIAN_RATE_LIMIT_PASSWORD_CHECKS'] = (
+            0.001, 100)
+        duke_headers = self.generate_auth_header("duke@example.com",
+                                                 "hardcore")
+
+        for remaining in (2, 1, 0):
+            response = self.client.get(self.authors_lnk,
+                                       headers=duke_headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-RateLimit-Limit'], '3')
+            self.assertEqual(response.headers['X-RateLimit-Remaining'],
+                             str(remaining))
+        response = self.client.get(self.authors_lnk, headers=duke_headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response.headers['Retry-After']) > 0)
+
+        # anonymous callers have their own, smaller bucket
+        anonymous_headers = self.generate_auth_header("", "")
+        for status_code in (200, 200, 429):
+            response = self.client.get(self.index_ext_lnk,
+                                       headers=anonymous_headers)
+            self.assertEqual(response.status_code, status_code)
+
+        # only failed password checks are limited per IP, shared backend
+        current_app.config['ELIBRARIAN_RATE_LIMIT_BACKEND'] = 'simple'
+        current_app.config['ELIBRARIAN_RATE_LIMIT_PASSWORD_CHECKS'] = (
+            0.001, 1)
+        current_app.extensions.pop('rate_limit_backend')
+        for i in range(2):
+            response = self.client.get(self.token_lnk, headers=duke_headers)
+            self.assertEqual(response.status_code, 200)
+        token = loads(response.data.decode('utf-8'))['token']
+        wrong_headers = self.generate_auth_header("duke@example.com",
+                                                  "wrong")
+        for status_code in (401, 429):
+            response = self.client.get(self.authors_lnk,
+                                       headers=wrong_headers)
+            self.assertEqual(response.status_code, status_code)
+        # passwords are not checked until the bucket refills
+        response = self.client.get(self.token_lnk, headers=duke_headers)
+        self.assertEqual(response.status_code, 429)
+
+        # token requests are counted per token
+        token_headers = self.generate_auth_header(token, "")
+        for status_code in (200, 200, 200, 429):
+            response = self.client.get(self.authors_lnk,
+                                       headers=token_headers)
+            self.assertEqual(response.status_code, status_code)
+
+    def test_compression(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        for i in range(20):
+            author = Author()
+            db.session.add(author)
+            author.details.append(AuthorDetail("en", "Name " + str(i)))
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lwd = LiteraryWorkDetail("en", "Burning Daylight")
+        lw.details.append(lwd)
+        db.session.commit()
+        text = ("Burning Daylight " * 10000).encode('utf-8')
+        book = LiteraryWorkStorage(literary_work_details_id=lwd.id,
+                                   mime_type='text/plain',
+                                   original_file_name='daylight.txt',
+                                   binary_data=text)
+        db.session.add(book)
+        db.session.commit()
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        gzip_headers = dict(headers, **{'Accept-Encoding': 'gzip'})
+        with current_app.test_request_context('/'):
+            book_lnk = url_for('api.download_literary_work_file',
+                               work_id=lw.id, file_id=book.id)
+
+        response = self.client.get(self.authors_lnk, headers=headers)
+        self.assertTrue('Content-Encoding' not in response.headers)
+        plain = response.data
+        response = self.client.get(self.authors_lnk, headers=gzip_headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue('Accept-Encoding' in response.headers['Vary'])
+        self.assertTrue(len(response.data) < len(plain))
+        self.assertEqual(zlib.decompress(response.data, 16 + zlib.MAX_WBITS),
+                         plain)
+
+        # streamed file is compressed on the fly
+        queries_before = len(get_debug_queries())
+        response = self.client.get(book_lnk, headers=headers)
+        self.assertEqual(response.data, text)
+        # file data is read in chunks, never loaded whole
+        self.assertFalse(any(
+            'binary_data AS' in query.statement
+            for query in get_debug_queries()[queries_before:]))
+        response = self.client.get(book_lnk, headers=gzip_headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(response.data, 16 + zlib.MAX_WBITS),
+                         text)
+
+        # precompressed variant is served as is
+        variant_data = gzip.compress(text)
+        db.session.add(book.make_variant('gzip', variant_data))
+        db.session.commit()
+        response = self.client.get(book_lnk, headers=gzip_headers)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.data, variant_data)
+        response = self.client.get(book_lnk, headers=headers)
+        self.assertEqual(response.data, text)
+
+    def test_profiling(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        reader = AuthUser(email="reader@example.com", username="reader",
+                          password="reader-pass", confirmed=True)
+        db.session.add(duke)
+        db.session.add(reader)
+        db.session.commit()
+        profiles_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profiles_dir)
+        current_app.config['ELIBRARIAN_PROFILES_DIR'] = profiles_dir
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            profiles_lnk = url_for('api.get_profiles')
+
+        # only administrators can trigger profiling
+        response = self.client.get(
+            self.authors_lnk,
+            headers=dict(self.generate_auth_header("reader@example.com",
+                                                   "reader-pass"),
+                         **{'X-Profile': 'cprofile'}))
+        self.assertTrue('X-Profile-Id' not in response.headers)
+        response = self.client.get(self.authors_lnk, headers=headers)
+        self.assertTrue('X-Profile-Id' not in response.headers)
+
+        response = self.client.get(
+            self.authors_lnk,
+            headers=dict(headers, **{'X-Profile': 'cprofile'}))
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-Profile-Id']
+        response = self.client.get(
+            self.authors_lnk, headers=dict(headers, **{'X-Profile': 'sample'}))
+        sample_id = response.headers['X-Profile-Id']
+
+        response = self.client.get(profiles_lnk, headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(set(item['id'] for item in json_response['_items']),
+                         set([profile_id, sample_id]))
+
+        response = self.client.get(profiles_lnk + '/' + profile_id,
+                                   headers=headers)
+        meta = loads(response.data.decode('utf-8'))
+        self.assertEqual(meta['mode'], 'cprofile')
+        self.assertEqual(meta['endpoint'], 'api.get_authors')
+        self.assertTrue(len(meta['queries']) > 0)
+        response = self.client.get(meta['url_data'], headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(len(response.data) > 0)
+
+        response = self.client.get(profiles_lnk + '/' + sample_id + '/data',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+
+        # profiles are available to administrators only
+        response = self.client.get(
+            profiles_lnk,
+            headers=self.generate_auth_header("reader@example.com",
+                                              "reader-pass"))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(profiles_lnk + '/../secret',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_sorted_literary_works(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        works = []
+        for i in range(3):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(i)))
+            works.append(lw)
+        db.session.commit()
+        # the last work is the most read one, the first has the best rating
+        for lw, read_flag, rating in ((works[0], True, 5),
+                                      (works[2], True, 3)):
+            entry = AuthUserPersonalLibrary(user_id=duke.id,
+                                            literary_work_id=lw.id,
+                                            read_flag=read_flag,
+                                            rating=rating)
+            db.session.add(entry)
+        db.session.add(AuthUserPersonalLibrary(user_id=duke.id,
+                                               literary_work_id=works[1].id,
+                                               plan_to_read=True))
+        db.session.commit()
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+
+        response = self.client.get(self.lws_lnk + '?sort=popular',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [works[2].id, works[0].id, works[1].id])
+
+        response = self.client.get(self.lws_lnk + '?sort=rating',
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [works[0].id, works[2].id, works[1].id])
+
+        response = self.client.get(self.lws_lnk + '?sort=unknown',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_alphabetical_listings(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        titles = ['Zebra', 'apple', 'Émile', 'Banana', 'Emma'] * 4
+        for i, title in enumerate(titles):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", title))
+            if i % 2:
+                # other languages titles are not listed
+                lw.details.append(LiteraryWorkDetail("ru", "Ъ" + title))
+        for last_name in ('Twain', 'london', 'Austen'):
+            author = Author()
+            db.session.add(author)
+            author.details.append(AuthorDetail("en", last_name))
+        db.session.commit()
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+
+        listed = []
+        url = self.lws_lnk + '?sort=title&lang=en'
+        while url:
+            response = self.client.get(url, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            json_response = loads(response.data.decode('utf-8'))
+            self.assertEqual(json_response['_meta']['total'], len(titles))
+            listed.extend(item['title'] for item in json_response['_items'])
+            url = json_response['_links'].get('next')
+            if url:
+                self.assertTrue('after=' in url)
+                # Test client drops query string of absolute URLs
+                url = url[len('http://localhost'):]
+        self.assertEqual(listed, ['apple'] * 4 + ['Banana'] * 4 +
+                         ['Émile'] * 4 + ['Emma'] * 4 + ['Zebra'] * 4)
+
+        # the title is updated together with its sort key
+        detail = LiteraryWorkDetail.query.filter_by(title='Zebra').first()
+        detail.title = 'Aardvark'
+        db.session.commit()
+        response = self.client.get(self.lws_lnk + '?sort=title&lang=en',
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_items'][0]['id'],
+                         detail.literary_work_id)
+
+        response = self.client.get(self.authors_lnk + '?sort=name&lang=en',
+                                   headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [3, 2, 1])
+
+        response = self.client.get(self.authors_lnk + '?sort=name&after=x',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_file_cover_and_metadata(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=admin_role)
+        db.session.add(duke)
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lwd = LiteraryWorkDetail("en", "Solaris")
+        lw.details.append(lwd)
+        db.session.commit()
+        book = LiteraryWorkStorage(literary_work_details_id=lwd.id,
+                                   mime_type='application/x-fictionbook+xml',
+                                   original_file_name='solaris.fb2',
+                                   binary_data=SOLARIS_FB2)
+        db.session.add(book)
+        db.session.commit()
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            metadata_lnk = url_for('api.get_literary_work_file_metadata',
+                                   work_id=lw.id, file_id=book.id)
+            cover_lnk = url_for('api.get_literary_work_file_cover',
+                                work_id=lw.id, file_id=book.id)
+
+        # nothing is extracted by web requests
+        response = self.client.get(metadata_lnk, headers=headers)
+        self.assertEqual(response.status_code, 404)
+        list(extraction.extract_pending(processes=1))
+
+        response = self.client.get(metadata_lnk, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual((json_response['title'], json_response['authors']),
+                         ('Solaris', ['Stanislaw Lem']))
+        self.assertTrue(json_response['covers'])
+
+        # cover is not an image, so it is served as it is
+        response = self.client.get(cover_lnk + '?size=small', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'cover')
+        etag = response.headers['ETag']
+        response = self.client.get(cover_lnk + '?size=small', headers=dict(
+            headers, **{'If-None-Match': etag}))
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(cover_lnk + '?size=huge', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_book_contents(self):
+        moderator_role = AuthRole.query.filter_by(name='moderator').first()
+        user_role = AuthRole.query.filter_by(name='user').first()
+        db.session.add(AuthUser(email="duke@example.com", username="duke",
+                                password="hardcore", confirmed=True,
+                                role=moderator_role))
+        db.session.add(AuthUser(email="reader@example.com", username="reader",
+                                password="reader-pass", confirmed=True,
+                                role=user_role))
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lwd = LiteraryWorkDetail("en", "Solaris")
+        lw.details.append(lwd)
+        db.session.commit()
+        book = LiteraryWorkStorage(literary_work_details_id=lwd.id,
+                                   mime_type='application/x-fictionbook+xml',
+                                   binary_data=SOLARIS_FB2)
+        db.session.add(book)
+        db.session.commit()
+        list(content_index.index_pending(processes=1))
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            search_lnk = url_for('api.search_book_contents')
+            file_ext_lnk = url_for('api.download_literary_work_file',
+                                   work_id=lw.id, file_id=book.id,
+                                   _external=True)
+
+        response = self.client.get(search_lnk + '?q=ocean&lang=en',
+                                   headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['_meta']['total'], 1)
+        hit = json_response['_items'][0]
+        self.assertEqual((hit['literary_work_id'], hit['file_url'],
+                          hit['snippet']),
+                         (lw.id, file_ext_lnk, '<mark>Ocean</mark>'))
+        response = self.client.get(search_lnk + '?q=ocean&lang=ru',
+                                   headers=headers)
+        self.assertEqual(loads(response.data.decode('utf-8'))['_items'], [])
+        response = self.client.get(search_lnk + '?q=+', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        # search requires permission to view library items
+        response = self.client.get(
+            search_lnk + '?q=ocean',
+            headers=self.generate_auth_header("reader@example.com",
+                                              "reader-pass"))
+        self.assertEqual(response.status_code, 403)
+
+    def test_personal_library_bulk(self):
+        user_role = AuthRole.query.filter_by(name='user').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True, role=user_role)
+        db.session.add(duke)
+        works = []
+        for title in ('Dune', 'Solaris'):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", title))
+            works.append(lw)
+        db.session.commit()
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            entries_lnk = url_for('api.upsert_library_entries')
+            import_lnk = url_for('api.import_library_csv')
+
+        response = self.client.post(entries_lnk, headers=headers, data=dumps({
+            'entries': [{'literary_work_id': works[0].id, 'read_flag': True,
+                         'rating': 5},
+                        {'literary_work_id': works[1].id, 'rating': 'good'}]
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual((json_response['created'], json_response['failed']),
+                         (1, 1))
+        self.assertEqual(json_response['errors'][0]['index'], 1)
+
+        response = self.client.post(
+            import_lnk, headers=headers, content_type='text/csv',
+            data='title,read_flag,rating\ndune,,4\nSolaris,yes,\nEden,yes,\n')
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual((json_response['created'], json_response['updated'],
+                          json_response['failed']), (1, 1, 1))
+        self.assertEqual(json_response['errors'][0]['line'], 4)
+        entry = AuthUserPersonalLibrary.query.filter_by(
+            user_id=duke.id, literary_work_id=works[0].id).one()
+        self.assertEqual((entry.read_flag, entry.rating), (True, 4))
+
+        response = self.client.post(import_lnk, headers=headers,
+                                    content_type='text/csv',
+                                    data='name\nDune\n')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(entries_lnk, headers=headers,
+                                    data=dumps({'entries': 'all'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_recommendations(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        users = []
+        for name in ('duke', 'earl', 'lord'):
+            user = AuthUser(email=name + "@example.com", username=name,
+                            password="hardcore", confirmed=True,
+                            role=admin_role)
+            db.session.add(user)
+            users.append(user)
+        works = []
+        for i in range(3):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(i)))
+            works.append(lw)
+        db.session.commit()
+        # earl and lord read the first two works, duke only the first one
+        for user, lw in ((users[0], works[0]), (users[1], works[0]),
+                         (users[1], works[1]), (users[2], works[0]),
+                         (users[2], works[1])):
+            db.session.add(AuthUserPersonalLibrary(
+                user_id=user.id, literary_work_id=lw.id, read_flag=True))
+        db.session.commit()
+        list(recommendations.rebuild())
+        headers = self.generate_auth_header("duke@example.com", "hardcore")
+        with current_app.test_request_context('/'):
+            similar_lnk = url_for('api.get_similar_literary_works',
+                                  work_id=works[1].id)
+            suggestions_lnk = url_for('api.get_suggestions')
+
+        response = self.client.get(similar_lnk, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [works[0].id])
+        self.assertTrue(0 < json_response['_items'][0]['score'] <= 1)
+
+        response = self.client.get(suggestions_lnk, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual([item['id'] for item in json_response['_items']],
+                         [works[1].id])
+
+        response = self.client.get(similar_lnk + '?limit=0', headers=headers)
+        self.assertEqual(response.status_code, 400)
+        with current_app.test_request_context('/'):
+            missing_lnk = url_for('api.get_similar_literary_works',
+                                  work_id=999)
+        response = self.client.get(missing_lnk, headers=headers)
+        self.assertEqual(response.status_code, 404)
+
 """
     def test_get_literary_work(self):
         admin_role = AuthRole.query.filter_by(name='administrator').first()
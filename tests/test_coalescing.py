@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from elibrarian_app import create_app
+from elibrarian_app.api_1_0.coalescing import SingleFlight, \
+    cached_json_response
+from werkzeug.contrib.cache import FileSystemCache, SimpleCache
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+        self.loads_lock = threading.Lock()
+
+    def load(self, key):
+        """Slow computation recording its calls"""
+        with self.loads_lock:
+            self.loads.append(key)
+        time.sleep(0.05)
+        return 'value of ' + key
+
+    def stampede(self, flights, caches, keys, threads_per_key=10):
+        results = []
+
+        def worker(number, key):
+            flight = flights[number % len(flights)]
+            cache = caches[number % len(caches)]
+            results.append(flight.do(key, cache, lambda: self.load(key)))
+
+        threads = [threading.Thread(target=worker, args=(number, key))
+                   for key in keys for number in range(threads_per_key)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_threads(self):
+        flight, cache = SingleFlight(), SimpleCache()
+        results = self.stampede([flight], [cache], ['a', 'b'])
+        self.assertEqual(sorted(self.loads), ['a', 'b'])
+        self.assertEqual(results.count('value of a'), 10)
+        self.assertEqual(results.count('value of b'), 10)
+        # lock entries are released
+        self.assertEqual(flight._locks, {})
+
+        # expired key is loaded again, once
+        cache.delete('a')
+        self.stampede([flight], [cache], ['a'])
+        self.assertEqual(sorted(self.loads), ['a', 'a', 'b'])
+
+    def test_processes(self):
+        # Separate flights and caches sharing a directory behave like
+        # processes of one host
+        directory = tempfile.mkdtemp()
+        try:
+            flights = [SingleFlight(directory + '/locks', stripes=4)
+                       for _ in range(3)]
+            caches = [FileSystemCache(directory) for _ in range(3)]
+            results = self.stampede(flights, caches, ['a', 'b', 'c'])
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(self.loads), ['a', 'b', 'c'])
+        self.assertEqual(len(results), 30)
+
+
+class CachedResponseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+
+    def test_cached_json_response(self):
+        loads = []
+
+        def build():
+            loads.append(1)
+            return {'id': len(loads)}
+
+        with self.app.test_request_context():
+            first = cached_json_response('etag-1', build)
+            second = cached_json_response('etag-1', build)
+            other = cached_json_response('etag-2', build)
+        self.assertEqual(first.get_data(), second.get_data())
+        self.assertNotEqual(first.get_data(), other.get_data())
+        self.assertEqual(first.mimetype, 'application/json')
+        self.assertEqual(len(loads), 2)
+
+        # caching disabled
+        self.app.config['ELIBRARIAN_REPRESENTATION_CACHE'] = 'null'
+        self.app.extensions.pop('representation_cache', None)
+        with self.app.test_request_context():
+            cached_json_response('etag-1', build)
+        self.assertEqual(len(loads), 3)
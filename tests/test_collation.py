@@ -0,0 +1,25 @@
+import unittest
+from elibrarian_app.collation import SORT_KEY_LENGTH, sort_key
+
+
+class CollationTestCase(unittest.TestCase):
+    def test_order(self):
+        titles = ['banana', 'Apple pie', 'apple', 'Émile', 'Emma',
+                  'zebra']
+        self.assertEqual(sorted(titles, key=lambda t: sort_key('en', t)),
+                         ['apple', 'Apple pie', 'banana', 'Émile',
+                          'Emma', 'zebra'])
+
+    def test_parts(self):
+        # Parts are compared one after another
+        self.assertLess(sort_key('en', 'London', 'Jack'),
+                        sort_key('en', 'London', 'John'))
+        self.assertLess(sort_key('en', 'Lond', 'Zed'),
+                        sort_key('en', 'London', 'Jack'))
+        self.assertLess(sort_key('en', 'London', None),
+                        sort_key('en', 'London', 'Jack'))
+
+    def test_key_format(self):
+        key = sort_key('en', 'x' * 1000)
+        self.assertLessEqual(len(key), SORT_KEY_LENGTH)
+        int(key, 16)
@@ -0,0 +1,184 @@
+import io
+import os
+import unittest
+import zipfile
+from elibrarian_app import content_index, create_app, db, extraction
+from elibrarian_app.models import BookTextChunk, BookTextIndex, \
+    BookTextTerm, LiteraryWork, LiteraryWorkDetail, LiteraryWorkStorage
+
+CONTAINER = (
+    '<?xml version="1.0"?>'
+    '<container version="1.0" '
+    'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+    '<rootfile full-path="content.opf" '
+    'media-type="application/oebps-package+xml"/></rootfiles></container>')
+PACKAGE = (
+    '<?xml version="1.0"?>'
+    '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+    '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    '<dc:title>Dune</dc:title></metadata>'
+    '<manifest><item id="one" href="one.xhtml" '
+    'media-type="application/xhtml+xml"/><item id="two" href="two.xhtml" '
+    'media-type="application/xhtml+xml"/></manifest>'
+    '<spine><itemref idref="two"/><itemref idref="one"/></spine></package>')
+FB2 = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0">'
+    '<description><title-info><book-title>Solaris</book-title><annotation>'
+    '<p>Not indexed</p></annotation></title-info></description>'
+    '<body><title><p>Solaris</p></title><section><p>The  ocean '
+    '<emphasis>thinks</emphasis>.</p></section></body></FictionBook>')
+
+
+_index_file = content_index.index_file
+
+
+def crash(data, mime_type, chunk_size, with_terms):
+    # Pool process dies as if killed
+    if data == b'crash':
+        os._exit(1)
+    return _index_file(data, mime_type, chunk_size, with_terms)
+
+
+def make_epub(text='Fear is the <em>mind</em>-killer.'):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('META-INF/container.xml', CONTAINER)
+        archive.writestr('content.opf', PACKAGE)
+        archive.writestr('one.xhtml', '<html><body><p>{0}</p></body>'
+                                      '</html>'.format(text))
+        archive.writestr('two.xhtml', '<html><head><title>Two</title></head>'
+                                      '<body><h1>Chapter&#160;1</h1>'
+                                      'I must not<br/>fear.</body></html>')
+    return data.getvalue()
+
+
+class TextExtractionTestCase(unittest.TestCase):
+    def test_paragraphs(self):
+        self.assertEqual(list(extraction.iter_paragraphs(make_epub())),
+                         ['Chapter 1', 'I must not', 'fear.',
+                          'Fear is the mind-killer.'])
+        self.assertEqual(list(extraction.iter_paragraphs(
+            FB2.encode('utf-8'))), ['Solaris', 'The ocean thinks.'])
+        self.assertEqual(list(extraction.iter_paragraphs(
+            'Солярис\n\n\nОкеан\nдумает'.encode('cp1251'), 'text/plain')),
+            ['Солярис', 'Океан думает'])
+        with self.assertRaises(ValueError):
+            list(extraction.iter_paragraphs(b'plain text'))
+
+    def test_chunks(self):
+        self.assertEqual(list(content_index.make_chunks(
+            ['aaaaa', 'bb', 'c' * 12, 'dd ee ff'], 8)),
+            ['aaaaa\nbb', 'cccccccc', 'cccc', 'dd ee ff'])
+        result = content_index.index_file(make_epub(), None, 16, True)
+        self.assertIsNone(result['error'])
+        self.assertEqual(result['chunks'][1], 'I must not\nfear.')
+        self.assertEqual(result['terms'][1],
+                         {'i': 1, 'must': 1, 'not': 1, 'fear': 1})
+        self.assertEqual(content_index.index_file(b'x', None, 20, True)[
+            'error'], 'ValueError: Unsupported file format')
+
+    def test_snippet(self):
+        text = 'x ' * 300 + 'Fear is the mind-killer. ' + 'y ' * 300
+        snippet = content_index.make_snippet(text, ['fear', 'mind'],
+                                             ('[', ']'), width=60)
+        self.assertEqual(snippet, 'x x x x x x x x x [Fear] is the '
+                                  '[mind]-killer. y y y y y y y y')
+
+
+class ContentIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.details = {}
+        for lang, title in (('en', 'Dune'), ('ru', 'Дюна')):
+            lw = LiteraryWork(lang)
+            db.session.add(lw)
+            self.details[lang] = LiteraryWorkDetail(lang, title)
+            lw.details.append(self.details[lang])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_file(self, lang, data, mime_type='application/epub+zip'):
+        stored = LiteraryWorkStorage(
+            literary_work_details_id=self.details[lang].id,
+            mime_type=mime_type, binary_data=data)
+        db.session.add(stored)
+        db.session.commit()
+        return stored
+
+    def test_index_pending(self):
+        epub = self.add_file('en', make_epub())
+        # The same content is indexed once
+        self.add_file('en', make_epub())
+        self.add_file('en', b'broken')
+        text = self.add_file('ru', 'Океан думает.\n\nОкеан молчит.'.encode(
+            'utf-8'), 'text/plain')
+        self.assertEqual(list(content_index.index_pending(processes=1)),
+                         [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual(BookTextIndex.query.get((epub.checksum, 'en')).chunks,
+                         1)
+        self.assertEqual(BookTextChunk.query.filter_by(
+            checksum=text.checksum).count(), 1)
+        self.assertEqual(list(content_index.index_pending(processes=1)), [])
+
+        total, hits = content_index.search('the MIND', 'en', 1, 10)
+        self.assertEqual(total, 1)
+        self.assertEqual((hits[0]['checksum'], hits[0]['score']),
+                         (epub.checksum, 2))
+        self.assertIn('<mark>mind</mark>-killer', hits[0]['snippet'])
+        self.assertEqual(content_index.search('mind ocean', 'en', 1, 10),
+                         (0, []))
+        self.assertEqual(content_index.search('океан', 'en', 1, 10), (0, []))
+        total, hits = content_index.search('океан', 'ru', 1, 10)
+        self.assertEqual(hits[0]['snippet'], '<mark>Океан</mark> думает. '
+                                             '<mark>Океан</mark> молчит.')
+        self.assertEqual(content_index.locate([text.checksum], 'ru'),
+                         {text.checksum: (self.details['ru'].literary_work_id,
+                                          text.id)})
+
+        # Changed file version is indexed, index of the old one is removed
+        text.binary_data = 'Океан спит.'.encode('utf-8')
+        db.session.commit()
+        self.assertEqual(list(content_index.index_pending(processes=1)),
+                         [(1, 1)])
+        self.assertEqual(content_index.search('думает', 'ru', 1, 10), (0, []))
+        self.assertEqual(content_index.search('спит', 'ru', 1, 10)[0], 1)
+        self.assertEqual(BookTextTerm.query.filter_by(lang='ru').count(), 2)
+
+    def test_snippet_escaping(self):
+        self.add_file('en', make_epub(
+            'Beware &lt;script&gt;alert(1)&lt;/script&gt; of the worm.'))
+        list(content_index.index_pending(processes=1))
+        total, hits = content_index.search('worm', 'en', 1, 10)
+        self.assertEqual(total, 1)
+        self.assertTrue(hits[0]['snippet'].endswith(
+            '&lt;script&gt;alert(1)&lt;/script&gt; of the '
+            '<mark>worm</mark>.'))
+        self.assertNotIn('<script>', hits[0]['snippet'])
+        self.assertEqual(content_index._highlight(
+            '<b>\x02worm\x03</b>', ('<mark>', '</mark>')),
+            '&lt;b&gt;<mark>worm</mark>&lt;/b&gt;')
+
+    def test_broken_pool(self):
+        epub = self.add_file('en', make_epub())
+        crashing = self.add_file('ru', b'crash', 'text/plain')
+        content_index.index_file = crash
+        try:
+            self.assertEqual(list(content_index.index_pending(processes=2)),
+                             [(2, 2)])
+        finally:
+            content_index.index_file = _index_file
+        # Only the file which killed the pool process fails
+        index = BookTextIndex.query.get((epub.checksum, 'en'))
+        self.assertIsNone(index.error)
+        self.assertEqual(content_index.search('mind', 'en', 1, 10)[0], 1)
+        index = BookTextIndex.query.get((crashing.checksum, 'ru'))
+        self.assertEqual(index.chunks, 0)
+        self.assertTrue(index.error.startswith('BrokenProcessPool'))
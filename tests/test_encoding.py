@@ -0,0 +1,35 @@
+import unittest
+from datetime import date, datetime
+from json import loads
+from elibrarian_app import create_app
+from elibrarian_app.api_1_0 import encoding
+
+
+class JSONEncodingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def test_encoders_agree(self):
+        obj = {'title': 'Солярис', 'timestamp': datetime(2015, 3, 1, 12, 30),
+               'published': date(1961, 1, 1), 'pages': [1, 2.5, None]}
+        expected = loads(encoding.dumps(obj, encoder='stdlib'))
+        for name in encoding.ENCODERS:
+            for compact in (True, False):
+                output = encoding.dumps(obj, encoder=name, compact=compact)
+                if isinstance(output, bytes):
+                    output = output.decode('utf-8')
+                self.assertEqual(loads(output), expected, name)
+
+    @unittest.skipIf(encoding.orjson is None, "orjson is not installed")
+    def test_orjson_datetime(self):
+        # Application encoder format, not ISO 8601 of orjson
+        self.assertEqual(
+            encoding.dumps({'at': datetime(2015, 3, 1, 12, 30)},
+                           encoder='orjson'),
+            encoding.dumps({'at': datetime(2015, 3, 1, 12, 30)},
+                           encoder='stdlib').encode('utf-8'))
@@ -0,0 +1,189 @@
+import base64
+import hashlib
+import io
+import os
+import unittest
+import zipfile
+from json import loads
+from elibrarian_app import create_app, db, extraction
+from elibrarian_app.models import BookCover, BookFileMetadata, LiteraryWork, \
+    LiteraryWorkDetail, LiteraryWorkStorage
+
+CONTAINER = (
+    '<?xml version="1.0"?>'
+    '<container version="1.0" '
+    'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+    '<rootfile full-path="OEBPS/content.opf" '
+    'media-type="application/oebps-package+xml"/></rootfiles></container>')
+PACKAGE = (
+    '<?xml version="1.0"?>'
+    '<package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+    '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+    '<dc:title>Dune</dc:title><dc:creator>Frank Herbert</dc:creator>'
+    '<dc:language>en</dc:language><dc:publisher>Chilton</dc:publisher>'
+    '<meta name="cover" content="cover-image"/></metadata>'
+    '<manifest><item id="cover-image" href="images/cover%20art.png" '
+    'media-type="image/png"/><item id="chapter" href="text/chapter.xhtml" '
+    'media-type="application/xhtml+xml"/></manifest>'
+    '<spine><itemref idref="chapter"/></spine></package>')
+FB2 = (
+    '<?xml version="1.0" encoding="utf-8"?>'
+    '<FictionBook xmlns="http://www.gribuser.ru/xml/fictionbook/2.0" '
+    'xmlns:l="http://www.w3.org/1999/xlink"><description><title-info>'
+    '<genre>sf</genre><author><first-name>Stanislaw</first-name>'
+    '<last-name>Lem</last-name></author><book-title>Solaris</book-title>'
+    '<annotation><p>The   ocean</p></annotation>'
+    '<coverpage><image l:href="#cover.jpg"/></coverpage><lang>pl</lang>'
+    '</title-info><publish-info><year>1961</year></publish-info>'
+    '</description><body><section><p>{0}</p></section></body>'
+    '<binary id="cover.jpg" content-type="image/jpeg">{1}</binary>'
+    '</FictionBook>')
+
+
+def make_epub(cover=b'cover'):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, 'w') as archive:
+        archive.writestr('mimetype', 'application/epub+zip')
+        archive.writestr('META-INF/container.xml', CONTAINER)
+        archive.writestr('OEBPS/content.opf', PACKAGE)
+        archive.writestr('OEBPS/images/cover art.png', cover)
+        archive.writestr('OEBPS/text/chapter.xhtml',
+                         '<html><body><p>' + 'word ' * 720 +
+                         '</p></body></html>')
+    return data.getvalue()
+
+
+def make_fb2(cover=b'cover'):
+    return FB2.format('x' * 4000, base64.b64encode(cover).decode(
+        'ascii')).encode('utf-8')
+
+
+_extract_file = extraction.extract_file
+
+
+def crash(data, sizes):
+    # Pool process dies as if killed
+    if data == b'crash':
+        os._exit(1)
+    return _extract_file(data, sizes)
+
+
+def make_png():
+    image = extraction.Image.new('RGB', (600, 900), (200, 20, 20))
+    data = io.BytesIO()
+    image.save(data, 'PNG')
+    return data.getvalue()
+
+
+class ExtractionTestCase(unittest.TestCase):
+    def test_epub(self):
+        result = extraction.extract_file(make_epub(), {})
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['format'], result['title'],
+                          result['authors'], result['lang'],
+                          result['page_count']),
+                         ('epub', 'Dune', ['Frank Herbert'], 'en', 2))
+        self.assertEqual(result['details'], {'publisher': ['Chilton']})
+        self.assertEqual(result['covers'][0][:2], ('original', 'image/png'))
+
+    def test_fb2(self):
+        result = extraction.extract_file(make_fb2(), {})
+        self.assertIsNone(result['error'])
+        self.assertEqual((result['format'], result['title'],
+                          result['authors'], result['lang'],
+                          result['page_count']),
+                         ('fb2', 'Solaris', ['Stanislaw Lem'], 'pl', 3))
+        self.assertEqual(result['details'], {'subject': ['sf'],
+                                             'description': ['The ocean'],
+                                             'date': ['1961']})
+        self.assertEqual(result['covers'][0][4], b'cover')
+
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, 'w') as archive:
+            archive.writestr('solaris.fb2', make_fb2())
+        self.assertEqual(
+            extraction.extract_file(data.getvalue(), {})['title'], 'Solaris')
+
+    def test_errors(self):
+        self.assertEqual(extraction.extract_file(b'plain text', {})['error'],
+                         'ValueError: Unsupported file format')
+        self.assertTrue(extraction.extract_file(
+            b'<FictionBook><broken', {})['error'].startswith('ParseError'))
+        max_cover_size = extraction.MAX_COVER_SIZE
+        extraction.MAX_COVER_SIZE = 4
+        try:
+            self.assertEqual(extraction.extract_file(make_fb2(), {})['error'],
+                             'ValueError: cover.jpg is too large')
+            self.assertTrue(extraction.extract_file(make_epub(), {})[
+                'error'].startswith('ValueError'))
+        finally:
+            extraction.MAX_COVER_SIZE = max_cover_size
+
+    @unittest.skipIf(extraction.Image is None, "Pillow is not installed")
+    def test_thumbnails(self):
+        result = extraction.extract_file(make_epub(make_png()),
+                                         {'small': (96, 144)})
+        self.assertEqual([cover[:4] for cover in result['covers']],
+                         [('original', 'image/png', 600, 900),
+                          ('small', 'image/jpeg', 96, 144)])
+
+
+class ExtractPendingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        self.detail = LiteraryWorkDetail("en", "Dune")
+        lw.details.append(self.detail)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_file(self, data):
+        stored = LiteraryWorkStorage(literary_work_details_id=self.detail.id,
+                                     mime_type='application/epub+zip',
+                                     binary_data=data)
+        db.session.add(stored)
+        db.session.commit()
+        return stored
+
+    def test_extract_pending(self):
+        epub = make_epub()
+        first = self.add_file(epub)
+        self.assertEqual(first.checksum, hashlib.sha256(epub).hexdigest())
+        # The same content is extracted once
+        self.add_file(epub)
+        broken = self.add_file(b'broken')
+        self.assertEqual(list(extraction.extract_pending(processes=1)),
+                         [(1, 2), (2, 2)])
+        metadata = BookFileMetadata.query.get(first.checksum)
+        self.assertEqual(metadata.title, 'Dune')
+        self.assertEqual(loads(metadata.authors), ['Frank Herbert'])
+        self.assertIsNotNone(BookCover.query.get((first.checksum,
+                                                  'original')))
+        self.assertIsNotNone(BookFileMetadata.query.get(broken.checksum).error)
+        self.assertEqual(list(extraction.extract_pending(processes=1)), [])
+
+    def test_broken_pool(self):
+        epub = self.add_file(make_epub())
+        crashing = self.add_file(b'crash')
+        broken = self.add_file(b'broken')
+        extraction.extract_file = crash
+        try:
+            self.assertEqual(list(extraction.extract_pending(processes=3)),
+                             [(3, 3)])
+        finally:
+            extraction.extract_file = _extract_file
+        # Only the file which killed the pool process fails
+        self.assertEqual(BookFileMetadata.query.get(epub.checksum).title,
+                         'Dune')
+        self.assertTrue(BookFileMetadata.query.get(crashing.checksum)
+                        .error.startswith('BrokenProcessPool'))
+        self.assertTrue(BookFileMetadata.query.get(broken.checksum)
+                        .error.startswith('ValueError'))
@@ -0,0 +1,149 @@
+import unittest
+from json import dumps, loads
+from base64 import b64encode
+from datetime import datetime, timedelta
+from elibrarian_app import create_app, db, jobs
+from elibrarian_app.models import AuthRole, AuthUser, BackgroundJob
+from flask import current_app, url_for
+
+calls = []
+
+
+@jobs.job('test_count', max_attempts=2)
+def count_job(context, items, fail=False):
+    calls.append(context.attempt)
+    context.progress(0.5, 'half of {0} items'.format(items))
+    if fail:
+        raise RuntimeError('job failed')
+    return {'items': items}
+
+
+@jobs.job('test_taken_over', max_attempts=1)
+def taken_over_job(context, fail=False):
+    # The job is considered stale, requeued and claimed by another worker
+    table = BackgroundJob.__table__
+    db.engine.execute(table.update().where(
+        table.c.id == context.job_id).values(worker='other-worker'))
+    if fail:
+        raise RuntimeError('job failed')
+    return {}
+
+class BackgroundJobsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app.config['ELIBRARIAN_JOBS_RETRY_DELAY'] = 0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        AuthRole.insert_roles()
+        del calls[:]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def run_due_jobs(self):
+        while True:
+            job_id = jobs.claim_job('test-worker')
+            if job_id is None:
+                break
+            jobs.run_job(job_id)
+
+    def test_run_and_retry(self):
+        ok_job, created = jobs.enqueue('test_count', {'items': 3})
+        self.assertTrue(created)
+        failing_job, _ = jobs.enqueue('test_count',
+                                      {'items': 1, 'fail': True})
+        ok_id, failing_id = ok_job.id, failing_job.id
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no_such_job')
+
+        self.run_due_jobs()
+        ok_job = BackgroundJob.query.get(ok_id)
+        self.assertEqual(ok_job.status, BackgroundJob.DONE)
+        self.assertEqual(loads(ok_job.result), {'items': 3})
+        self.assertEqual(ok_job.progress, 1.0)
+        self.assertEqual(ok_job.progress_message, 'half of 3 items')
+        # the failing job was retried once and then marked failed
+        failing_job = BackgroundJob.query.get(failing_id)
+        self.assertEqual(failing_job.status, BackgroundJob.FAILED)
+        self.assertEqual(failing_job.attempts, 2)
+        self.assertTrue('job failed' in failing_job.error)
+        self.assertEqual(calls, [1, 1, 2])
+
+    def test_idempotency_and_claiming(self):
+        first, created = jobs.enqueue('test_count', {'items': 1},
+                                      idempotency_key='import-1')
+        second, created_again = jobs.enqueue('test_count', {'items': 2},
+                                             idempotency_key='import-1')
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(first.id, second.id)
+
+        # a job is claimed only once
+        job_id = jobs.claim_job('worker-1')
+        self.assertEqual(job_id, first.id)
+        self.assertIsNone(jobs.claim_job('worker-2'))
+
+        # job of a dead worker is requeued
+        BackgroundJob.query.get(job_id).heartbeat = \
+            datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(jobs.requeue_stale_jobs(60), 1)
+        self.assertEqual(jobs.claim_job('worker-2'), job_id)
+
+    def test_taken_over(self):
+        for fail in (False, True):
+            job, _ = jobs.enqueue('test_taken_over', {'fail': fail})
+            job_id = job.id
+            self.run_due_jobs()
+            # Outcome of the first run doesn't overwrite the new one
+            job = BackgroundJob.query.get(job_id)
+            self.assertEqual((job.status, job.worker, job.result),
+                             (BackgroundJob.RUNNING, 'other-worker', None))
+
+    def test_worker(self):
+        job, _ = jobs.enqueue('test_count', {'items': 5})
+        job_id = job.id
+        self.app.config['ELIBRARIAN_JOBS_POLL_INTERVAL'] = 0
+        jobs.Worker(self.app, 'testing_virtualenv', concurrency=1).run(
+            once=True)
+        db.session.remove()
+        self.assertEqual(BackgroundJob.query.get(job_id).status,
+                         BackgroundJob.DONE)
+
+    def test_api(self):
+        admin_role = AuthRole.query.filter_by(name='administrator').first()
+        db.session.add(AuthUser(email="duke@example.com", username="duke",
+                                password="hardcore", confirmed=True,
+                                role=admin_role))
+        db.session.commit()
+        client = self.app.test_client()
+        headers = {
+            'Authorization': 'Basic ' + b64encode(
+                b'duke@example.com:hardcore').decode('utf-8'),
+            'Content-Type': 'application/json'
+        }
+        with current_app.test_request_context('/'):
+            jobs_lnk = url_for('api.get_jobs')
+
+        body = dumps({'name': 'test_count', 'args': {'items': 7},
+                      'idempotency_key': 'api-1'})
+        response = client.post(jobs_lnk, headers=headers, data=body)
+        self.assertEqual(response.status_code, 201)
+        job_url = response.headers['Location']
+        response = client.post(jobs_lnk, headers=headers, data=body)
+        self.assertEqual(response.status_code, 200)
+        response = client.post(jobs_lnk, headers=headers,
+                               data=dumps({'name': 'no_such_job'}))
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get(job_url, headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(json_response['status'], 'queued')
+        self.assertEqual(json_response['args'], {'items': 7})
+
+        response = client.get(jobs_lnk + '?status=queued', headers=headers)
+        json_response = loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response['_items']), 1)
@@ -0,0 +1,138 @@
+import unittest
+from datetime import date
+from elibrarian_app import create_app, db
+from elibrarian_app.library_import import import_csv, parse_csv
+from elibrarian_app.models import AuthUser, AuthUserPersonalLibrary, \
+    Author, AuthorDetail, Authors2LiteraryWorks, LiteraryWork, \
+    LiteraryWorkCounters, LiteraryWorkDetail
+
+LANGS = ('en', 'ru')
+
+
+class PersonalLibraryBulkTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = AuthUser(email='reader@example.com', username='reader',
+                             password='secret')
+        db.session.add(self.user)
+        self.works = []
+        authors = []
+        for title, last_name in (('Anna Karenina', 'Tolstoy'),
+                                 ('Émile', 'Rousseau'),
+                                 ('Poems', 'Pushkin'),
+                                 ('Poems', 'Lermontov')):
+            author = Author()
+            db.session.add(author)
+            author.details.append(AuthorDetail('en', last_name))
+            authors.append(author)
+            lw = LiteraryWork('en')
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail('en', title))
+            self.works.append(lw)
+        db.session.commit()
+        for author, lw in zip(authors, self.works):
+            db.session.add(Authors2LiteraryWorks(author_id=author.id,
+                                                 literary_work_id=lw.id))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_entry(self, work):
+        return AuthUserPersonalLibrary.query.filter_by(
+            user_id=self.user.id, literary_work_id=work.id).first()
+
+    def get_counters(self, work):
+        counters = LiteraryWorkCounters.query.get(work.id)
+        db.session.refresh(counters)
+        return (counters.readers_count, counters.ratings_count,
+                counters.ratings_sum)
+
+    def test_bulk_upsert(self):
+        first, second = self.works[:2]
+        results = AuthUserPersonalLibrary.bulk_upsert(
+            db.session, self.user.id, [
+                {'literary_work_id': first.id, 'read_flag': True,
+                 'rating': 4, 'read_date': '2015-03-01'},
+                {'literary_work_id': second.id, 'plan_to_read': True},
+                {'literary_work_id': 999},
+                {'literary_work_id': first.id},
+                {'literary_work_id': second.id, 'rating': 7},
+                {'literary_work_id': second.id, 'read_progress': 'half'},
+                {'title': 'Unknown'}])
+        db.session.commit()
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'created'] + ['error'] * 5)
+        self.assertEqual(results[2]['message'], 'Unknown literary work')
+        self.assertEqual(results[3]['message'],
+                         'Duplicated entry of literary work')
+        entry = self.get_entry(first)
+        self.assertEqual((entry.read_flag, entry.rating, entry.read_date,
+                          entry.plan_to_read), (True, 4, date(2015, 3, 1),
+                                                False))
+        self.assertEqual(self.get_counters(first), (1, 1, 4))
+        self.assertEqual(self.get_counters(second), (0, 0, 0))
+
+        # Fields missing in an entry keep their values
+        results = AuthUserPersonalLibrary.bulk_upsert(
+            db.session, self.user.id, [
+                {'literary_work_id': first.id, 'rating': None},
+                {'literary_work_id': second.id, 'read_progress': 50}])
+        db.session.commit()
+        self.assertEqual([result['status'] for result in results],
+                         ['updated', 'updated'])
+        db.session.expire_all()
+        entry = self.get_entry(first)
+        self.assertEqual((entry.read_flag, entry.rating), (True, None))
+        self.assertTrue(self.get_entry(second).plan_to_read)
+        self.assertEqual(self.get_counters(first), (1, 0, 0))
+        self.assertEqual(self.get_counters(second), (1, 0, 0))
+
+        # Incremental counters agree with recounted ones
+        self.assertEqual(list(LiteraryWorkCounters.reconcile())[-1][1], 0)
+
+    def test_parse_csv(self):
+        rows = parse_csv('title,rating\nAnna Karenina,5\n\n"Émile",\n', 10)
+        self.assertEqual(rows, [(2, {'title': 'Anna Karenina',
+                                     'rating': '5'}),
+                                (4, {'title': 'Émile', 'rating': ''})])
+        with self.assertRaises(ValueError):
+            parse_csv('name,rating\nAnna Karenina,5\n', 10)
+        with self.assertRaises(ValueError):
+            parse_csv('title,shelf\nAnna Karenina,read\n', 10)
+        with self.assertRaises(ValueError):
+            parse_csv('title\nA\nB\nC\n', 2)
+
+    def test_import_csv(self):
+        anna, emile, pushkin, lermontov = self.works
+        results = import_csv(db.session, self.user.id, (
+            'title,author,read_flag,rating,read_date\n'
+            'anna karenina,,yes,5,2014-01-31\n'
+            'EMILE,,no,,\n'
+            'Poems,Alexander Pushkin,1,4.5,\n'
+            'Poems,,1,,\n'
+            'War and Peace,Tolstoy,1,,\n'
+            'Poems,Lermontov,maybe,,\n'
+            ',,1,,\n'), LANGS, 100)
+        db.session.commit()
+        self.assertEqual(
+            [(line, result['status'], result['literary_work_id'])
+             for line, result in results],
+            [(2, 'created', anna.id), (3, 'created', emile.id),
+             (4, 'created', pushkin.id), (5, 'error', None),
+             (6, 'error', None), (7, 'error', lermontov.id),
+             (8, 'error', None)])
+        self.assertEqual(results[3][1]['message'],
+                         '2 literary works match, specify author or lang')
+        self.assertEqual(results[4][1]['message'], 'No literary work matches')
+        entry = self.get_entry(anna)
+        self.assertEqual((entry.read_flag, entry.rating, entry.read_date),
+                         (True, 5, date(2014, 1, 31)))
+        self.assertFalse(self.get_entry(emile).read_flag)
+        self.assertEqual(self.get_counters(pushkin)[0], 1)
+        self.assertIsNone(self.get_entry(lermontov))
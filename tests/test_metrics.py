@@ -0,0 +1,32 @@
+import gc
+import threading
+import unittest
+from elibrarian_app.api_1_0.metrics import Counter, Histogram
+
+
+class MetricsTestCase(unittest.TestCase):
+    def test_counter_threads(self):
+        counter = Counter()
+        counter.inc(2)
+
+        def work():
+            for _ in range(5):
+                counter.inc()
+
+        for _ in range(3):
+            threads = [threading.Thread(target=work) for _ in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        gc.collect()
+        self.assertEqual(counter.value, 152)
+        # slots of ended threads are folded, only the main thread one is left
+        self.assertEqual(len(counter._slots), 1)
+
+    def test_histogram(self):
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(histogram.snapshot(),
+                         ([(1, 2), (5, 3), ('+Inf', 4)], 4, 14))
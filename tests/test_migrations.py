@@ -0,0 +1,135 @@
+import io
+import os
+import unittest
+import sqlalchemy as sa
+from sqlalchemy.sql import column, table
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from benchmarks.generator import generate
+from elibrarian_app import create_app, db, online_migrations
+from elibrarian_app.models import AuthRole
+
+# Size of seeded catalogue, raise it to check migrations on a large dataset
+AUTHORS_COUNT = int(os.environ.get('ELIBRARIAN_TEST_MIGRATION_AUTHORS', 200))
+
+
+class OnlineMigrationsTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app('testing_virtualenv')
+        with cls.app.app_context():
+            db.create_all()
+            AuthRole.insert_roles()
+            cls.counts = generate(AUTHORS_COUNT, works_per_author=5,
+                                  users_count=2, library_size=10)
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def setUp(self):
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.connection = db.engine.connect()
+        self.migration_context = MigrationContext.configure(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        db.session.remove()
+        self.app_context.pop()
+
+    def test_backfill_resumes(self):
+        details = table('literary_works_details', column('literary_work_id'),
+                        column('title'), column('title_length'))
+        total = self.counts['literary_works_details']
+        with Operations.context(self.migration_context) as op:
+            op.add_column('literary_works_details',
+                          sa.Column('title_length', sa.Integer()))
+            progress = []
+
+            def interrupt(table_name, done, total):
+                progress.append(done)
+                if len(progress) == 3:
+                    raise KeyboardInterrupt
+
+            values = {'title_length': sa.func.length(details.c.title)}
+            pending = details.c.title_length.is_(None)
+            with self.assertRaises(KeyboardInterrupt):
+                online_migrations.backfill(
+                    details, values, where=pending, key='literary_work_id',
+                    batch_size=100, pause=0, progress=interrupt)
+            done = progress[-1]
+            self.assertTrue(0 < done < total)
+
+            # The second run updates only remaining rows
+            updated = online_migrations.backfill(
+                details, values, where=pending, key='literary_work_id',
+                batch_size=100, pause=0, progress=None)
+            self.assertEqual(done + updated, total)
+            self.assertEqual(self.connection.execute(
+                sa.select([sa.func.count()]).select_from(details).where(
+                    pending)).scalar(), 0)
+            self.assertEqual(self.connection.execute(
+                sa.select([sa.func.count()]).select_from(details).where(
+                    details.c.title_length !=
+                    sa.func.length(details.c.title))).scalar(), 0)
+
+    def test_backfill_rows_visits_once(self):
+        details = table('literary_works_details', column('literary_work_id'),
+                        column('lang'), column('title'))
+        seen = []
+
+        def compute(row):
+            seen.append((row.literary_work_id, row.lang))
+            # Updated rows still match ``where``
+            return {'title': row.title}
+
+        with Operations.context(self.migration_context):
+            updated = online_migrations.backfill_rows(
+                details, ['literary_work_id', 'lang'], compute,
+                where=details.c.title.isnot(None), batch_size=7, pause=0,
+                progress=None)
+        self.assertEqual(updated, self.counts['literary_works_details'])
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(seen, sorted(seen))
+
+    def test_create_index_concurrently(self):
+        def index_names():
+            return [index['name'] for index in sa.inspect(
+                self.connection).get_indexes('literary_works_details')]
+
+        with Operations.context(self.migration_context):
+            online_migrations.create_index_concurrently(
+                'ix_test_title', 'literary_works_details', ['title'])
+            # Repeated run of interrupted migration keeps the index
+            online_migrations.create_index_concurrently(
+                'ix_test_title', 'literary_works_details', ['title'])
+            self.assertIn('ix_test_title', index_names())
+            online_migrations.drop_index_concurrently(
+                'ix_test_title', 'literary_works_details')
+            self.assertNotIn('ix_test_title', index_names())
+
+    def test_offline_postgresql(self):
+        output = io.StringIO()
+        context = MigrationContext.configure(
+            dialect_name='postgresql',
+            opts={'as_sql': True, 'output_buffer': output})
+        details = table('literary_works_details', column('title'),
+                        column('title_length'))
+        with Operations.context(context):
+            online_migrations.create_index_concurrently(
+                'ix_test_title', 'literary_works_details', ['title'])
+            online_migrations.backfill(
+                details, {'title_length': sa.func.length(details.c.title)},
+                where=details.c.title_length.is_(None))
+            with self.assertRaises(RuntimeError):
+                online_migrations.backfill_rows(
+                    details, ['title'], lambda row: {},
+                    where=details.c.title_length.is_(None))
+        sql = output.getvalue()
+        self.assertIn('COMMIT', sql)
+        self.assertIn('CREATE INDEX CONCURRENTLY ix_test_title ON '
+                      'literary_works_details (title)', sql)
+        self.assertIn('UPDATE literary_works_details SET title_length', sql)
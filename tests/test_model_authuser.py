@@ -1,6 +1,8 @@
 import unittest
 from elibrarian_app import create_app, db
-from elibrarian_app.models import AuthRole, AuthUser
+from elibrarian_app.models import AuthRole, AuthUser, Permission, TokenUser
+from flask.ext.sqlalchemy import get_debug_queries
+from itsdangerous import TimedJSONWebSignatureSerializer as Serializer
 
 
 class AuthUserModelTestCase(unittest.TestCase):
@@ -41,3 +43,72 @@ class AuthUserModelTestCase(unittest.TestCase):
         self.assertTrue(adm.is_administrator())
         self.assertEqual(duke.role_id, default_role.id)
 
+    def test_token_claims(self):
+        moderator_role = AuthRole.query.filter_by(name='moderator').first()
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True,
+                        role=moderator_role)
+        duke.preferred_lang = "ru"
+        db.session.add(duke)
+        db.session.commit()
+
+        token = duke.generate_auth_token(expiration=60)
+        user = AuthUser.verify_auth_token(token)
+        self.assertTrue(isinstance(user, TokenUser))
+        self.assertEqual(user.id, duke.id)
+        self.assertEqual(user.preferred_lang, "ru")
+        self.assertTrue(user.confirmed)
+        self.assertTrue(user.can(Permission.VIEW_LIBRARY_ITEMS))
+        self.assertFalse(user.is_administrator())
+
+        # verification of known token version doesn't touch database
+        queries_count = len(get_debug_queries())
+        AuthUser.verify_auth_token(token).can(Permission.VIEW_LIBRARY_ITEMS)
+        self.assertEqual(len(get_debug_queries()), queries_count)
+
+        # revocation
+        duke.revoke_tokens()
+        db.session.commit()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
+        token = duke.generate_auth_token(expiration=60)
+        self.assertIsNotNone(AuthUser.verify_auth_token(token))
+
+        # role change makes issued tokens stale
+        duke.role = AuthRole.query.filter_by(name='administrator').first()
+        db.session.commit()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
+        token = duke.generate_auth_token(expiration=60)
+        self.assertTrue(AuthUser.verify_auth_token(token).is_administrator())
+
+        # so do changes of preferred language and role permissions
+        duke.preferred_lang = "en"
+        db.session.commit()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
+        token = duke.generate_auth_token(expiration=60)
+        self.assertEqual(AuthUser.verify_auth_token(token).preferred_lang,
+                         "en")
+        duke.role.permissions = Permission.VIEW_LIBRARY_STATS
+        db.session.commit()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
+        token = duke.generate_auth_token(expiration=60)
+        self.assertFalse(AuthUser.verify_auth_token(token).is_administrator())
+        AuthRole.insert_roles()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
+        # rewriting the same permissions keeps tokens
+        token = duke.generate_auth_token(expiration=60)
+        AuthRole.insert_roles()
+        self.assertIsNotNone(AuthUser.verify_auth_token(token))
+
+        self.assertIsNone(AuthUser.verify_auth_token(token + 'x'))
+
+    def test_legacy_token(self):
+        duke = AuthUser(email="duke@example.com", username="duke",
+                        password="hardcore", confirmed=True)
+        db.session.add(duke)
+        db.session.commit()
+        token = Serializer(self.app.config['SECRET_KEY'],
+                           expires_in=60).dumps({'id': duke.id})
+        self.assertEqual(AuthUser.verify_auth_token(token), duke)
+        duke.revoke_tokens()
+        db.session.commit()
+        self.assertIsNone(AuthUser.verify_auth_token(token))
@@ -0,0 +1,82 @@
+import unittest
+from json import loads
+from elibrarian_app import create_app, db
+from elibrarian_app.models import Author, AuthorDetail, \
+    Authors2LiteraryWorks, LiteraryWork, LiteraryWorkCard, LiteraryWorkDetail
+from flask import current_app
+
+
+class LiteraryWorkCardModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app.config['ELIBRARIAN_WORK_CARDS'] = True
+        self.app.config['ELIBRARIAN_WORK_CARD_LANGS'] = ('en', 'ru')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_card(self, work_id, lang):
+        card = LiteraryWorkCard.query.filter_by(
+            literary_work_id=work_id, lang=lang).first()
+        return loads(card.card) if card else None
+
+    def test_cards_maintenance(self):
+        author = Author()
+        db.session.add(author)
+        author_details = AuthorDetail("en", "London")
+        author_details.first_name = "Jack"
+        author.details.append(author_details)
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lw.details.append(LiteraryWorkDetail("en", "Burning Daylight"))
+        db.session.commit()
+        db.session.add(Authors2LiteraryWorks(author_id=author.id,
+                                             literary_work_id=lw.id))
+        db.session.commit()
+
+        card = self.get_card(lw.id, "en")
+        self.assertEqual(card['title'], "Burning Daylight")
+        self.assertEqual(card['authors'], [{'id': author.id,
+                                            'name': "Jack London"}])
+        self.assertTrue('url' not in card)
+        # russian card falls back to english details
+        self.assertEqual(self.get_card(lw.id, "ru")['lang'], "en")
+
+        # new details in russian replace the fallback
+        lw.details.append(LiteraryWorkDetail("ru", "Время-не-ждет"))
+        db.session.commit()
+        self.assertEqual(self.get_card(lw.id, "ru")['lang'], "ru")
+
+        # author changes are propagated to cards of all author's works
+        author_details.first_name = "John"
+        db.session.commit()
+        self.assertEqual(self.get_card(lw.id, "en")['authors'][0]['name'],
+                         "John London")
+
+        # rolled back changes don't affect cards
+        author_details.first_name = "Jim"
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.get_card(lw.id, "en")['authors'][0]['name'],
+                         "John London")
+
+    def test_rebuild_all(self):
+        for i in range(7):
+            lw = LiteraryWork("en")
+            db.session.add(lw)
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(i)))
+        db.session.commit()
+        db.session.execute(LiteraryWorkCard.__table__.delete())
+        db.session.commit()
+        self.assertEqual(LiteraryWorkCard.query.count(), 0)
+
+        progress = list(LiteraryWorkCard.rebuild_all(batch_size=3))
+        self.assertEqual(progress, [3, 6, 7])
+        self.assertEqual(
+            LiteraryWorkCard.query.count(),
+            7 * len(current_app.config['ELIBRARIAN_WORK_CARD_LANGS']))
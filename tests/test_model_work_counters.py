@@ -0,0 +1,114 @@
+import unittest
+from elibrarian_app import create_app, db
+from elibrarian_app.models import AuthUser, AuthUserPersonalLibrary, \
+    LiteraryWork, LiteraryWorkCounters, LiteraryWorkDetail
+
+
+class LiteraryWorkCountersModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.users = [AuthUser(email='user{0}@example.com'.format(idx),
+                               username='user{0}'.format(idx),
+                               password='secret') for idx in range(3)]
+        db.session.add_all(self.users)
+        self.works = []
+        for idx in range(2):
+            lw = LiteraryWork("en")
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(idx)))
+            db.session.add(lw)
+            self.works.append(lw)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_counters(self, work):
+        counters = LiteraryWorkCounters.query.get(work.id)
+        db.session.refresh(counters)
+        return (counters.readers_count, counters.reading_count,
+                counters.plan_to_read_count, counters.ratings_count,
+                counters.ratings_sum, counters.rating_avg)
+
+    def add_entry(self, user, work, **values):
+        entry = AuthUserPersonalLibrary(user_id=user.id,
+                                        literary_work_id=work.id, **values)
+        db.session.add(entry)
+        db.session.commit()
+        return entry
+
+    def test_rating(self):
+        entry = AuthUserPersonalLibrary()
+        entry.rating = 4
+        self.assertEqual(entry.rating, 4)
+        entry.rating = None
+        self.assertIsNone(entry.rating)
+        with self.assertRaises(ValueError):
+            entry.rating = 6
+        with self.assertRaises(TypeError):
+            entry.rating = 'five'
+
+    def test_incremental_updates(self):
+        work = self.works[0]
+        self.assertEqual(self.get_counters(work), (0, 0, 0, 0, 0, 0.0))
+
+        first = self.add_entry(self.users[0], work, read_flag=True, rating=5)
+        self.add_entry(self.users[1], work, read_progress=30)
+        third = self.add_entry(self.users[2], work, plan_to_read=True)
+        self.assertEqual(self.get_counters(work), (2, 1, 1, 1, 5, 5.0))
+
+        third.plan_to_read = False
+        third.read_flag = True
+        third.rating = 2
+        db.session.commit()
+        self.assertEqual(self.get_counters(work), (3, 1, 0, 2, 7, 3.5))
+
+        db.session.delete(first)
+        db.session.commit()
+        self.assertEqual(self.get_counters(work), (2, 1, 0, 1, 2, 2.0))
+        self.assertEqual(self.get_counters(self.works[1]),
+                         (0, 0, 0, 0, 0, 0.0))
+
+        # Counters of deleted work are removed
+        other = self.works[1]
+        other_id = other.id
+        for detail in other.details:
+            db.session.delete(detail)
+        db.session.delete(other)
+        db.session.commit()
+        self.assertIsNone(LiteraryWorkCounters.query.get(other_id))
+
+    def test_reconcile(self):
+        work = self.works[0]
+        self.add_entry(self.users[0], work, read_flag=True, rating=4)
+        self.add_entry(self.users[1], work, read_flag=True, rating=2)
+        table = LiteraryWorkCounters.__table__
+        db.session.execute(table.update().values(readers_count=10))
+        db.session.execute(table.delete().where(
+            table.c.literary_work_id == self.works[1].id))
+        db.session.commit()
+
+        results = list(LiteraryWorkCounters.reconcile(batch_size=1))
+        self.assertEqual(results[-1], (2, 2))
+        self.assertEqual(self.get_counters(work), (2, 0, 0, 2, 6, 3.0))
+        self.assertEqual(self.get_counters(self.works[1]),
+                         (0, 0, 0, 0, 0, 0.0))
+        self.assertEqual(list(LiteraryWorkCounters.reconcile())[-1], (2, 0))
+
+    def test_sorted_query(self):
+        popular, rated = self.works
+        self.add_entry(self.users[0], popular, read_flag=True, rating=1)
+        self.add_entry(self.users[1], popular, read_progress=10)
+        self.add_entry(self.users[2], rated, read_flag=True, rating=5)
+        self.assertEqual(
+            [row.literary_work_id for row in
+             LiteraryWorkCounters.sorted_query('popular')],
+            [popular.id, rated.id])
+        self.assertEqual(
+            [row.literary_work_id for row in
+             LiteraryWorkCounters.sorted_query('rating')],
+            [rated.id, popular.id])
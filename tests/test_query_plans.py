@@ -0,0 +1,87 @@
+import unittest
+from base64 import b64encode
+from benchmarks.generator import USERS_PASSWORD, generate
+from elibrarian_app import create_app, db
+from elibrarian_app.index_advisor import IndexAdvisor, missing_indexes
+from elibrarian_app.models import AuthRole
+from flask import current_app, url_for
+from flask.ext.sqlalchemy import get_debug_queries
+
+
+class QueryPlansTestCase(unittest.TestCase):
+    """
+        Key API queries must keep their index plans: a full scan filtered by
+    a column without index fails the test. SQLite plans do not depend on
+    table sizes, so a small catalogue is enough.
+    """
+
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app.config['SQLALCHEMY_RECORD_QUERIES'] = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        AuthRole.insert_roles()
+        generate(authors_count=30, works_per_author=3, users_count=2,
+                 library_size=20)
+        self.client = self.app.test_client()
+        self.headers = {
+            'Authorization': 'Basic ' + b64encode(
+                ('user0@example.com:' + USERS_PASSWORD).encode('utf-8')
+            ).decode('utf-8')
+        }
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_key_api_queries(self):
+        with current_app.test_request_context('/'):
+            urls = [
+                url_for('api.get_authors'),
+                url_for('api.get_authors', page=2),
+                url_for('api.get_author', author_id=3),
+                url_for('api.get_author_literary_works', author_id=3),
+                url_for('api.get_literary_works'),
+                url_for('api.get_literary_works', page=2),
+                url_for('api.get_literary_work', work_id=5),
+            ]
+        # Requests share the test application context, so their queries
+        # are recorded together
+        queries_before = len(get_debug_queries())
+        for url in urls:
+            response = self.client.get(url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+        queries = [{'statement': query.statement,
+                    'parameters': query.parameters,
+                    'context': query.context}
+                   for query in get_debug_queries()[queries_before:]]
+        self.assertTrue(queries)
+        findings = IndexAdvisor(db.engine, min_rows=0).analyze(queries)
+        self.assertEqual(missing_indexes(findings), [])
+
+    def test_missing_index_detected(self):
+        if db.engine.dialect.name != 'sqlite':
+            self.skipTest('statements use SQLite parameters style')
+        queries = [{
+            'statement': 'SELECT literary_works_details.id '
+                         'FROM literary_works_details '
+                         'WHERE literary_works_details.title = ?',
+            'parameters': ['Title']
+        }, {
+            'statement': 'SELECT authors_2_literary_works.author_id '
+                         'FROM authors_2_literary_works '
+                         'WHERE authors_2_literary_works.literary_work_id = ?',
+            'parameters': [1]
+        }]
+        findings = missing_indexes(
+            IndexAdvisor(db.engine, min_rows=0).analyze(queries))
+        self.assertEqual(len(findings), 1)
+        self.assertEqual(findings[0]['table'], 'literary_works_details')
+        self.assertEqual(findings[0]['suggestions'], [
+            'CREATE INDEX ix_literary_works_details_title '
+            'ON literary_works_details (title)'])
+        # Tables smaller than the threshold are not reported
+        self.assertEqual(
+            IndexAdvisor(db.engine, min_rows=10 ** 6).analyze(queries), [])
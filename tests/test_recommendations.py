@@ -0,0 +1,106 @@
+import unittest
+from array import array
+from elibrarian_app import create_app, db, recommendations
+from elibrarian_app.models import AuthUser, AuthUserPersonalLibrary, \
+    LiteraryWork, LiteraryWorkDetail, LiteraryWorkNeighbour
+
+# Readers (user, work): works 1 and 2 are read together by three users,
+# works 1 and 3, 2 and 3 by two, work 4 by a single reader of works 1 and 2
+INTERACTIONS = ((1, 1), (1, 2), (1, 4), (2, 1), (2, 2), (2, 3),
+                (3, 1), (3, 2), (3, 3), (4, 3))
+
+
+def arrays(interactions):
+    return (array('l', [user for user, _ in interactions]),
+            array('l', [work for _, work in interactions]))
+
+
+class RecommendationsTestCase(unittest.TestCase):
+    def test_python_neighbours(self):
+        neighbours = dict(recommendations.iter_neighbours_python(
+            *arrays(INTERACTIONS), neighbours=2, min_common=2))
+        self.assertEqual([work for work, _ in neighbours[1]], [2, 3])
+        self.assertAlmostEqual(neighbours[1][0][1], 1.0)
+        self.assertEqual([work for work, _ in neighbours[2]], [1, 3])
+        self.assertAlmostEqual(neighbours[2][1][1], 2 / 3.0)
+        self.assertEqual(neighbours[4], [])
+
+    def test_duplicates_count_once(self):
+        neighbours = dict(recommendations.iter_neighbours_python(
+            *arrays(INTERACTIONS + ((1, 1),)), neighbours=2, min_common=2))
+        self.assertAlmostEqual(neighbours[1][0][1], 1.0)
+
+    @unittest.skipIf(recommendations.numpy is None,
+                     "NumPy and SciPy are not installed")
+    def test_numpy_matches_python(self):
+        expected = list(recommendations.iter_neighbours_python(
+            *arrays(INTERACTIONS), neighbours=2, min_common=1))
+        # Small blocks exercise block boundaries
+        actual = list(recommendations.iter_neighbours_numpy(
+            *arrays(INTERACTIONS), neighbours=2, min_common=1, block_size=3))
+        self.assertEqual([work for work, _ in actual],
+                         [work for work, _ in expected])
+        for (_, actual_items), (_, expected_items) in zip(actual, expected):
+            self.assertEqual([work for work, _ in actual_items],
+                             [work for work, _ in expected_items])
+            for (_, actual_score), (_, expected_score) in zip(
+                    actual_items, expected_items):
+                self.assertAlmostEqual(actual_score, expected_score, places=5)
+
+
+class LiteraryWorkNeighbourModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.users = [AuthUser(email='user{0}@example.com'.format(idx),
+                               username='user{0}'.format(idx),
+                               password='secret') for idx in range(4)]
+        db.session.add_all(self.users)
+        self.works = []
+        for idx in range(4):
+            lw = LiteraryWork("en")
+            lw.details.append(LiteraryWorkDetail("en", "Title " + str(idx)))
+            db.session.add(lw)
+            self.works.append(lw)
+        db.session.commit()
+        for user, work in INTERACTIONS:
+            db.session.add(AuthUserPersonalLibrary(
+                user_id=self.users[user - 1].id,
+                literary_work_id=self.works[work - 1].id, read_flag=True))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_rebuild(self):
+        # Stale neighbours of a work nobody reads are removed
+        LiteraryWorkNeighbour.replace(db.session, [(999, [(1, 0.5)])])
+        db.session.commit()
+        list(recommendations.rebuild(neighbours=2, min_common=2))
+        first, second, third, fourth = [work.id for work in self.works]
+        self.assertEqual(
+            [work_id for work_id, _ in LiteraryWorkNeighbour.similar(second,
+                                                                     10)],
+            [first, third])
+        self.assertEqual(LiteraryWorkNeighbour.similar(fourth, 10), [])
+        self.assertEqual(LiteraryWorkNeighbour.similar(999, 10), [])
+
+    def test_suggestions(self):
+        list(recommendations.rebuild(neighbours=2, min_common=2))
+        first, second, third = [work.id for work in self.works[:3]]
+        # The 4th user has read only the 3rd work, equally similar to the
+        # 1st and the 2nd ones
+        self.assertEqual(
+            [work_id for work_id, _ in LiteraryWorkNeighbour.suggestions(
+                self.users[3].id, 10, 10)],
+            [first, second])
+        # The 1st user has read the others neighbours of the 1st and the
+        # 2nd works
+        self.assertEqual(
+            [work_id for work_id, _ in LiteraryWorkNeighbour.suggestions(
+                self.users[0].id, 10, 10)],
+            [third])
@@ -0,0 +1,104 @@
+import unittest
+from elibrarian_app import create_app, db
+from elibrarian_app.models import Author, AuthorDetail, \
+    Authors2LiteraryWorks, LiteraryWork, LiteraryWorkDetail
+from elibrarian_app.snapshot import CatalogueSnapshot
+
+
+class CatalogueSnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing_virtualenv')
+        self.app_context = self.app.test_request_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_work(self, title, author=None):
+        lw = LiteraryWork("en")
+        db.session.add(lw)
+        lw.details.append(LiteraryWorkDetail("en", title))
+        db.session.commit()
+        if author is not None:
+            db.session.add(Authors2LiteraryWorks(author_id=author.id,
+                                                 literary_work_id=lw.id))
+            db.session.commit()
+        return lw
+
+    def test_representations(self):
+        author = Author()
+        db.session.add(author)
+        author_details = AuthorDetail("en", "London")
+        author_details.first_name = "Jack"
+        author.details.append(author_details)
+        author.details.append(AuthorDetail("ru", "Лондон"))
+        db.session.commit()
+        works = [self.add_work("Title " + str(i), author) for i in range(3)]
+
+        snapshot = CatalogueSnapshot()
+        snapshot.load()
+        work_ids = [lw.id for lw in works]
+        for lang in ("en", "ru", None):
+            self.assertEqual(snapshot.works_json(work_ids, lang=lang),
+                             LiteraryWork.to_json_bulk(works, lang=lang))
+            self.assertEqual(snapshot.authors_json([author.id], lang=lang),
+                             Author.to_json_bulk([author], lang=lang))
+        self.assertEqual(
+            snapshot.works_json(work_ids, fields=('title',), embed=()),
+            LiteraryWork.to_json_bulk(works, fields=('title',), embed=()))
+        self.assertEqual(
+            snapshot.authors_json([author.id], verbose=True,
+                                  fields=('full_name',)),
+            Author.to_json_bulk([author], verbose=True,
+                                fields=('full_name',)))
+
+        pagination = snapshot.paginate('work', 2, 2)
+        self.assertEqual(pagination.items, work_ids[2:])
+        self.assertEqual(pagination.total, 3)
+        self.assertTrue(pagination.has_prev)
+        self.assertFalse(pagination.has_next)
+        self.assertTrue(snapshot.memory_footprint() > 0)
+
+    def test_can_serve(self):
+        snapshot = CatalogueSnapshot()
+        self.assertTrue(snapshot.can_serve('work', None, None))
+        self.assertFalse(snapshot.can_serve('work', None, None, verbose=True))
+        self.assertTrue(snapshot.can_serve('work', ('title',), None,
+                                           verbose=True))
+        self.assertFalse(snapshot.can_serve('work', ('annotation',), None))
+        self.assertFalse(snapshot.can_serve('author', ('last_name',), None))
+        self.assertTrue(snapshot.can_serve('author', ('full_name',),
+                                           ('literary_works',), verbose=True))
+
+    def test_incremental_refresh(self):
+        author = Author()
+        db.session.add(author)
+        author.details.append(AuthorDetail("en", "London"))
+        db.session.commit()
+        lw = self.add_work("Burning Daylight", author)
+        snapshot = CatalogueSnapshot()
+        snapshot.load()
+        cursor = snapshot.cursor
+
+        # author name changes are visible in works representations
+        author.details[0].first_name = "Jack"
+        new_lw = self.add_work("White Fang")
+        self.assertTrue(snapshot.refresh() > 0)
+        self.assertTrue(snapshot.cursor > cursor)
+        self.assertEqual(snapshot.works_json([lw.id])[0]['authors'][0]['name'],
+                         "Jack London")
+        self.assertEqual(list(snapshot.work_ids), [lw.id, new_lw.id])
+
+        # deleted works are forgotten
+        new_lw_id = new_lw.id
+        for detail in new_lw.details:
+            db.session.delete(detail)
+        db.session.delete(new_lw)
+        db.session.commit()
+        snapshot.refresh()
+        self.assertEqual(list(snapshot.work_ids), [lw.id])
+        self.assertEqual(snapshot.works_json([new_lw_id]), [])
+        self.assertEqual(snapshot.refresh(), 0)